@@ -35,22 +35,25 @@ ContentType = "application/json; charset=utf-8"
 # 请求的凭证，从IAM或者STS服务中获取
 AK = "yourak"
 SK = "yoursk"
+
+# 复用同一个 Session，保持长连接（keep-alive），避免每次请求都重新建立 TCP+TLS 连接
+session = requests.Session()
+# (连接超时, 读取超时)，单位秒
+Timeout = (3.05, 30)
 # 当使用临时凭证时，需要使用到SessionToken传入Header，并计算进SignedHeader中，请自行在header参数中添加X-Security-Token头
 # SessionToken = ""
 
 
 def norm_query(params):
-    query = ""
+    pairs = []
     for key in sorted(params.keys()):
         if type(params[key]) == list:
             for k in params[key]:
-                query = (
-                        query + quote(key, safe="-_.~") + "=" + quote(k, safe="-_.~") + "&"
-                )
+                pairs.append(quote(key, safe="-_.~") + "=" + quote(k, safe="-_.~"))
         else:
-            query = (query + quote(key, safe="-_.~") + "=" + quote(params[key], safe="-_.~") + "&")
-    query = query[:-1]
-    return query.replace("+", "%20")
+            pairs.append(quote(key, safe="-_.~") + "=" + quote(params[key], safe="-_.~"))
+    # 一次 join，避免逐次拼接字符串；quote 不会产生 "+"，无需再替换
+    return "&".join(pairs)
 
 
 # 第一步：准备辅助函数。
@@ -146,12 +149,13 @@ def request(method, date, query, header, ak, sk, action, body):
     header = {**header, **sign_result}
     # header = {**header, **{"X-Security-Token": SessionToken}}
     # 第六步：将 Signature 签名写入 HTTP Header 中，并发送 HTTP 请求。
-    r = requests.request(method=method,
-                         url="https://{}{}".format(request_param["host"], request_param["path"]),
-                         headers=header,
-                         params=request_param["query"],
-                         data=request_param["body"],
-                         )
+    r = session.request(method=method,
+                        url="https://{}{}".format(request_param["host"], request_param["path"]),
+                        headers=header,
+                        params=request_param["query"],
+                        data=request_param["body"],
+                        timeout=Timeout,
+                        )
     return r.json()
 
 
@@ -0,0 +1,111 @@
+"""
+Asyncio signed client for BytePlus / Volcengine OpenAPI actions
+Same signing as request() in sign.py, sent over one pooled aiohttp session so
+hundreds of CVSubmitTask / CVGetResult / ListApps calls can run from one event loop.
+"""
+
+import asyncio
+import datetime
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+from yarl import URL
+
+from credentials import Credential, CredentialProvider, StaticCredentialProvider
+from diagnostics import Diagnostics, SigningRecord
+from signer import Signer, hash_body
+
+
+class AsyncSignedClient:
+    """Signs and sends OpenAPI actions concurrently under a semaphore-based limit"""
+
+    def __init__(self, signer: Signer, version: str, ak: Optional[str] = None, sk: Optional[str] = None,
+                 concurrency: int = 100, pool_size: int = 100,
+                 connect_timeout: float = 3.05, read_timeout: float = 30, scheme: str = "https",
+                 diagnostics: Optional[Diagnostics] = None,
+                 credentials: Optional[CredentialProvider] = None):
+        self.signer = signer
+        self.version = version
+        # Either a fixed ak/sk or a provider of (possibly rotating STS) credentials
+        self.credentials = credentials if credentials is not None else StaticCredentialProvider(ak, sk)
+        self.credentials.subscribe(self._on_rotate)
+        self.scheme = scheme
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.diagnostics = diagnostics
+        self._concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._static = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session and semaphore bind to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._session
+
+    def _on_rotate(self, old: Credential, new: Credential):
+        # Keys derived from the previous secret are never needed again
+        self.signer.key_cache.invalidate(old.secret_access_key)
+
+    def _static_query(self, action):
+        static = self._static.get(action)
+        if static is None:
+            static = self._static[action] = self.signer.encoder.freeze(
+                {"Action": action, "Version": self.version})
+        return static
+
+    async def request(self, method, action, query=None, body=None, header=None, date=None) -> Dict:
+        """Sign and send one action, returning the decoded JSON body
+
+        body may be str, bytes, a file object or an iterator of chunks.
+        """
+        session = self._get_session()
+        record = None
+        if self.diagnostics is not None:
+            record = SigningRecord(action, method, self.signer.host)
+            started = time.perf_counter()
+        query = query or {}
+        date = date or datetime.datetime.utcnow()
+        static = self._static_query(action)
+        # The canonical query is also a valid URL query, so it is sent as-is
+        canonical_query = self.signer.encoder.encode(query, static)
+        content_sha256, payload, size = hash_body(body)
+        if record is not None:
+            record.hash_ms = (time.perf_counter() - started) * 1000
+        credential = self.credentials.get()
+        sign_result = self.signer.sign(method, date, query, credential.access_key_id,
+                                       credential.secret_access_key, None,
+                                       canonical_query=canonical_query, content_sha256=content_sha256,
+                                       record=record, session_token=credential.session_token)
+        url = URL("{}://{}/?{}".format(self.scheme, self.signer.host, canonical_query), encoded=True)
+        async with self._semaphore:
+            headers = {**(header or {}), **sign_result, "Content-Length": str(size)}
+            if record is not None:
+                sent = time.perf_counter()
+            async with session.request(method, url, headers=headers, data=payload) as resp:
+                result = await resp.json(content_type=None)
+            if record is not None:
+                record.network_ms = (time.perf_counter() - sent) * 1000
+                record.status = resp.status
+                self.diagnostics.emit(record)
+            return result
+
+    async def gather(self, calls: Iterable[Tuple], return_exceptions: bool = False) -> List:
+        """Fan out (method, action, query, body) tuples, at most `concurrency` in flight"""
+        return await asyncio.gather(*(self.request(*call) for call in calls),
+                                    return_exceptions=return_exceptions)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Batch action executor for signed OpenAPI calls
+Runs a DAG of actions (e.g. CreatePermissionGroup -> UpdatePermissionRule -> CreateMountPoint),
+feeds outputs such as PermissionGroupId into later steps, runs independent branches concurrently
+and retries throttled (429 / 5xx) calls with jittered exponential backoff.
+Usage: python batch.py --file-system enas-xxxx --file-system enas-yyyy [--dry-run]
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_CODES = {"FlowLimitExceeded", "Throttling", "TooManyRequests", "ServiceUnavailable", "InternalError"}
+
+
+class Ref:
+    """Placeholder for a value extracted from an earlier step's result, e.g. Ref("group", "Result.PermissionGroupId")"""
+
+    def __init__(self, step: str, path: str):
+        self.step = step
+        self.path = path
+
+    def resolve(self, results: Dict[str, Any]):
+        value = results[self.step]
+        for part in self.path.split("."):
+            value = value[int(part)] if isinstance(value, list) else value.get(part)
+            if value is None:
+                raise KeyError(f"{self.step}.{self.path} not found in result")
+        return value
+
+    def __repr__(self):
+        return f"Ref({self.step}.{self.path})"
+
+
+class Step:
+    """One action in the batch; dependencies are taken from Refs in body/query plus depends_on"""
+
+    def __init__(self, name: str, action: str, body: Optional[Dict] = None, query: Optional[Dict] = None,
+                 method: str = "POST", depends_on: Iterable[str] = ()):
+        self.name = name
+        self.action = action
+        self.body = body
+        self.query = query or {}
+        self.method = method
+        self.depends_on = set(depends_on) | set(_find_refs(body)) | set(_find_refs(self.query))
+
+
+def _find_refs(value) -> List[str]:
+    if isinstance(value, Ref):
+        return [value.step]
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _find_refs(v)]
+    if isinstance(value, (list, tuple)):
+        return [s for v in value for s in _find_refs(v)]
+    return []
+
+
+def _resolve(value, results):
+    if isinstance(value, Ref):
+        return value.resolve(results)
+    if isinstance(value, dict):
+        return {k: _resolve(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, results) for v in value]
+    return value
+
+
+class BatchError(Exception):
+    pass
+
+
+class BatchResult:
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.skipped: List[str] = []
+        self.attempts: Dict[str, int] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and not self.skipped
+
+
+class BatchExecutor:
+    """Executes Steps over a SignedClient-like object exposing request(method, action, query, body)"""
+
+    def __init__(self, client, max_parallel: int = 4, max_retries: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 10.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.client = client
+        self.max_parallel = max_parallel
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def plan(steps: List[Step]) -> List[List[str]]:
+        """Group steps into waves; every step only depends on steps in earlier waves"""
+        by_name = {s.name: s for s in steps}
+        if len(by_name) != len(steps):
+            raise BatchError("duplicate step names")
+        for step in steps:
+            missing = step.depends_on - by_name.keys()
+            if missing:
+                raise BatchError(f"{step.name} depends on unknown steps {sorted(missing)}")
+        waves, done = [], set()
+        remaining = dict(by_name)
+        while remaining:
+            wave = sorted(name for name, s in remaining.items() if s.depends_on <= done)
+            if not wave:
+                raise BatchError(f"dependency cycle among {sorted(remaining)}")
+            waves.append(wave)
+            done.update(wave)
+            for name in wave:
+                del remaining[name]
+        return waves
+
+    def dry_run(self, steps: List[Step], out: Callable[[str], None] = print) -> List[List[str]]:
+        """Print the planned schedule without sending anything"""
+        by_name = {s.name: s for s in steps}
+        waves = self.plan(steps)
+        out(f"Planned schedule: {len(steps)} steps in {len(waves)} waves (max {self.max_parallel} in parallel)")
+        for i, wave in enumerate(waves, 1):
+            out(f"  wave {i}:")
+            for name in wave:
+                step = by_name[name]
+                deps = ", ".join(sorted(step.depends_on)) or "-"
+                out(f"    {name}: {step.method} {step.action} (after: {deps})")
+        return waves
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        with self._lock:
+            return self._random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _send(self, step: Step, results: Dict[str, Any], result: BatchResult):
+        body = _resolve(step.body, results)
+        query = {k: str(v) for k, v in _resolve(step.query, results).items()}
+        data = json.dumps(body, separators=(',', ':')) if body is not None else None
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                result.attempts[step.name] = attempt + 1
+            response = self.client.request(step.method, step.action, query, data)
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = {}
+            error = (payload.get("ResponseMetadata") or {}).get("Error") or {}
+            retryable = response.status_code in RETRYABLE_STATUS or error.get("Code") in RETRYABLE_CODES
+            if not retryable:
+                if response.status_code >= 400 or error:
+                    raise BatchError(f"{step.action} failed: HTTP {response.status_code} {error.get('Code', '')}")
+                return payload
+            if attempt < self.max_retries:
+                delay = self.backoff(attempt)
+                logger.info("%s throttled (HTTP %s %s), retrying in %.2fs", step.name,
+                            response.status_code, error.get("Code", ""), delay)
+                self.sleep(delay)
+        raise BatchError(f"{step.action} still throttled after {self.max_retries + 1} attempts")
+
+    def run(self, steps: List[Step]) -> BatchResult:
+        """Run all steps; a failed step causes its dependents to be skipped"""
+        self.plan(steps)
+        pending = {s.name: s for s in steps}
+        result = BatchResult()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    if step.depends_on & (result.errors.keys() | set(result.skipped)):
+                        result.skipped.append(name)
+                        del pending[name]
+                    elif step.depends_on <= result.results.keys() and len(running) < self.max_parallel:
+                        running[pool.submit(self._send, step, dict(result.results), result)] = name
+                        del pending[name]
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result.results[name] = future.result()
+                    except Exception as e:
+                        result.errors[name] = str(e)
+                        logger.error("step %s failed: %s", name, e)
+        return result
+
+
+def nfs_mount_steps(file_system_id: str, vpc_id: str, subnet_id: str, cidr: str = "0.0.0.0/0") -> List[Step]:
+    """The 3. nfs-mount-and-permission.py flow for one file system"""
+    prefix = file_system_id
+    return [
+        Step(f"{prefix}/group", "CreatePermissionGroup", {
+            "PermissionGroupName": f"{file_system_id}-group",
+            "FileSystemType": "Extreme",
+            "Description": "Just-for-tests",
+        }),
+        Step(f"{prefix}/rule", "UpdatePermissionRule", {
+            "FileSystemType": "Extreme",
+            "PermissionGroupId": Ref(f"{prefix}/group", "Result.PermissionGroupId"),
+            "PermissionRules": [{"CidrIp": cidr, "RwMode": "RW", "UserMode": "No_root_squash"}],
+        }),
+        Step(f"{prefix}/mount", "CreateMountPoint", {
+            "FileSystemId": file_system_id,
+            "VpcId": vpc_id,
+            "SubnetId": subnet_id,
+            "PermissionGroupId": Ref(f"{prefix}/group", "Result.PermissionGroupId"),
+            "MountPointName": f"{file_system_id}-mount",
+        }, depends_on=[f"{prefix}/rule"]),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the NAS permission/mount flow for many file systems")
+    parser.add_argument("--file-system", action="append", required=True, help="FileSystemId, repeatable")
+    parser.add_argument("--vpc-id", default="vpc-xxxx")
+    parser.add_argument("--subnet-id", default="subnet-xxxx")
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--ak", default="yourak")
+    parser.add_argument("--sk", default="yoursk")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    steps = [s for fs in args.file_system for s in nfs_mount_steps(fs, args.vpc_id, args.subnet_id)]
+
+    from client import SignedClient
+    from signer import Signer
+
+    client = SignedClient(Signer("filenas", "ap-southeast-1", "open.ap-southeast-1.byteplusapi.com",
+                                 "application/json; charset=utf-8"), "2022-01-01", args.ak, args.sk)
+    executor = BatchExecutor(client, max_parallel=args.parallel)
+    if args.dry_run:
+        executor.dry_run(steps)
+    else:
+        outcome = executor.run(steps)
+        print(json.dumps({"results": outcome.results, "errors": outcome.errors, "skipped": outcome.skipped},
+                         indent=2))
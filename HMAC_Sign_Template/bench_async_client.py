@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sequential pooled SignedClient vs AsyncSignedClient fan-out against the local mock server
+Usage: python bench_async_client.py [calls] [concurrency]
+"""
+
+import asyncio
+import json
+import sys
+import time
+
+from async_client import AsyncSignedClient
+from client import SignedClient
+from mock_openapi_server import MockOpenAPIServer
+from signer import Signer
+
+AK, SK = "AKBENCH", "SKBENCH"
+
+
+def run_sync(address, calls):
+    client = SignedClient(Signer("cv", "cn-north-1", address, "application/json"), "2022-08-31", AK, SK,
+                          scheme="http")
+    body = json.dumps({"req_key": "jimeng_realman_avatar_picture_omni_v15", "task_id": "bench"})
+    start = time.perf_counter()
+    for _ in range(calls):
+        client.call("POST", "CVGetResult", body=body)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+async def run_async(address, calls, concurrency):
+    signer = Signer("cv", "cn-north-1", address, "application/json")
+    body = json.dumps({"req_key": "jimeng_realman_avatar_picture_omni_v15", "task_id": "bench"})
+    async with AsyncSignedClient(signer, "2022-08-31", AK, SK, concurrency=concurrency,
+                                 pool_size=concurrency, scheme="http") as client:
+        start = time.perf_counter()
+        await client.gather([("POST", "CVGetResult", {}, body)] * calls)
+        return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    server = MockOpenAPIServer({AK: SK}).start_in_thread()
+    try:
+        sync_elapsed = run_sync(server.address, calls)
+        async_elapsed = asyncio.run(run_async(server.address, calls, concurrency))
+    finally:
+        server.stop_thread()
+
+    print(f"sync pooled client: {calls / sync_elapsed:,.0f} req/s")
+    print(f"async fan-out (concurrency={concurrency}): {calls / async_elapsed:,.0f} req/s")
+    print(f"signature failures: {server.signature_failures}")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Benchmark: canonical query encoding for 1k-parameter queries
+Usage: python bench_canonical.py [iterations]
+"""
+
+import sys
+import time
+
+from canonical import CanonicalQueryEncoder
+from test_canonical import legacy_norm_query
+
+
+def run(iterations):
+    # Mostly repeated keys/values, plus a few that change per call
+    params = {"Param%04d" % i: "value-%d" % (i % 50) for i in range(1000)}
+    encoder = CanonicalQueryEncoder()
+    static = encoder.freeze({"Action": "ListApps", "Version": "2020-12-01"})
+    full = {"Action": "ListApps", "Version": "2020-12-01", **params}
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        before = legacy_norm_query(full)
+    legacy = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        after = encoder.encode(params, static)
+    encoded = (time.perf_counter() - start) / iterations
+
+    assert before == after, "encoder output differs from norm_query()"
+    print(f"legacy norm_query: {legacy * 1e6:,.0f} us/query")
+    print(f"encoder:           {encoded * 1e6:,.0f} us/query ({legacy / encoded:.2f}x)")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
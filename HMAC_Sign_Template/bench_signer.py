@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: signatures/sec with and without the signing-key cache
+Usage: python bench_signer.py [iterations]
+"""
+
+import datetime
+import sys
+import time
+
+from diagnostics import RingBufferDiagnostics
+from signer import Signer, derive_signing_key, hash_sha256, hmac_sha256, norm_query
+
+
+def sign_uncached(method, date, query, ak, sk, body, host, content_type, region, service):
+    """The original sign.py flow: derive the signing key on every call"""
+    x_date = date.strftime("%Y%m%dT%H%M%SZ")
+    short_x_date = x_date[:8]
+    x_content_sha256 = hash_sha256(body or "")
+    signed_headers_str = "content-type;host;x-content-sha256;x-date"
+    canonical_request_str = "\n".join([
+        method.upper(), "/", norm_query(query),
+        "\n".join([
+            "content-type:" + content_type,
+            "host:" + host,
+            "x-content-sha256:" + x_content_sha256,
+            "x-date:" + x_date,
+        ]),
+        "", signed_headers_str, x_content_sha256,
+    ])
+    hashed_canonical_request = hash_sha256(canonical_request_str)
+    credential_scope = "/".join([short_x_date, region, service, "request"])
+    string_to_sign = "\n".join(["HMAC-SHA256", x_date, credential_scope, hashed_canonical_request])
+    k_signing = derive_signing_key(sk, short_x_date, region, service)
+    signature = hmac_sha256(k_signing, string_to_sign).hex()
+    return "HMAC-SHA256 Credential={}, SignedHeaders={}, Signature={}".format(
+        ak + "/" + credential_scope, signed_headers_str, signature)
+
+
+def run(iterations):
+    now = datetime.datetime.utcnow()
+    query = {"Action": "ListApps", "Version": "2020-12-01", "Limit": "10"}
+    signer = Signer("rtc", "ap-singapore-1", "open.byteplusapi.com", "application/x-www-form-urlencoded")
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        before = sign_uncached("GET", now, query, "AK", "SK", "", signer.host, signer.content_type,
+                               signer.region, signer.service)
+    uncached = iterations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        after = signer.sign("GET", now, query, "AK", "SK", "")["Authorization"]
+    cached = iterations / (time.perf_counter() - start)
+
+    signer.diagnostics = RingBufferDiagnostics()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        signer.sign("GET", now, query, "AK", "SK", "")
+    traced = iterations / (time.perf_counter() - start)
+
+    assert before == after, "cached signer output differs from the original"
+    print(f"uncached: {uncached:,.0f} signatures/sec")
+    print(f"cached:   {cached:,.0f} signatures/sec ({cached / uncached:.2f}x)")
+    print(f"cached + ring-buffer diagnostics: {traced:,.0f} signatures/sec")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
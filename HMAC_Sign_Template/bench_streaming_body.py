@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: peak memory of signing and sending a large body as str vs streamed from a file
+Usage: python bench_streaming_body.py [size_mb]
+"""
+
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from client import SignedClient
+from signer import Signer
+
+AK, SK = "AKBENCH", "SKBENCH"
+
+
+def measure(label, send):
+    tracemalloc.start()
+    start = time.perf_counter()
+    send()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} peak {peak / 2 ** 20:8.1f} MiB  {elapsed:6.2f} s")
+
+
+def start_server():
+    """Run the mock server in its own process so only client memory is traced"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, os.path.join(here, "mock_openapi_server.py"),
+                             "--port", str(port), "--ak", AK, "--sk", SK])
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return proc, f"127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    server, address = start_server()
+    client = SignedClient(Signer("rtc", "ap-singapore-1", address, "application/json"),
+                          "2020-12-01", AK, SK, scheme="http")
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        block = b"0123456789abcdef" * 65536
+        for _ in range(size_mb):
+            f.write(block)
+        path = f.name
+    try:
+        def send_legacy():
+            # What sign.py used to do: whole body as str, hashed after encoding, encoded again to send
+            with open(path, "rb") as fh:
+                body = fh.read().decode("latin-1")
+            hashlib.sha256(body.encode("utf-8")).hexdigest()
+            client.call("POST", "CreateApp", body=body)
+
+        def send_streamed():
+            with open(path, "rb") as fh:
+                client.call("POST", "CreateApp", body=fh)
+
+        def send_iterator():
+            with open(path, "rb") as fh:
+                client.call("POST", "CreateApp", body=iter(lambda: fh.read(65536), b""))
+
+        print(f"body size: {size_mb} MiB")
+        measure("str body (legacy)", send_legacy)
+        measure("file object (streamed)", send_streamed)
+        measure("iterator (spooled)", send_iterator)
+    finally:
+        os.remove(path)
+        server.terminate()
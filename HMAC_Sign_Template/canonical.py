@@ -0,0 +1,58 @@
+"""
+Canonical query / header encoder for HMAC-SHA256 signing
+Percent-encoding of repeated keys and values is memoized and each query is built with a single join.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+
+@lru_cache(maxsize=4096)
+def quote_component(value: str) -> str:
+    """RFC 3986 percent-encoding used by the signer (quote never emits "+", so no replace is needed)"""
+    return quote(value, safe="-_.~")
+
+
+class FrozenQuery:
+    """Pre-encoded static query parameters (e.g. Action and Version) for one API action"""
+
+    def __init__(self, params: Dict):
+        self.params = dict(params)
+        self.pairs: List[Tuple[str, List[str]]] = [
+            (key, _encode_pairs(key, self.params[key])) for key in sorted(self.params)
+        ]
+
+
+def _encode_pairs(key, value) -> List[str]:
+    encoded_key = quote_component(key)
+    if isinstance(value, list):
+        return [encoded_key + "=" + quote_component(str(v)) for v in value]
+    return [encoded_key + "=" + quote_component(str(value))]
+
+
+class CanonicalQueryEncoder:
+    """Builds the canonical query string and canonical headers of a signed request"""
+
+    def freeze(self, params: Dict) -> FrozenQuery:
+        """Encode parameters that never change for an action, once"""
+        return FrozenQuery(params)
+
+    def encode(self, params: Dict, static: Optional[FrozenQuery] = None) -> str:
+        """Return the canonical query, identical to the original norm_query()
+
+        When static is given only params are encoded; a key in params overrides
+        the same key in static, like {"Action": ..., **query} does.
+        """
+        parts: List[Tuple[str, List[str]]] = [(key, _encode_pairs(key, params[key])) for key in params]
+        if static is not None:
+            parts.extend(p for p in static.pairs if p[0] not in params)
+        parts.sort(key=lambda p: p[0])
+        return "&".join([pair for _, pairs in parts for pair in pairs])
+
+    @staticmethod
+    def canonical_headers(headers: Dict[str, str]) -> Tuple[str, str]:
+        """Return (canonical header block, signed header list) for the given headers"""
+        lowered = sorted((k.lower(), v) for k, v in headers.items())
+        block = "\n".join([k + ":" + v for k, v in lowered])
+        return block, ";".join([k for k, _ in lowered])
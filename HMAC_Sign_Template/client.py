@@ -0,0 +1,155 @@
+"""
+Pooled, keep-alive HTTP client for signed BytePlus / Volcengine OpenAPI calls
+One requests.Session is shared across calls so TCP+TLS connections are reused per host.
+"""
+
+import datetime
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from credentials import Credential, CredentialProvider, StaticCredentialProvider
+from diagnostics import Diagnostics, SigningRecord
+from signer import Signer, hash_body
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT = (3.05, 30)
+
+
+class PooledSession:
+    """requests.Session with per-host connection pools, keep-alive and default timeouts"""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        # pool_connections: number of hosts kept in the pool manager,
+        # pool_maxsize: keep-alive connections per host
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._lock = threading.Lock()
+        self._requests_per_host: Dict[str, int] = {}
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method=method, url=url, **kwargs)
+        host = requests.utils.urlparse(url).netloc
+        with self._lock:
+            self._requests_per_host[host] = self._requests_per_host.get(host, 0) + 1
+        return response
+
+    def connection_stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-host requests, new connections opened and connections reused"""
+        opened: Dict[str, int] = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            opened[host] = opened.get(host, 0) + pool.num_connections
+
+        stats = {}
+        with self._lock:
+            for host, count in self._requests_per_host.items():
+                connections = opened.get(host, 0)
+                stats[host] = {
+                    "requests": count,
+                    "connections": connections,
+                    "reused": max(count - connections, 0),
+                }
+        return stats
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SignedClient:
+    """Signs and sends OpenAPI actions for one service over a PooledSession"""
+
+    def __init__(self, signer: Signer, version: str, ak: Optional[str] = None, sk: Optional[str] = None,
+                 session: Optional[PooledSession] = None, scheme: str = "https",
+                 diagnostics: Optional[Diagnostics] = None,
+                 credentials: Optional[CredentialProvider] = None):
+        self.signer = signer
+        self.version = version
+        # Either a fixed ak/sk or a provider of (possibly rotating STS) credentials
+        self.credentials = credentials if credentials is not None else StaticCredentialProvider(ak, sk)
+        self.credentials.subscribe(self._on_rotate)
+        self.session = session if session is not None else PooledSession()
+        self.scheme = scheme
+        # Per-client signing diagnostics; None keeps the hot path free of timing calls
+        self.diagnostics = diagnostics
+        self._static = {}
+
+    def _on_rotate(self, old: Credential, new: Credential):
+        # Keys derived from the previous secret are never needed again
+        self.signer.key_cache.invalidate(old.secret_access_key)
+
+    def _static_query(self, action):
+        static = self._static.get(action)
+        if static is None:
+            static = self._static[action] = self.signer.encoder.freeze(
+                {"Action": action, "Version": self.version})
+        return static
+
+    def request(self, method, action, query=None, body=None, header=None,
+                date=None, timeout=None) -> requests.Response:
+        """Sign and send one action, returning the raw response
+
+        body may be str, bytes, a file object or an iterator of chunks; it is
+        hashed incrementally and streamed without being materialized.
+        """
+        record = None
+        if self.diagnostics is not None:
+            record = SigningRecord(action, method, self.signer.host)
+            started = time.perf_counter()
+        query = query or {}
+        date = date or datetime.datetime.utcnow()
+        static = self._static_query(action)
+        content_sha256, payload, size = hash_body(body)
+        if record is not None:
+            record.hash_ms = (time.perf_counter() - started) * 1000
+        credential = self.credentials.get()
+        sign_result = self.signer.sign(method, date, query, credential.access_key_id,
+                                       credential.secret_access_key, None, static=static,
+                                       content_sha256=content_sha256, record=record,
+                                       session_token=credential.session_token)
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if record is not None:
+            sent = time.perf_counter()
+        response = self.session.request(
+            method,
+            "{}://{}/".format(self.scheme, self.signer.host),
+            headers={**(header or {}), **sign_result, "Content-Length": str(size)},
+            params={**static.params, **query},
+            data=payload,
+            **kwargs,
+        )
+        if record is not None:
+            record.network_ms = (time.perf_counter() - sent) * 1000
+            record.status = response.status_code
+            self.diagnostics.emit(record)
+        return response
+
+    def call(self, method, action, query=None, body=None, header=None, date=None):
+        """Sign and send one action, returning the decoded JSON body"""
+        return self.request(method, action, query, body, header, date).json()
+
+    def connection_stats(self):
+        return self.session.connection_stats()
+
+    def close(self):
+        self.session.close()
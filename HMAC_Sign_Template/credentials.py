@@ -0,0 +1,245 @@
+"""
+Credential providers for the signed OpenAPI clients
+Static, environment, file-watch and refreshing (STS AssumeRole) sources behind one get() call.
+Temporary credentials are refreshed in the background before they expire; subscribers (e.g. the
+clients' signing-key caches) are told whenever the credential changes.
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Environment variable names used by the Volcengine SDKs
+ENV_ACCESS_KEY = "VOLC_ACCESSKEY"
+ENV_SECRET_KEY = "VOLC_SECRETKEY"
+ENV_SESSION_TOKEN = "VOLC_SESSION_TOKEN"
+
+
+class CredentialError(Exception):
+    pass
+
+
+class Credential:
+    """One immutable AK/SK pair with an optional STS session token and expiry (epoch seconds)"""
+
+    __slots__ = ("access_key_id", "secret_access_key", "session_token", "expiration")
+
+    def __init__(self, access_key_id: str, secret_access_key: str, session_token: Optional[str] = None,
+                 expiration: Optional[float] = None):
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.session_token = session_token or None
+        self.expiration = expiration
+
+    def expired(self, now: Optional[float] = None, margin: float = 0.0) -> bool:
+        if self.expiration is None:
+            return False
+        return (now if now is not None else time.time()) + margin >= self.expiration
+
+    def __eq__(self, other):
+        return isinstance(other, Credential) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash((self.access_key_id, self.secret_access_key, self.session_token))
+
+    def __repr__(self):
+        # Never print the secret or the token
+        return f"Credential({self.access_key_id}, token={'yes' if self.session_token else 'no'})"
+
+
+def parse_credential(data: dict) -> Credential:
+    """Build a Credential from an STS AssumeRole response or its Result.Credentials block"""
+    data = (data.get("Result") or {}).get("Credentials", data)
+    try:
+        ak, sk = data["AccessKeyId"], data["SecretAccessKey"]
+    except KeyError as e:
+        raise CredentialError(f"credential is missing {e.args[0]}")
+    expiration = data.get("ExpiredTime")
+    if isinstance(expiration, str):
+        expiration = datetime.datetime.fromisoformat(expiration.replace("Z", "+00:00")).timestamp()
+    return Credential(ak, sk, data.get("SessionToken"), expiration)
+
+
+class CredentialProvider:
+    """Base provider: get() returns the current Credential, subscribe() registers change callbacks"""
+
+    def __init__(self):
+        self._current: Optional[Credential] = None
+        self._listeners: List[Callable[[Optional[Credential], Credential], None]] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> Credential:
+        raise NotImplementedError
+
+    def subscribe(self, callback: Callable[[Optional[Credential], Credential], None]):
+        """Call callback(old, new) whenever the credential changes"""
+        self._listeners.append(callback)
+
+    def _set(self, credential: Credential) -> Credential:
+        """Swap in a new credential and notify subscribers if it changed"""
+        with self._lock:
+            old, self._current = self._current, credential
+        if old is not None and old != credential:
+            logger.info("credential rotated: %r -> %r", old, credential)
+            for callback in list(self._listeners):
+                callback(old, credential)
+        return credential
+
+    def close(self):
+        pass
+
+
+class StaticCredentialProvider(CredentialProvider):
+    """Fixed AK/SK (and optional session token), e.g. the AK / SK globals in sign.py"""
+
+    def __init__(self, access_key_id: str, secret_access_key: str, session_token: Optional[str] = None):
+        super().__init__()
+        self._current = Credential(access_key_id, secret_access_key, session_token)
+
+    def get(self) -> Credential:
+        return self._current
+
+
+class EnvironmentCredentialProvider(CredentialProvider):
+    """Reads VOLC_ACCESSKEY / VOLC_SECRETKEY / VOLC_SESSION_TOKEN on every call"""
+
+    def __init__(self, access_key_var: str = ENV_ACCESS_KEY, secret_key_var: str = ENV_SECRET_KEY,
+                 session_token_var: str = ENV_SESSION_TOKEN):
+        super().__init__()
+        self.names = (access_key_var, secret_key_var, session_token_var)
+
+    def get(self) -> Credential:
+        ak, sk, token = (os.environ.get(name) for name in self.names)
+        if not ak or not sk:
+            raise CredentialError(f"{self.names[0]} / {self.names[1]} are not set")
+        current = self._current
+        if current is not None and (ak, sk, token or None) == (
+                current.access_key_id, current.secret_access_key, current.session_token):
+            return current
+        return self._set(Credential(ak, sk, token))
+
+
+class FileCredentialProvider(CredentialProvider):
+    """Reloads a JSON credential file (e.g. written by a sidecar) when its mtime changes
+
+    The file holds AccessKeyId / SecretAccessKey / SessionToken / ExpiredTime, either
+    flat or as a full AssumeRole response. mtime is checked at most every check_interval seconds.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self._mtime = None
+        self._checked_at = None
+
+    def get(self) -> Credential:
+        now = self.clock()
+        if self._current is not None and now - self._checked_at < self.check_interval:
+            return self._current
+        self._checked_at = now
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime or self._current is None:
+            with open(self.path, encoding="utf-8") as f:
+                credential = parse_credential(json.load(f))
+            self._mtime = mtime
+            self._set(credential)
+        return self._current
+
+
+class RefreshingCredentialProvider(CredentialProvider):
+    """Temporary credentials from fetch(), refreshed by a background thread before they expire
+
+    get() never waits for a refresh while the current credential is still valid; it only
+    fetches inline on first use or if the credential has already expired.
+    """
+
+    def __init__(self, fetch: Callable[[], Credential], refresh_margin: float = 300.0,
+                 retry_delay: float = 5.0, max_retry_delay: float = 60.0,
+                 clock: Callable[[], float] = time.time):
+        super().__init__()
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.clock = clock
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self) -> Credential:
+        current = self._current
+        if current is None or current.expired(self.clock()):
+            current = self.refresh(if_expired=True)
+        if self._thread is None:
+            self._start()
+        return current
+
+    def refresh(self, if_expired: bool = False) -> Credential:
+        """Fetch a new credential now (one fetch at a time)"""
+        with self._refresh_lock:
+            current = self._current
+            if if_expired and current is not None and not current.expired(self.clock()):
+                return current
+            return self._set(self.fetch())
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="credential-refresh", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            current = self._current
+            if current is None or current.expiration is None:
+                return
+            if failures:
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (failures - 1))
+            else:
+                delay = current.expiration - self.refresh_margin - self.clock()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            try:
+                fresh = self.refresh()
+            except Exception as e:
+                failures += 1
+                logger.warning("credential refresh failed (attempt %d): %s", failures, e)
+                continue
+            # A source that keeps handing out a credential inside the margin is polled with backoff
+            failures = failures + 1 if fresh.expired(self.clock(), self.refresh_margin) else 0
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def sts_assume_role(client, role_trn: str, session_name: str, duration_seconds: int = 3600,
+                    policy: Optional[str] = None) -> Callable[[], Credential]:
+    """fetch() for RefreshingCredentialProvider that calls STS AssumeRole through a SignedClient
+
+    e.g. SignedClient(Signer("sts", "cn-north-1", "sts.volcengineapi.com",
+                             "application/x-www-form-urlencoded"), "2018-01-01", AK, SK)
+    """
+    query = {"RoleTrn": role_trn, "RoleSessionName": session_name, "DurationSeconds": str(duration_seconds)}
+    if policy:
+        query["Policy"] = policy
+
+    def fetch() -> Credential:
+        response = client.call("GET", "AssumeRole", query)
+        error = (response.get("ResponseMetadata") or {}).get("Error")
+        if error:
+            raise CredentialError(f"AssumeRole failed: {error.get('Code')} {error.get('Message', '')}")
+        return parse_credential(response)
+
+    return fetch
@@ -0,0 +1,88 @@
+"""
+Pluggable signing diagnostics for Signer / SignedClient / AsyncSignedClient
+Disabled by default (diagnostics=None costs one attribute check per call). When enabled, each
+call emits a SigningRecord with the canonical request hash and hashing / HMAC / network timings.
+No secret material (SK, signing key, string-to-sign) is ever recorded.
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SigningRecord:
+    """Timings (milliseconds) and identifiers for one signed call"""
+
+    __slots__ = ("action", "method", "host", "canonical_request_hash",
+                 "hash_ms", "hmac_ms", "network_ms", "status")
+
+    def __init__(self, action: str = "", method: str = "", host: str = ""):
+        self.action = action
+        self.method = method
+        self.host = host
+        self.canonical_request_hash = ""
+        self.hash_ms = 0.0
+        self.hmac_ms = 0.0
+        self.network_ms = 0.0
+        self.status: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Diagnostics:
+    """Base hook: receives one SigningRecord per signed call"""
+
+    def emit(self, record: SigningRecord):
+        raise NotImplementedError
+
+
+class LoggingDiagnostics(Diagnostics):
+    """Writes records to a logger as structured `extra` fields"""
+
+    def __init__(self, log: Optional[logging.Logger] = None, level: int = logging.DEBUG):
+        self.log = log or logger
+        self.level = level
+
+    def emit(self, record: SigningRecord):
+        if self.log.isEnabledFor(self.level):
+            fields = record.to_dict()
+            self.log.log(self.level, "signed %(action)s status=%(status)s hash=%(hash_ms).3fms "
+                         "hmac=%(hmac_ms).3fms network=%(network_ms).3fms", fields,
+                         extra={"signing": fields})
+
+
+class RingBufferDiagnostics(Diagnostics):
+    """Keeps the last `capacity` records in memory for profiling"""
+
+    def __init__(self, capacity: int = 1024):
+        self.records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, record: SigningRecord):
+        with self._lock:
+            self.records.append(record)
+
+    def snapshot(self) -> List[SigningRecord]:
+        with self._lock:
+            return list(self.records)
+
+    def summary(self) -> Dict[str, float]:
+        """Mean hashing / HMAC / network time over the buffered records"""
+        records = self.snapshot()
+        if not records:
+            return {"count": 0, "hash_ms": 0.0, "hmac_ms": 0.0, "network_ms": 0.0}
+        n = len(records)
+        return {
+            "count": n,
+            "hash_ms": sum(r.hash_ms for r in records) / n,
+            "hmac_ms": sum(r.hmac_ms for r in records) / n,
+            "network_ms": sum(r.network_ms for r in records) / n,
+        }
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
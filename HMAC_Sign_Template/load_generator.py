@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Load generator for the local stand-in OpenAPI server
+Each process runs an AsyncSignedClient with `concurrency` workers that sign and send the same
+action in a loop, so the report covers signing plus client throughput.
+Usage: python load_generator.py --spawn-server 4 --processes 4 --concurrency 64 --duration 10
+       python load_generator.py --target 127.0.0.1:8080 --ak yourak --sk yoursk --action CVGetResult
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from async_client import AsyncSignedClient
+from signer import Signer
+
+
+async def _run_workers(options: Dict) -> Dict:
+    signer = Signer(options["service"], options["region"], options["target"], "application/json")
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+    deadline = time.perf_counter() + options["duration"]
+    body = options["body"]
+
+    async with AsyncSignedClient(signer, options["version"], options["ak"], options["sk"],
+                                 concurrency=options["concurrency"], pool_size=options["concurrency"],
+                                 scheme="http") as client:
+        async def worker():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    result = await client.request(options["method"], options["action"], {}, body)
+                    error = (result.get("ResponseMetadata") or {}).get("Error")
+                    outcome = error["Code"] if error else "OK"
+                except Exception as e:
+                    outcome = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        await asyncio.gather(*(worker() for _ in range(options["concurrency"])))
+    return {"latencies": latencies, "outcomes": outcomes}
+
+
+def _process_main(options: Dict) -> Dict:
+    return asyncio.run(_run_workers(options))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def run_load(options: Dict, processes: int) -> Dict:
+    """Run the load from `processes` processes and merge their results"""
+    started = time.perf_counter()
+    if processes == 1:
+        parts = [_process_main(options)]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            parts = pool.map(_process_main, [options] * processes)
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(l for part in parts for l in part["latencies"])
+    outcomes: Dict[str, int] = {}
+    for part in parts:
+        for key, count in part["outcomes"].items():
+            outcomes[key] = outcomes.get(key, 0) + count
+    return {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 2),
+        "req_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "outcomes": outcomes,
+    }
+
+
+def spawn_server(workers: int, ak: str, sk: str, extra_args: List[str]):
+    """Start mock_openapi_server.py on a free port and wait until it accepts connections"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, os.path.join(here, "mock_openapi_server.py"), "--port", str(port),
+                             "--ak", ak, "--sk", sk, "--workers", str(workers), *extra_args],
+                            stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return proc, f"127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Signed-request load generator")
+    parser.add_argument("--target", help="host:port of a running stand-in server")
+    parser.add_argument("--spawn-server", type=int, default=0, metavar="WORKERS",
+                        help="start a local stand-in server with this many worker processes")
+    parser.add_argument("--server-args", default="", help="extra mock_openapi_server.py arguments, e.g. '--latency-ms 5'")
+    parser.add_argument("--ak", default="AKLOAD")
+    parser.add_argument("--sk", default="SKLOAD")
+    parser.add_argument("--service", default="cv")
+    parser.add_argument("--region", default="cn-north-1")
+    parser.add_argument("--version", default="2022-08-31")
+    parser.add_argument("--action", default="CVGetResult")
+    parser.add_argument("--method", default="POST")
+    parser.add_argument("--body", default=json.dumps({"req_key": "jimeng_realman_avatar_picture_omni_v15",
+                                                      "task_id": "load-test"}))
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=64, help="in-flight requests per process")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    server = None
+    target = args.target
+    if args.spawn_server:
+        server, target = spawn_server(args.spawn_server, args.ak, args.sk, args.server_args.split())
+    if not target:
+        parser.error("either --target or --spawn-server is required")
+
+    options = {
+        "target": target, "ak": args.ak, "sk": args.sk, "service": args.service, "region": args.region,
+        "version": args.version, "action": args.action, "method": args.method, "body": args.body,
+        "concurrency": args.concurrency, "duration": args.duration,
+    }
+    try:
+        print(json.dumps(run_load(options, args.processes), indent=2))
+    finally:
+        if server is not None:
+            server.terminate()
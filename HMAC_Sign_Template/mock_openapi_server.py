@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Local stand-in OpenAPI server that verifies HMAC-SHA256 signatures
+Serves canned JSON per Action with configurable latency, error rate and per-AK throttling,
+so signed clients (sign.py, Omnihuman, VE_TTS, VKE NAS) can be tested and load-tested offline.
+Usage: python mock_openapi_server.py --port 8080 --ak yourak --sk yoursk
+       [--latency-ms 20 --jitter-ms 10 --error-rate 0.01 --throttle-rps 500 --responses canned.json --workers 4]
+"""
+
+import argparse
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from canonical import CanonicalQueryEncoder
+from signer import SigningKeyCache, derive_signing_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSES = {
+    "ListApps": {"AppList": [], "Total": 0},
+    "CreateApp": {"AppId": "mock-app-id"},
+    "CVSubmitTask": {"code": 10000, "data": {"task_id": "mock-task-id"}, "message": "Success"},
+    "CVGetResult": {"code": 10000, "data": {"status": "done", "video_url": "https://example.com/mock.mp4"},
+                    "message": "Success"},
+    "CreatePermissionGroup": {"PermissionGroupId": "pgroup-mock"},
+    "UpdatePermissionRule": {},
+    "CreateMountPoint": {"MountPointId": "mount-mock"},
+    "CreateFileSystem": {"FileSystemId": "enas-mock"},
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def parse_authorization(value: str) -> Optional[Dict[str, str]]:
+    """Split 'HMAC-SHA256 Credential=..., SignedHeaders=..., Signature=...' into its fields"""
+    if not value or not value.startswith("HMAC-SHA256 "):
+        return None
+    fields = {}
+    for part in value[len("HMAC-SHA256 "):].split(","):
+        key, _, val = part.strip().partition("=")
+        fields[key] = val
+    if not {"Credential", "SignedHeaders", "Signature"} <= fields.keys():
+        return None
+    return fields
+
+
+def verify_signature(method: str, target: str, headers: Dict[str, str], body: bytes,
+                     credentials: Dict[str, str], key_cache: Optional[SigningKeyCache] = None,
+                     max_skew: Optional[float] = None) -> Tuple[bool, str]:
+    """Re-derive the signature the way request() in sign.py builds it
+
+    headers must have lower-cased names. Requests whose X-Date is more than
+    max_skew seconds away from now are rejected. Returns (ok, reason).
+    """
+    auth = parse_authorization(headers.get("authorization", ""))
+    if auth is None:
+        return False, "MissingAuthorization"
+    scope = auth["Credential"].split("/")
+    if len(scope) != 5 or scope[4] != "request":
+        return False, "InvalidCredential"
+    ak, short_date, region, service, _ = scope
+    sk = credentials.get(ak)
+    if sk is None:
+        return False, "InvalidAccessKey"
+
+    x_date = headers.get("x-date", "")
+    if x_date[:8] != short_date:
+        return False, "InvalidDate"
+    if max_skew is not None:
+        try:
+            signed_at = datetime.datetime.strptime(x_date, "%Y%m%dT%H%M%SZ")
+        except ValueError:
+            return False, "InvalidDate"
+        if abs((datetime.datetime.utcnow() - signed_at).total_seconds()) > max_skew:
+            return False, "RequestExpired"
+    x_content_sha256 = hashlib.sha256(body).hexdigest()
+    if headers.get("x-content-sha256") != x_content_sha256:
+        return False, "ContentSha256Mismatch"
+
+    signed_names = auth["SignedHeaders"].split(";")
+    if any(name not in headers for name in signed_names):
+        return False, "MissingSignedHeader"
+    header_block, signed_headers_str = CanonicalQueryEncoder.canonical_headers(
+        {name: headers[name] for name in signed_names})
+
+    url = urlsplit(target)
+    params = {k: v if len(v) > 1 else v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+    canonical_request_str = "\n".join([
+        method.upper(),
+        url.path or "/",
+        CanonicalQueryEncoder().encode(params),
+        header_block,
+        "",
+        signed_headers_str,
+        x_content_sha256,
+    ])
+    hashed_canonical_request = hashlib.sha256(canonical_request_str.encode("utf-8")).hexdigest()
+    credential_scope = "/".join([short_date, region, service, "request"])
+    string_to_sign = "\n".join(["HMAC-SHA256", x_date, credential_scope, hashed_canonical_request])
+    if key_cache is not None:
+        signing_key = key_cache.get(sk, short_date, region, service)
+    else:
+        signing_key = derive_signing_key(sk, short_date, region, service)
+    expected = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, auth["Signature"]):
+        return False, "SignatureDoesNotMatch"
+    return True, ""
+
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class MockOpenAPIServer:
+    """Minimal HTTP/1.1 keep-alive server answering signed OpenAPI actions
+
+    latency / latency_jitter are in seconds, error_rate is the fraction of
+    verified requests answered with 500 InternalError, and throttle_rps
+    limits each AK with a token bucket (429 FlowLimitExceeded).
+    """
+
+    def __init__(self, credentials: Dict[str, str], responses: Optional[Dict[str, dict]] = None,
+                 host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, latency_jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rps: Optional[float] = None,
+                 max_skew: Optional[float] = 900, reuse_port: bool = False, seed: Optional[int] = None):
+        self.credentials = credentials
+        self.responses = dict(DEFAULT_RESPONSES if responses is None else responses)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rps = throttle_rps
+        self.max_skew = max_skew
+        self.reuse_port = reuse_port
+        self.requests = 0
+        self.signature_failures = 0
+        self.actions: Dict[str, int] = {}
+        self.statuses: Dict[int, int] = {}
+        self._key_cache = SigningKeyCache()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._random = random.Random(seed)
+        self._server = None
+        self._connections = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  reuse_port=self.reuse_port or None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Mock OpenAPI server listening on %s", self.address)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self):
+        """Run the server on its own event loop in a daemon thread (for sync clients)"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.handle(method, target, headers, body)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+                if hasattr(payload, "__aiter__"):
+                    # Server-sent events: stream each chunk as it is produced
+                    writer.write("HTTP/1.1 {} {}\r\nContent-Type: text/event-stream\r\n"
+                                 "Transfer-Encoding: chunked\r\n\r\n".format(
+                                     status, STATUS_TEXT.get(status, "")).encode("latin-1"))
+                    async for chunk in payload:
+                        writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                else:
+                    data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                    writer.write(
+                        "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(
+                            status, STATUS_TEXT.get(status, ""), len(data)).encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def handle(self, method, target, headers, body) -> Tuple[int, dict]:
+        """Verify the request and return (status, JSON payload)
+
+        Subclasses may return an async iterator of bytes instead of a dict to stream
+        a text/event-stream response.
+        """
+        self.requests += 1
+        query = parse_qs(urlsplit(target).query)
+        action = query.get("Action", [""])[0]
+        self.actions[action] = self.actions.get(action, 0) + 1
+        metadata = {"RequestId": uuid.uuid4().hex, "Action": action,
+                    "Version": query.get("Version", [""])[0]}
+
+        ok, reason = verify_signature(method, target, headers, body, self.credentials,
+                                      self._key_cache, self.max_skew)
+        if not ok:
+            self.signature_failures += 1
+            metadata["Error"] = {"Code": reason, "Message": "signature verification failed"}
+            return 401, {"ResponseMetadata": metadata}
+        if self.throttle_rps:
+            ak = headers["authorization"].split("Credential=", 1)[1].split("/", 1)[0]
+            bucket = self._buckets.get(ak)
+            if bucket is None:
+                bucket = self._buckets[ak] = TokenBucket(self.throttle_rps)
+            if not bucket.take():
+                metadata["Error"] = {"Code": "FlowLimitExceeded", "Message": "request was throttled"}
+                return 429, {"ResponseMetadata": metadata}
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.latency_jitter))
+        if self.error_rate and self._random.random() < self.error_rate:
+            metadata["Error"] = {"Code": "InternalError", "Message": "injected error"}
+            return 500, {"ResponseMetadata": metadata}
+        if action not in self.responses:
+            metadata["Error"] = {"Code": "InvalidActionOrVersion", "Message": f"unknown action {action}"}
+            return 404, {"ResponseMetadata": metadata}
+        return 200, {"ResponseMetadata": metadata, "Result": self.responses[action]}
+
+
+def _serve(options: Dict):
+    server = MockOpenAPIServer(**options)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAPI server with HMAC-SHA256 verification")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ak", default="yourak")
+    parser.add_argument("--sk", default="yoursk")
+    parser.add_argument("--responses", help="JSON file mapping Action -> Result payload")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rps", type=float, default=None, help="per-AK request rate limit")
+    parser.add_argument("--workers", type=int, default=1, help="processes sharing the port (SO_REUSEPORT)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = {**DEFAULT_RESPONSES, **json.load(f)}
+    options = {
+        "credentials": {args.ak: args.sk},
+        "responses": responses,
+        "host": args.host,
+        "port": args.port,
+        "latency": args.latency_ms / 1000,
+        "latency_jitter": args.jitter_ms / 1000,
+        "error_rate": args.error_rate,
+        "throttle_rps": args.throttle_rps,
+        "reuse_port": args.workers > 1,
+    }
+    if args.workers > 1:
+        workers = [multiprocessing.Process(target=_serve, args=(options,)) for _ in range(args.workers)]
+        for w in workers:
+            w.start()
+        try:
+            for w in workers:
+                w.join()
+        except KeyboardInterrupt:
+            pass
+    else:
+        _serve(options)
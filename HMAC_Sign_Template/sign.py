@@ -6,9 +6,12 @@ import base64
 import datetime
 import hashlib
 import hmac
-from urllib.parse import quote
+import time
 
-import requests
+from canonical import CanonicalQueryEncoder
+from client import PooledSession
+from diagnostics import SigningRecord
+from signer import SigningKeyCache, hash_body
 
 # The following parameters vary based on the service and are usually consistent within a service.
 Service = "rtc"
@@ -21,22 +24,33 @@ ContentType = "application/x-www-form-urlencoded"
 AK = "yourak"
 SK = "yoursk"
 #SK = base64.b64decode(SK_E).decode()
-# When a temporary credential is used, SessionToken is required in the request header and needs to be calculated into the signed header. Add the X-Security-Token header to the header.
-# SessionToken = ""
+# When a temporary credential is used, SessionToken is required in the request header and needs to be calculated into the signed header. The X-Security-Token header is added automatically when it is set.
+SessionToken = ""
+# Rotating credentials: call use_credentials() with a provider from credentials.py (environment,
+# file-watch or refreshing STS AssumeRole). It then overrides the ak/sk/SessionToken above on every call.
+Credentials = None
+
+# Derived signing keys only change once per UTC day, so they are cached across calls.
+_signing_keys = SigningKeyCache()
+_query_encoder = CanonicalQueryEncoder()
+# Keep-alive connection pool (with connect/read timeouts) shared by every request() call
+_http = PooledSession()
+# Signing diagnostics, off by default. Set to diagnostics.LoggingDiagnostics() or
+# diagnostics.RingBufferDiagnostics() to record the canonical request hash and hashing /
+# HMAC / network timings for each call (the canonical request itself is never printed).
+SigningDiagnostics = None
+
+
+def use_credentials(provider):
+    global Credentials
+    Credentials = provider
+    # Drop keys derived from a secret as soon as it is rotated out
+    provider.subscribe(lambda old, new: _signing_keys.invalidate(old.secret_access_key))
 
 
 def norm_query(params):
-    query = ""
-    for key in sorted(params.keys()):
-        if type(params[key]) == list:
-            for k in params[key]:
-                query = (
-                        query + quote(key, safe="-_.~") + "=" + quote(k, safe="-_.~") + "&"
-                )
-        else:
-            query = (query + quote(key, safe="-_.~") + "=" + quote(params[key], safe="-_.~") + "&")
-    query = query[:-1]
-    return query.replace("+", "%20")
+    # Memoized percent-encoding, joined once (see canonical.py)
+    return _query_encoder.encode(params)
 
 
 # Step 1: Prepare an auxiliary function.
@@ -56,6 +70,10 @@ def request(method, date, query, header, ak, sk, action, body):
     # The values of the Service and Region fields are fixed and the values of the ak and sk fields indicate an access key ID and a secret access key, respectively. 
     # Signature struct initialization is also required. Some attributes required for signature calculation also need to be processed here.
     # Initialize the identity credential struct.
+    session_token = SessionToken
+    if Credentials is not None:
+        current = Credentials.get()
+        ak, sk, session_token = current.access_key_id, current.secret_access_key, current.session_token
     credential = {
         "access_key_id": ak,
         "secret_access_key": sk,
@@ -72,13 +90,17 @@ def request(method, date, query, header, ak, sk, action, body):
         "date": date,
         "query": {"Action": action, "Version": Version, **query},
     }
-    if body is None:
-        request_param["body"] = ""
     # Step 4: Prepare a signResult variable for receiving the signature calculation result and set the required parameters.
     # Initialize the signature result struct.
+    record = None
+    if SigningDiagnostics is not None:
+        record = SigningRecord(action, method, request_param["host"])
+        started = time.perf_counter()
     x_date = request_param["date"].strftime("%Y%m%dT%H%M%SZ")
     short_x_date = x_date[:8]
-    x_content_sha256 = hash_sha256(request_param["body"])
+    # The body may be str, bytes, a file object or an iterator of chunks. It is hashed in chunks
+    # and replaced with a payload that is streamed to the socket without being copied in memory.
+    x_content_sha256, request_param["body"], _ = hash_body(request_param["body"])
     sign_result = {
         "Host": request_param["host"],
         "X-Content-Sha256": x_content_sha256,
@@ -86,44 +108,44 @@ def request(method, date, query, header, ak, sk, action, body):
         "Content-Type": request_param["content_type"],
     }
     # Step 5: Calculate a signature.
-    signed_headers_str = ";".join(
-        ["content-type", "host", "x-content-sha256", "x-date"]
-    )
-    # signed_headers_str = signed_headers_str + ";x-security-token"
+    signed_headers = ["content-type", "host", "x-content-sha256", "x-date"]
+    canonical_headers = [
+        "content-type:" + request_param["content_type"],
+        "host:" + request_param["host"],
+        "x-content-sha256:" + x_content_sha256,
+        "x-date:" + x_date,
+    ]
+    if session_token:
+        signed_headers.append("x-security-token")
+        canonical_headers.append("x-security-token:" + session_token)
+        sign_result["X-Security-Token"] = session_token
+    signed_headers_str = ";".join(signed_headers)
     canonical_request_str = "\n".join(
         [request_param["method"].upper(),
          request_param["path"],
          norm_query(request_param["query"]),
-         "\n".join(
-             [
-                 "content-type:" + request_param["content_type"],
-                 "host:" + request_param["host"],
-                 "x-content-sha256:" + x_content_sha256,
-                 "x-date:" + x_date,
-             ]
-         ),
+         "\n".join(canonical_headers),
          "",
          signed_headers_str,
          x_content_sha256,
          ]
     )
 
-    # Print the normalized request for debugging and comparison.
-    print(canonical_request_str)
     hashed_canonical_request = hash_sha256(canonical_request_str)
-
-    # Print the hash value for debugging and comparison.
-    print(hashed_canonical_request)
     credential_scope = "/".join([short_x_date, credential["region"], credential["service"], "request"])
     string_to_sign = "\n".join(["HMAC-SHA256", x_date, credential_scope, hashed_canonical_request])
-
-    # Print the eventually calculated signature string for debugging and comparison.
-    print(string_to_sign)
-    k_date = hmac_sha256(credential["secret_access_key"].encode("utf-8"), short_x_date)
-    k_region = hmac_sha256(k_date, credential["region"])
-    k_service = hmac_sha256(k_region, credential["service"])
-    k_signing = hmac_sha256(k_service, "request")
+    if record is not None:
+        # Record the hash (not the canonical request or string-to-sign) for debugging and comparison.
+        record.canonical_request_hash = hashed_canonical_request
+        hashed = time.perf_counter()
+        record.hash_ms = (hashed - started) * 1000
+    # k_date -> k_region -> k_service -> k_signing, derived once per (sk, date, region, service)
+    k_signing = _signing_keys.get(credential["secret_access_key"], short_x_date,
+                                  credential["region"], credential["service"])
     signature = hmac_sha256(k_signing, string_to_sign).hex()
+    if record is not None:
+        sent = time.perf_counter()
+        record.hmac_ms = (sent - hashed) * 1000
 
     sign_result["Authorization"] = "HMAC-SHA256 Credential={}, SignedHeaders={}, Signature={}".format(
         credential["access_key_id"] + "/" + credential_scope,
@@ -131,14 +153,17 @@ def request(method, date, query, header, ak, sk, action, body):
         signature,
     )
     header = {**header, **sign_result}
-    # header = {**header, **{"X-Security-Token": SessionToken}}
     # Step 6: Write the signature into the HTTP header and send the HTTP request.
-    r = requests.request(method=method,
-                         url="https://{}{}".format(request_param["host"], request_param["path"]),
-                         headers=header,
-                         params=request_param["query"],
-                         data=request_param["body"],
-                         )
+    r = _http.request(method=method,
+                      url="https://{}{}".format(request_param["host"], request_param["path"]),
+                      headers=header,
+                      params=request_param["query"],
+                      data=request_param["body"],
+                      )
+    if record is not None:
+        record.network_ms = (time.perf_counter() - sent) * 1000
+        record.status = r.status_code
+        SigningDiagnostics.emit(record)
     return r.json()
 
 
@@ -0,0 +1,249 @@
+"""
+HMAC-SHA256 signer for BytePlus / Volcengine OpenAPI
+Produces the same headers as request() in sign.py, but caches derived signing keys.
+"""
+
+import hashlib
+import hmac
+import io
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from canonical import CanonicalQueryEncoder, FrozenQuery
+from diagnostics import Diagnostics, SigningRecord
+
+SIGNED_HEADERS = "content-type;host;x-content-sha256;x-date"
+# STS temporary credentials also sign the session token
+SIGNED_HEADERS_WITH_TOKEN = SIGNED_HEADERS + ";x-security-token"
+# Bodies are hashed in chunks of this size; iterators larger than SPOOL_MAX_SIZE spill to disk
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+_query_encoder = CanonicalQueryEncoder()
+
+
+def norm_query(params):
+    return _query_encoder.encode(params)
+
+
+def hmac_sha256(key: bytes, content: str):
+    return hmac.new(key, content.encode("utf-8"), hashlib.sha256).digest()
+
+
+def hash_sha256(content: str):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def hash_body(body) -> Tuple[str, object, int]:
+    """Hash a request body incrementally and return (hex sha256, payload to send, size)
+
+    body may be None, str, bytes, a file object or an iterator of str/bytes chunks.
+    Seekable binary files are hashed in chunks and rewound so they can be streamed to
+    the socket; text-mode files (whose tell() is not a byte count), other file objects
+    and iterators are spooled as UTF-8 bytes (to disk once large) while they are
+    hashed, so a body is never held in memory twice.
+    """
+    if body is None:
+        body = b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(body).hexdigest(), body, len(body)
+
+    digest = hashlib.sha256()
+    if hasattr(body, "read") and not isinstance(body, io.TextIOBase) and _seekable(body):
+        start = body.tell()
+        while chunk := body.read(CHUNK_SIZE):
+            digest.update(_to_bytes(chunk))
+        size = body.tell() - start
+        body.seek(start)
+        return digest.hexdigest(), body, size
+
+    chunks = _read_chunks(body) if hasattr(body, "read") else body
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    size = 0
+    for chunk in chunks:
+        chunk = _to_bytes(chunk)
+        if not chunk:
+            continue
+        digest.update(chunk)
+        spool.write(chunk)
+        size += len(chunk)
+    spool.seek(0)
+    return digest.hexdigest(), spool, size
+
+
+def _read_chunks(f):
+    # Stops at b"" and at the "" a text-mode file returns at EOF
+    while chunk := f.read(CHUNK_SIZE):
+        yield chunk
+
+
+def _seekable(f) -> bool:
+    try:
+        return f.seekable() if isinstance(f, io.IOBase) else hasattr(f, "seek") and hasattr(f, "tell")
+    except ValueError:
+        return False
+
+
+def _to_bytes(chunk) -> bytes:
+    return chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+def derive_signing_key(sk: str, short_date: str, region: str, service: str) -> bytes:
+    """Run the k_date -> k_region -> k_service -> k_signing chain"""
+    k_date = hmac_sha256(sk.encode("utf-8"), short_date)
+    k_region = hmac_sha256(k_date, region)
+    k_service = hmac_sha256(k_region, service)
+    return hmac_sha256(k_service, "request")
+
+
+class SigningKeyCache:
+    """Thread-safe cache of derived signing keys keyed by (sk, short_date, region, service)
+
+    The key only changes once per UTC day, so entries older than the previous
+    day are evicted as soon as a newer date is seen.
+    """
+
+    def __init__(self):
+        self._keys: Dict[Tuple[str, str, str, str], bytes] = {}
+        self._lock = threading.Lock()
+        self._latest_date = ""
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sk: str, short_date: str, region: str, service: str) -> bytes:
+        """Return the signing key, deriving and storing it on a miss"""
+        cache_key = (sk, short_date, region, service)
+        signing_key = self._keys.get(cache_key)
+        if signing_key is not None:
+            self.hits += 1
+            return signing_key
+
+        signing_key = derive_signing_key(sk, short_date, region, service)
+        with self._lock:
+            self.misses += 1
+            if short_date > self._latest_date:
+                self._evict_before(self._latest_date)
+                self._latest_date = short_date
+            self._keys[cache_key] = signing_key
+        return signing_key
+
+    def invalidate(self, sk: str):
+        """Drop every key derived from sk, e.g. after the credential rotated"""
+        with self._lock:
+            stale = [k for k in self._keys if k[0] == sk]
+            for k in stale:
+                del self._keys[k]
+
+    def _evict_before(self, short_date: str):
+        """Drop keys for days older than short_date (caller holds the lock)"""
+        stale = [k for k in self._keys if k[1] < short_date]
+        for k in stale:
+            del self._keys[k]
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._latest_date = ""
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class Signer:
+    """Signs OpenAPI requests for one (service, region, host, content type)"""
+
+    def __init__(self, service: str, region: str, host: str, content_type: str,
+                 key_cache: Optional[SigningKeyCache] = None,
+                 diagnostics: Optional[Diagnostics] = None):
+        self.service = service
+        self.region = region
+        self.host = host
+        self.content_type = content_type
+        self.key_cache = key_cache if key_cache is not None else SigningKeyCache()
+        self.encoder = _query_encoder
+        # None disables diagnostics entirely; see diagnostics.py
+        self.diagnostics = diagnostics
+
+    def sign(self, method, date, query, ak, sk, body, path="/",
+             static: Optional[FrozenQuery] = None,
+             canonical_query: Optional[str] = None,
+             content_sha256: Optional[str] = None,
+             record: Optional[SigningRecord] = None,
+             session_token: Optional[str] = None) -> Dict[str, str]:
+        """Return the Host/X-Content-Sha256/X-Date/Content-Type/Authorization headers
+
+        query must already contain Action and Version, unless they are passed
+        pre-encoded as static (see CanonicalQueryEncoder.freeze). Callers that
+        already built the canonical query string can pass it to skip encoding.
+        Streaming bodies should go through hash_body() first and pass its digest
+        as content_sha256, since an iterator can only be read once.
+
+        When record is given (or self.diagnostics is set) hashing and HMAC
+        timings are filled in; clients pass their own record to add network time.
+        With an STS session_token, x-security-token is signed and X-Security-Token returned.
+        """
+        emit = record is None and self.diagnostics is not None
+        if emit:
+            record = SigningRecord(query.get("Action", ""), method, self.host)
+        if record is not None:
+            started = time.perf_counter()
+        if canonical_query is None:
+            canonical_query = self.encoder.encode(query, static)
+        x_date = date.strftime("%Y%m%dT%H%M%SZ")
+        short_x_date = x_date[:8]
+        x_content_sha256 = content_sha256 or hash_body(body)[0]
+
+        canonical_headers = [
+            "content-type:" + self.content_type,
+            "host:" + self.host,
+            "x-content-sha256:" + x_content_sha256,
+            "x-date:" + x_date,
+        ]
+        signed_headers = SIGNED_HEADERS
+        if session_token:
+            canonical_headers.append("x-security-token:" + session_token)
+            signed_headers = SIGNED_HEADERS_WITH_TOKEN
+
+        canonical_request_str = "\n".join(
+            [method.upper(),
+             path,
+             canonical_query,
+             "\n".join(canonical_headers),
+             "",
+             signed_headers,
+             x_content_sha256,
+             ]
+        )
+        hashed_canonical_request = hash_sha256(canonical_request_str)
+        credential_scope = "/".join([short_x_date, self.region, self.service, "request"])
+        string_to_sign = "\n".join(["HMAC-SHA256", x_date, credential_scope, hashed_canonical_request])
+        if record is not None:
+            hashed = time.perf_counter()
+
+        k_signing = self.key_cache.get(sk, short_x_date, self.region, self.service)
+        signature = hmac_sha256(k_signing, string_to_sign).hex()
+
+        if record is not None:
+            record.canonical_request_hash = hashed_canonical_request
+            record.hash_ms += (hashed - started) * 1000
+            record.hmac_ms = (time.perf_counter() - hashed) * 1000
+            if emit:
+                self.diagnostics.emit(record)
+
+        result = {
+            "Host": self.host,
+            "X-Content-Sha256": x_content_sha256,
+            "X-Date": x_date,
+            "Content-Type": self.content_type,
+            "Authorization": "HMAC-SHA256 Credential={}, SignedHeaders={}, Signature={}".format(
+                ak + "/" + credential_scope,
+                signed_headers,
+                signature,
+            ),
+        }
+        if session_token:
+            result["X-Security-Token"] = session_token
+        return result
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the sync and async signed clients against the local mock OpenAPI server
+"""
+
+import asyncio
+import json
+
+from async_client import AsyncSignedClient
+from client import SignedClient
+from mock_openapi_server import MockOpenAPIServer
+from signer import Signer
+
+CREDENTIALS = {"AKTEST": "SKTEST"}
+
+
+def test_async_fan_out_signatures_verified():
+    """Hundreds of concurrent calls are all accepted by the verifying server"""
+
+    async def run():
+        server = MockOpenAPIServer(CREDENTIALS)
+        await server.start()
+        signer = Signer("cv", "cn-north-1", server.address, "application/json")
+        async with AsyncSignedClient(signer, "2022-08-31", "AKTEST", "SKTEST",
+                                     concurrency=50, scheme="http") as client:
+            calls = []
+            for i in range(300):
+                if i % 3 == 0:
+                    calls.append(("GET", "ListApps", {"Limit": "10", "Name": "a b+c"}, None))
+                else:
+                    body = json.dumps({"req_key": "jimeng_realman_avatar_picture_omni_v15", "n": i})
+                    calls.append(("POST", "CVSubmitTask" if i % 3 == 1 else "CVGetResult", {}, body))
+            results = await client.gather(calls)
+        await server.stop()
+        return server, results
+
+    server, results = asyncio.run(run())
+    assert server.signature_failures == 0
+    assert server.requests == 300
+    assert all("Error" not in r["ResponseMetadata"] for r in results)
+    assert results[1]["Result"]["data"]["task_id"] == "mock-task-id"
+
+
+def test_bad_secret_rejected():
+    """A wrong secret key is reported as SignatureDoesNotMatch"""
+
+    async def run():
+        server = MockOpenAPIServer(CREDENTIALS)
+        await server.start()
+        signer = Signer("rtc", "ap-singapore-1", server.address, "application/json")
+        async with AsyncSignedClient(signer, "2020-12-01", "AKTEST", "WRONG", scheme="http") as client:
+            result = await client.request("GET", "ListApps", {"Limit": "10"})
+        await server.stop()
+        return result
+
+    result = asyncio.run(run())
+    assert result["ResponseMetadata"]["Error"]["Code"] == "SignatureDoesNotMatch"
+
+
+def test_sync_client_reuses_connection():
+    """The pooled sync client passes verification and reuses its keep-alive connection"""
+    server = MockOpenAPIServer(CREDENTIALS).start_in_thread()
+    try:
+        signer = Signer("filenas", "ap-southeast-1", server.address, "application/json; charset=utf-8")
+        client = SignedClient(signer, "2022-01-01", "AKTEST", "SKTEST", scheme="http")
+        body = json.dumps({"PermissionGroupName": "test"}, separators=(',', ':'))
+        for _ in range(5):
+            result = client.call("POST", "CreatePermissionGroup", body=body)
+            assert result["Result"]["PermissionGroupId"] == "pgroup-mock"
+        stats = client.connection_stats()[server.address]
+        assert stats["requests"] == 5
+        assert stats["reused"] == 4
+    finally:
+        server.stop_thread()
+    assert server.signature_failures == 0
+
+
+def test_streamed_bodies_verified():
+    """File and iterator bodies are hashed in chunks and accepted by the server"""
+    import io
+
+    server = MockOpenAPIServer(CREDENTIALS).start_in_thread()
+    try:
+        signer = Signer("rtc", "ap-singapore-1", server.address, "application/json")
+        client = SignedClient(signer, "2020-12-01", "AKTEST", "SKTEST", scheme="http")
+        payload = json.dumps({"AppName": "x" * 300000}).encode()
+        assert "Error" not in client.call("POST", "CreateApp", body=io.BytesIO(payload))["ResponseMetadata"]
+        chunks = (payload[i:i + 4096] for i in range(0, len(payload), 4096))
+        assert "Error" not in client.call("POST", "CreateApp", body=chunks)["ResponseMetadata"]
+
+        async def run():
+            async with AsyncSignedClient(signer, "2020-12-01", "AKTEST", "SKTEST", scheme="http") as ac:
+                return await ac.request("POST", "CreateApp", body=io.BytesIO(payload))
+
+        assert "Error" not in asyncio.run(run())["ResponseMetadata"]
+    finally:
+        server.stop_thread()
+    assert server.signature_failures == 0
+
+
+def test_diagnostics_records_timings_without_secrets():
+    """Enabled diagnostics emit one structured record per call; disabled clients emit nothing"""
+    from diagnostics import RingBufferDiagnostics
+
+    server = MockOpenAPIServer(CREDENTIALS).start_in_thread()
+    try:
+        signer = Signer("rtc", "ap-singapore-1", server.address, "application/json")
+        ring = RingBufferDiagnostics(capacity=2)
+        client = SignedClient(signer, "2020-12-01", "AKTEST", "SKTEST", scheme="http", diagnostics=ring)
+        quiet = SignedClient(signer, "2020-12-01", "AKTEST", "SKTEST", scheme="http")
+        for _ in range(3):
+            client.call("GET", "ListApps", {"Limit": "10"})
+        quiet.call("GET", "ListApps", {"Limit": "10"})
+    finally:
+        server.stop_thread()
+
+    records = ring.snapshot()
+    assert len(records) == 2
+    record = records[-1].to_dict()
+    assert record["action"] == "ListApps" and record["status"] == 200
+    assert len(record["canonical_request_hash"]) == 64
+    assert record["network_ms"] > 0 and record["hmac_ms"] > 0
+    assert "SKTEST" not in repr(record)
+    assert ring.summary()["count"] == 2
+
+
+def test_throttling_and_error_injection():
+    """Per-AK throttling answers 429 FlowLimitExceeded and error_rate=1 injects InternalError"""
+
+    async def run(**options):
+        server = MockOpenAPIServer(CREDENTIALS, seed=1, **options)
+        await server.start()
+        signer = Signer("cv", "cn-north-1", server.address, "application/json")
+        async with AsyncSignedClient(signer, "2022-08-31", "AKTEST", "SKTEST", scheme="http") as client:
+            results = await client.gather([("GET", "ListApps", {"Limit": "10"}, None)] * 20)
+        await server.stop()
+        return server, [(r["ResponseMetadata"].get("Error") or {}).get("Code", "OK") for r in results]
+
+    server, codes = asyncio.run(run(throttle_rps=1))
+    assert codes.count("OK") >= 1 and "FlowLimitExceeded" in codes
+    assert server.statuses[429] == codes.count("FlowLimitExceeded")
+
+    server, codes = asyncio.run(run(error_rate=1.0))
+    assert set(codes) == {"InternalError"}
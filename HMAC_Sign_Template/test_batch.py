@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the batch action executor using an in-process fake client
+"""
+
+import json
+import threading
+
+import pytest
+
+from batch import BatchError, BatchExecutor, Ref, Step, nfs_mount_steps
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class FakeClient:
+    """Answers like the NAS OpenAPI; throttles the first `throttle` calls of each action"""
+
+    def __init__(self, throttle=0, fail_action=None):
+        self.throttle = throttle
+        self.fail_action = fail_action
+        self.calls = []
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, action, query=None, body=None):
+        with self._lock:
+            self.calls.append((action, json.loads(body) if body else None))
+            self._seen[action] = self._seen.get(action, 0) + 1
+            count = self._seen[action]
+        if count <= self.throttle:
+            return FakeResponse(429, {"ResponseMetadata": {"Error": {"Code": "FlowLimitExceeded"}}})
+        if action == self.fail_action:
+            return FakeResponse(400, {"ResponseMetadata": {"Error": {"Code": "InvalidParameter"}}})
+        name = json.loads(body).get("PermissionGroupName", "") if body else ""
+        return FakeResponse(200, {"ResponseMetadata": {}, "Result": {"PermissionGroupId": "pg-" + name}})
+
+
+def test_outputs_flow_into_dependent_steps():
+    """PermissionGroupId from CreatePermissionGroup is passed to the later steps"""
+    client = FakeClient()
+    result = BatchExecutor(client, max_parallel=4).run(
+        nfs_mount_steps("enas-a", "vpc", "subnet") + nfs_mount_steps("enas-b", "vpc", "subnet"))
+    assert result.ok
+    order = [action for action, _ in client.calls]
+    assert order.index("UpdatePermissionRule") > order.index("CreatePermissionGroup")
+    mounts = [body for action, body in client.calls if action == "CreateMountPoint"]
+    assert {m["PermissionGroupId"] for m in mounts} == {"pg-enas-a-group", "pg-enas-b-group"}
+
+
+def test_throttled_calls_are_retried_with_backoff():
+    delays = []
+    executor = BatchExecutor(FakeClient(throttle=2), max_retries=3, sleep=delays.append)
+    result = executor.run([Step("group", "CreatePermissionGroup", {"PermissionGroupName": "g"})])
+    assert result.ok
+    assert result.attempts["group"] == 3
+    assert len(delays) == 2 and all(0 <= d <= executor.max_delay for d in delays)
+
+
+def test_failed_step_skips_dependents():
+    steps = nfs_mount_steps("enas-a", "vpc", "subnet")
+    result = BatchExecutor(FakeClient(fail_action="UpdatePermissionRule")).run(steps)
+    assert list(result.errors) == ["enas-a/rule"]
+    assert result.skipped == ["enas-a/mount"]
+    assert "enas-a/group" in result.results
+
+
+def test_plan_and_dry_run():
+    steps = nfs_mount_steps("enas-a", "vpc", "subnet")
+    lines = []
+    waves = BatchExecutor(FakeClient()).dry_run(steps, out=lines.append)
+    assert waves == [["enas-a/group"], ["enas-a/rule"], ["enas-a/mount"]]
+    assert "wave 3:" in "\n".join(lines)
+
+    with pytest.raises(BatchError):
+        BatchExecutor.plan([Step("a", "X", {"v": Ref("b", "Result.Id")}), Step("b", "Y", {"v": Ref("a", "Result.Id")})])
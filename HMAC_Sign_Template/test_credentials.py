@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for the credential providers, session-token signing and key invalidation on rotation
+"""
+
+import datetime
+import json
+import os
+import time
+
+import pytest
+
+from client import SignedClient
+from credentials import (Credential, CredentialError, EnvironmentCredentialProvider, FileCredentialProvider,
+                         RefreshingCredentialProvider, StaticCredentialProvider, parse_credential)
+from mock_openapi_server import MockOpenAPIServer, verify_signature
+from signer import Signer
+
+DATE = datetime.datetime(2024, 5, 6, 7, 8, 9)
+
+
+def test_session_token_is_signed():
+    """x-security-token is added to SignedHeaders and verifies like any other signed header"""
+    signer = Signer("rtc", "ap-singapore-1", "open.byteplusapi.com", "application/x-www-form-urlencoded")
+    query = {"Action": "ListApps", "Version": "2020-12-01", "Limit": "10"}
+    plain = signer.sign("GET", DATE, query, "AKTEST", "SKTEST", None)
+    headers = signer.sign("GET", DATE, query, "AKTEST", "SKTEST", None, session_token="STS-TOKEN")
+    assert "SignedHeaders=content-type;host;x-content-sha256;x-date;x-security-token," in headers["Authorization"]
+    assert headers["X-Security-Token"] == "STS-TOKEN"
+    assert headers["Authorization"] != plain["Authorization"]
+
+    lowered = {k.lower(): v for k, v in headers.items()}
+    target = "/?Action=ListApps&Limit=10&Version=2020-12-01"
+    assert verify_signature("GET", target, lowered, b"", {"AKTEST": "SKTEST"}) == (True, "")
+    lowered["x-security-token"] = "TAMPERED"
+    assert verify_signature("GET", target, lowered, b"", {"AKTEST": "SKTEST"})[1] == "SignatureDoesNotMatch"
+
+
+def test_parse_assume_role_response():
+    response = {"ResponseMetadata": {}, "Result": {"Credentials": {
+        "AccessKeyId": "AKTP", "SecretAccessKey": "SK", "SessionToken": "TOKEN",
+        "ExpiredTime": "2024-05-06T08:08:09+08:00"}}}
+    credential = parse_credential(response)
+    assert credential.session_token == "TOKEN"
+    assert credential.expiration == datetime.datetime(2024, 5, 6, 0, 8, 9, tzinfo=datetime.timezone.utc).timestamp()
+    assert "SK" not in repr(credential)
+    with pytest.raises(CredentialError):
+        parse_credential({"AccessKeyId": "AK"})
+
+
+def test_environment_and_file_providers(tmp_path, monkeypatch):
+    monkeypatch.setenv("VOLC_ACCESSKEY", "AK1")
+    monkeypatch.setenv("VOLC_SECRETKEY", "SK1")
+    monkeypatch.delenv("VOLC_SESSION_TOKEN", raising=False)
+    provider = EnvironmentCredentialProvider()
+    rotations = []
+    provider.subscribe(lambda old, new: rotations.append((old.access_key_id, new.access_key_id)))
+    assert provider.get() is provider.get()
+    monkeypatch.setenv("VOLC_ACCESSKEY", "AK2")
+    assert provider.get().access_key_id == "AK2"
+    assert rotations == [("AK1", "AK2")]
+
+    path = tmp_path / "sts.json"
+    path.write_text(json.dumps({"AccessKeyId": "AKF1", "SecretAccessKey": "SKF1", "SessionToken": "T1"}))
+    provider = FileCredentialProvider(str(path), check_interval=0)
+    assert provider.get().session_token == "T1"
+    path.write_text(json.dumps({"AccessKeyId": "AKF2", "SecretAccessKey": "SKF2", "SessionToken": "T2"}))
+    future = time.time() + 10
+    os.utime(path, (future, future))
+    assert provider.get().access_key_id == "AKF2"
+
+
+def test_background_refresh_rotates_before_expiry():
+    """The refresh thread swaps credentials ahead of expiry; get() never waits on a slow fetch"""
+    issued = []
+
+    def fetch():
+        if issued:
+            time.sleep(0.1)
+        issued.append(len(issued) + 1)
+        n = issued[-1]
+        return Credential(f"AK{n}", f"SK{n}", f"TOKEN{n}", time.time() + 0.6)
+
+    provider = RefreshingCredentialProvider(fetch, refresh_margin=0.4, retry_delay=0.01)
+    try:
+        assert provider.get().access_key_id == "AK1"
+        slowest = 0.0
+        deadline = time.perf_counter() + 2
+        while provider.get().access_key_id == "AK1" and time.perf_counter() < deadline:
+            started = time.perf_counter()
+            provider.get()
+            slowest = max(slowest, time.perf_counter() - started)
+            time.sleep(0.002)
+        assert provider.get().access_key_id == "AK2"
+        assert not provider.get().expired()
+        assert slowest < 0.05
+    finally:
+        provider.close()
+
+
+def test_client_invalidates_keys_on_rotation():
+    """A rotated secret drops its derived keys and the new STS credential verifies end to end"""
+    server = MockOpenAPIServer({"AKSTS1": "SKSTS1", "AKSTS2": "SKSTS2"}).start_in_thread()
+    provider = StaticCredentialProvider("AKSTS1", "SKSTS1", "TOKEN1")
+    try:
+        signer = Signer("rtc", "ap-singapore-1", server.address, "application/json")
+        client = SignedClient(signer, "2020-12-01", credentials=provider, scheme="http")
+        assert "Error" not in client.call("GET", "ListApps", {"Limit": "10"})["ResponseMetadata"]
+        assert {k[0] for k in signer.key_cache._keys} == {"SKSTS1"}
+
+        provider._set(Credential("AKSTS2", "SKSTS2", "TOKEN2"))
+        assert len(signer.key_cache) == 0
+        assert "Error" not in client.call("GET", "ListApps", {"Limit": "10"})["ResponseMetadata"]
+        assert {k[0] for k in signer.key_cache._keys} == {"SKSTS2"}
+    finally:
+        server.stop_thread()
+    assert server.signature_failures == 0
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the cached HMAC-SHA256 signer
+Golden Authorization headers were captured from the original uncached request() in sign.py.
+"""
+
+import datetime
+import json
+import threading
+
+from signer import Signer, SigningKeyCache, derive_signing_key
+
+DATE = datetime.datetime(2024, 5, 6, 7, 8, 9)
+
+GOLDEN_LIST_APPS = (
+    "HMAC-SHA256 Credential=AKTEST/20240506/ap-singapore-1/rtc/request, "
+    "SignedHeaders=content-type;host;x-content-sha256;x-date, "
+    "Signature=a800f29300119e863561e8faa2b31c503ab6d818784666408bdc5d8e1c34de01"
+)
+GOLDEN_CREATE_APP = (
+    "HMAC-SHA256 Credential=AKTEST/20240506/ap-singapore-1/rtc/request, "
+    "SignedHeaders=content-type;host;x-content-sha256;x-date, "
+    "Signature=ca506993c60bc7dc24f2c89d333094384d78d3dbc068a9b057aefcabc8f8a52a"
+)
+
+
+def make_signer():
+    return Signer("rtc", "ap-singapore-1", "open.byteplusapi.com", "application/x-www-form-urlencoded")
+
+
+def test_authorization_matches_original():
+    """Cached signer must stay byte-identical to sign.py"""
+    signer = make_signer()
+    query = {"Action": "ListApps", "Version": "2020-12-01", "Limit": "10"}
+    headers = signer.sign("GET", DATE, query, "AKTEST", "SKTEST", None)
+    assert headers["Authorization"] == GOLDEN_LIST_APPS
+    assert headers["X-Date"] == "20240506T070809Z"
+
+    body = json.dumps({"AppName": "MyTestApp"}, separators=(',', ':'))
+    query = {"Action": "CreateApp", "Version": "2020-12-01"}
+    headers = signer.sign("POST", DATE, query, "AKTEST", "SKTEST", body)
+    assert headers["Authorization"] == GOLDEN_CREATE_APP
+
+    # Second call is served from the cache and must not change the output
+    assert signer.key_cache.hits == 1
+    assert signer.key_cache.misses == 1
+
+
+def test_day_rollover_evicts_old_keys():
+    """Keys older than the previous day are dropped when a new day starts"""
+    cache = SigningKeyCache()
+    cache.get("sk", "20240506", "r", "s")
+    cache.get("sk", "20240507", "r", "s")
+    assert len(cache) == 2
+    cache.get("sk", "20240508", "r", "s")
+    assert len(cache) == 2
+    assert ("sk", "20240506", "r", "s") not in cache._keys
+    assert cache.get("sk", "20240508", "r", "s") == derive_signing_key("sk", "20240508", "r", "s")
+
+
+def test_concurrent_access():
+    """Concurrent callers always get the correctly derived key"""
+    cache = SigningKeyCache()
+    expected = derive_signing_key("sk", "20240506", "r", "s")
+    errors = []
+
+    def worker():
+        for _ in range(200):
+            if cache.get("sk", "20240506", "r", "s") != expected:
+                errors.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(cache) == 1
+
+
+def test_hash_body_streaming_sources_agree():
+    """str, bytes, file objects and iterators hash to the same X-Content-Sha256"""
+    import hashlib
+    import io
+
+    from signer import CHUNK_SIZE, hash_body
+
+    data = b"x" * (3 * CHUNK_SIZE + 17)
+    expected = hashlib.sha256(data).hexdigest()
+
+    assert hash_body(None)[0] == hashlib.sha256(b"").hexdigest()
+    assert hash_body(data.decode())[0] == expected
+
+    f = io.BytesIO(b"prefix" + data)
+    f.seek(6)
+    digest, payload, size = hash_body(f)
+    assert (digest, size) == (expected, len(data))
+    assert payload.read() == data
+
+    chunks = (data[i:i + 1000] for i in range(0, len(data), 1000))
+    digest, payload, size = hash_body(chunks)
+    assert (digest, size) == (expected, len(data))
+    assert payload.read() == data
+
+
+def test_hash_body_text_mode_files(tmp_path):
+    """Text-mode files end at "" and are sized in UTF-8 bytes, not tell() positions"""
+    import hashlib
+    import io
+
+    from signer import CHUNK_SIZE, hash_body
+
+    text = "防火墙 rule\n" * CHUNK_SIZE
+    data = text.encode("utf-8")
+    expected = (hashlib.sha256(data).hexdigest(), len(data))
+
+    digest, payload, size = hash_body(io.StringIO(text))
+    assert (digest, size) == expected and payload.read() == data
+
+    path = tmp_path / "body.txt"
+    path.write_bytes(data)
+    with open(path, encoding="utf-8", newline="") as f:
+        digest, payload, size = hash_body(f)
+    assert (digest, size) == expected and payload.read() == data
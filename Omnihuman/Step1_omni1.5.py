@@ -23,19 +23,25 @@ ContentType = "application/json"
 AK = "yourak"
 SK = "yoursk"
 
+# 复用同一个 Session，保持长连接（keep-alive），避免每次请求都重新建立 TCP+TLS 连接
+session = requests.Session()
+# (连接超时, 读取超时)，单位秒
+Timeout = (3.05, 30)
+# 调试开关：为 True 时打印正规化请求、hash 值和待签名字符串。默认关闭，避免热路径上的同步 stdout I/O
+# 以及签名材料泄露到日志中
+Debug = False
+
 
 def norm_query(params):
-    query = ""
+    pairs = []
     for key in sorted(params.keys()):
         if type(params[key]) == list:
             for k in params[key]:
-                query = (
-                        query + quote(key, safe="-_.~") + "=" + quote(k, safe="-_.~") + "&"
-                )
+                pairs.append(quote(key, safe="-_.~") + "=" + quote(k, safe="-_.~"))
         else:
-            query = (query + quote(key, safe="-_.~") + "=" + quote(params[key], safe="-_.~") + "&")
-    query = query[:-1]
-    return query.replace("+", "%20")
+            pairs.append(quote(key, safe="-_.~") + "=" + quote(params[key], safe="-_.~"))
+    # 一次 join，避免逐次拼接字符串；quote 不会产生 "+"，无需再替换
+    return "&".join(pairs)
 
 
 # 第一步：准备辅助函数。
@@ -106,17 +112,15 @@ def request(method, date, query, header, ak, sk, action, body):
          ]
     )
 
-    # 打印正规化的请求用于调试比对
-    print(canonical_request_str)
     hashed_canonical_request = hash_sha256(canonical_request_str)
-
-    # 打印hash值用于调试比对
-    print(hashed_canonical_request)
     credential_scope = "/".join([short_x_date, credential["region"], credential["service"], "request"])
     string_to_sign = "\n".join(["HMAC-SHA256", x_date, credential_scope, hashed_canonical_request])
 
-    # 打印最终计算的签名字符串用于调试比对
-    print(string_to_sign)
+    if Debug:
+        # 打印正规化的请求、hash值和最终计算的签名字符串用于调试比对
+        print(canonical_request_str)
+        print(hashed_canonical_request)
+        print(string_to_sign)
     k_date = hmac_sha256(credential["secret_access_key"].encode("utf-8"), short_x_date)
     k_region = hmac_sha256(k_date, credential["region"])
     k_service = hmac_sha256(k_region, credential["service"])
@@ -131,12 +135,13 @@ def request(method, date, query, header, ak, sk, action, body):
     header = {**header, **sign_result}
     # header = {**header, **{"X-Security-Token": SessionToken}}
     # 第六步：将 Signature 签名写入 HTTP Header 中，并发送 HTTP 请求。
-    r = requests.request(method=method,
-                         url="https://{}{}".format(request_param["host"], request_param["path"]),
-                         headers=header,
-                         params=request_param["query"],
-                         data=request_param["body"],
-                         )
+    r = session.request(method=method,
+                        url="https://{}{}".format(request_param["host"], request_param["path"]),
+                        headers=header,
+                        params=request_param["query"],
+                        data=request_param["body"],
+                        timeout=Timeout,
+                        )
     return r.json()
 
 
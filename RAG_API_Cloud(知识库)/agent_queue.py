@@ -0,0 +1,213 @@
+"""
+Agent handoff queue with O(1) enqueue / dequeue / cancel and O(log n) position lookup
+Customers wait in lanes (a language or skill, "default" otherwise) at a priority (VIP above
+normal). Each lane + priority is a FIFO with lazy deletion plus a Fenwick tree over its slots,
+so a customer's position is a prefix sum instead of list.index(), and an abandoned session is
+cancelled without shifting the list. Agents take the oldest customer of the highest priority
+among the lanes they serve.
+"""
+
+import heapq
+import threading
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_LANE = "default"
+NORMAL_PRIORITY = 0
+VIP_PRIORITY = 10
+
+
+class _Fenwick:
+    """Prefix sums over a fixed number of 0/1 slots"""
+
+    __slots__ = ("tree",)
+
+    def __init__(self, size: int):
+        self.tree = [0] * (size + 1)
+
+    def add(self, slot: int, delta: int):
+        tree = self.tree
+        i = slot + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, slot: int) -> int:
+        """Sum of slots 0..slot"""
+        tree = self.tree
+        i = slot + 1
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    @classmethod
+    def ones(cls, count: int, size: int) -> "_Fenwick":
+        """Slots 0..count-1 set, built in O(size)"""
+        fenwick = cls(size)
+        tree = fenwick.tree
+        for i in range(1, size + 1):
+            if i <= count:
+                tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        return fenwick
+
+
+class _Lane:
+    """FIFO of one lane + priority; cancelled entries stay in the deque until they reach the front"""
+
+    __slots__ = ("entries", "slot_of", "fenwick", "capacity", "next_slot", "live")
+
+    def __init__(self, capacity: int = 64):
+        self.entries = deque()  # (slot, ticket, session_id), cancelled ones included
+        self.slot_of: Dict[str, int] = {}
+        self.capacity = capacity
+        self.fenwick = _Fenwick(capacity)
+        self.next_slot = 0
+        self.live = 0
+
+    def push(self, session_id: str, ticket: int):
+        if self.next_slot == self.capacity:
+            self._compact()
+        slot = self.next_slot
+        self.next_slot += 1
+        self.entries.append((slot, ticket, session_id))
+        self.slot_of[session_id] = slot
+        self.fenwick.add(slot, 1)
+        self.live += 1
+
+    def remove(self, session_id: str):
+        slot = self.slot_of.pop(session_id)
+        self.fenwick.add(slot, -1)
+        self.live -= 1
+
+    def head(self) -> Optional[Tuple[int, int, str]]:
+        """Oldest live entry, dropping cancelled ones from the front (amortized O(1))"""
+        entries = self.entries
+        while entries:
+            entry = entries[0]
+            if self.slot_of.get(entry[2]) == entry[0]:
+                return entry
+            entries.popleft()
+        return None
+
+    def rank(self, session_id: str) -> int:
+        """1-based position within the lane"""
+        return self.fenwick.prefix(self.slot_of[session_id])
+
+    def live_entries(self) -> List[Tuple[int, str]]:
+        return list(self.iter_live())
+
+    def iter_live(self) -> Iterator[Tuple[int, str]]:
+        return ((ticket, sid) for slot, ticket, sid in self.entries if self.slot_of.get(sid) == slot)
+
+    def _compact(self):
+        """Renumber live entries from slot 0 and size the tree to twice their count; O(live), and
+        the new free slots pay for it"""
+        live = self.live_entries()
+        self.capacity = max(64, 2 * len(live))
+        self.entries = deque((slot, ticket, sid) for slot, (ticket, sid) in enumerate(live))
+        self.slot_of = {sid: slot for slot, (_, sid) in enumerate(live)}
+        self.fenwick = _Fenwick.ones(len(live), self.capacity)
+        self.next_slot = len(live)
+
+    def __len__(self):
+        return self.live
+
+
+class AgentQueue:
+    """Thread-safe priority / lane queue of session IDs"""
+
+    def __init__(self):
+        # (lane, priority) -> _Lane; lane -> priorities in use, highest first
+        self._lanes: Dict[Tuple[str, int], _Lane] = {}
+        self._priorities: Dict[str, List[int]] = {}
+        self._where: Dict[str, Tuple[str, int]] = {}
+        self._ticket = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, session_id: str, lane: str = DEFAULT_LANE, priority: int = NORMAL_PRIORITY) -> int:
+        """Queue session_id (no-op if already queued); returns its 1-based position"""
+        with self._lock:
+            if session_id not in self._where:
+                key = (lane, priority)
+                queue = self._lanes.get(key)
+                if queue is None:
+                    queue = self._lanes[key] = _Lane()
+                    self._priorities[lane] = sorted(self._priorities.get(lane, []) + [priority], reverse=True)
+                self._ticket += 1
+                queue.push(session_id, self._ticket)
+                self._where[session_id] = key
+            return self._position(session_id)
+
+    def dequeue(self, lanes: Optional[Iterable[str]] = None) -> Optional[str]:
+        """Oldest session of the highest priority among lanes (all lanes when None), or None"""
+        with self._lock:
+            best_key, best = None, None
+            lanes = self._priorities if lanes is None else lanes
+            for lane in lanes:
+                for priority in self._priorities.get(lane, ()):
+                    head = self._lanes[(lane, priority)].head()
+                    if head is not None:
+                        if best is None or (priority, -head[1]) > (best_key[1], -best[1]):
+                            best_key, best = (lane, priority), head
+                        break  # lower priorities of this lane cannot win
+            if best is None:
+                return None
+            session_id = best[2]
+            self._lanes[best_key].remove(session_id)
+            del self._where[session_id]
+            return session_id
+
+    def cancel(self, session_id: str) -> bool:
+        """Remove an abandoned session wherever it is in the queue"""
+        with self._lock:
+            key = self._where.pop(session_id, None)
+            if key is None:
+                return False
+            self._lanes[key].remove(session_id)
+            return True
+
+    def position(self, session_id: str) -> int:
+        """1-based position among the customers its agents would take first, 0 when not queued"""
+        with self._lock:
+            return self._position(session_id) if session_id in self._where else 0
+
+    def _position(self, session_id: str) -> int:
+        lane, priority = self._where[session_id]
+        ahead = sum(len(self._lanes[(lane, p)]) for p in self._priorities[lane] if p > priority)
+        return ahead + self._lanes[(lane, priority)].rank(session_id)
+
+    def lane_of(self, session_id: str) -> Optional[Tuple[str, int]]:
+        return self._where.get(session_id)
+
+    def lengths(self) -> Dict[str, int]:
+        """Queued sessions per lane"""
+        with self._lock:
+            lengths: Dict[str, int] = {}
+            for (lane, _), queue in self._lanes.items():
+                if len(queue):
+                    lengths[lane] = lengths.get(lane, 0) + len(queue)
+            return lengths
+
+    def items(self, limit: Optional[int] = None) -> List[str]:
+        """The first limit (default every) queued sessions in the order agents serving all lanes
+        would take them; lanes are merged lazily, so O(limit log lanes) plus cancelled entries passed"""
+        with self._lock:
+            by_priority: Dict[int, List[Iterator[Tuple[int, str]]]] = {}
+            for (_, priority), queue in self._lanes.items():
+                if len(queue):
+                    by_priority.setdefault(priority, []).append(queue.iter_live())
+            ordered = (sid for priority in sorted(by_priority, reverse=True)
+                       for _, sid in heapq.merge(*by_priority[priority]))
+            return list(islice(ordered, limit))
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._where
+
+    def __len__(self) -> int:
+        return len(self._where)
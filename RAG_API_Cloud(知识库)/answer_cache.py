@@ -0,0 +1,268 @@
+"""
+Full-answer cache for non-stream chat
+Keys are the normalized query plus the IDs of the retrieved chunks, the model and the temperature,
+so an answer is reused only when the same question was answered from the same context. Entries
+expire after a TTL and the least recently used are evicted beyond max_entries. Sampled answers
+(temperature > 0) are not cached unless allow_sampled is set. With a path the entries live in a
+SQLite file and survive restarts; without one they stay in memory.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+from retrieval_cache import normalize_query
+
+
+def chunk_ids(result: Dict) -> List[str]:
+    """IDs of the chunks in a search_knowledge result, in rank order"""
+    return [str(point.get("point_id") or point.get("chunk_id") or point.get("id"))
+            for point in result.get("result_list") or []]
+
+
+def answer_key(query: str, ids: Sequence[str], model: str, temperature: float) -> str:
+    return hashlib.sha256(json.dumps([normalize_query(query), list(ids), model, float(temperature)],
+                                     ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _MemoryStore:
+    """key -> entry dict, least recently used first; the cache holds the lock"""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def touch(self, key: str, now: float):
+        self._entries[key]["hits"] += 1
+
+    def put(self, entry: Dict):
+        self._entries[entry["key"]] = entry
+        self._entries.move_to_end(entry["key"])
+
+    def delete(self, key: str) -> int:
+        return 1 if self._entries.pop(key, None) is not None else 0
+
+    def delete_query(self, query: str) -> int:
+        keys = [k for k, e in self._entries.items() if e["query"] == query]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+
+    def evict(self, max_entries: int) -> int:
+        evicted = 0
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def expire(self, now: float) -> int:
+        keys = [k for k, e in self._entries.items() if e["expires_at"] <= now]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def entries(self, limit: int, offset: int) -> List[Dict]:
+        # Most recently used first
+        return [dict(e) for e in list(reversed(self._entries.values()))[offset:offset + limit]]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        pass
+
+
+class _SQLiteStore:
+    """The same operations on a SQLite table (WAL), ordered by last use"""
+
+    _COLUMNS = ("key", "query", "model", "temperature", "chunk_ids", "answer", "created_at", "expires_at", "hits")
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS answers (
+            key TEXT PRIMARY KEY, query TEXT NOT NULL, model TEXT, temperature REAL, chunk_ids TEXT,
+            answer TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL,
+            last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_query ON answers (query)")
+
+    def _entry(self, row) -> Dict:
+        entry = dict(zip(self._COLUMNS, row))
+        entry["chunk_ids"] = json.loads(entry["chunk_ids"])
+        entry["answer"] = json.loads(entry["answer"])
+        return entry
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self._conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM answers WHERE key = ?", (key,)).fetchone()
+        return self._entry(row) if row else None
+
+    def touch(self, key: str, now: float):
+        self._conn.execute("UPDATE answers SET hits = hits + 1, last_used = ? WHERE key = ?", (now, key))
+
+    def put(self, entry: Dict):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO answers (key, query, model, temperature, chunk_ids, answer, created_at, "
+            "expires_at, last_used, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            (entry["key"], entry["query"], entry["model"], entry["temperature"], json.dumps(entry["chunk_ids"]),
+             json.dumps(entry["answer"], ensure_ascii=False), entry["created_at"], entry["expires_at"],
+             entry["created_at"]))
+
+    def delete(self, key: str) -> int:
+        return self._conn.execute("DELETE FROM answers WHERE key = ?", (key,)).rowcount
+
+    def delete_query(self, query: str) -> int:
+        return self._conn.execute("DELETE FROM answers WHERE query = ?", (query,)).rowcount
+
+    def clear(self) -> int:
+        return self._conn.execute("DELETE FROM answers").rowcount
+
+    def evict(self, max_entries: int) -> int:
+        excess = len(self) - max_entries
+        if excess <= 0:
+            return 0
+        return self._conn.execute("DELETE FROM answers WHERE key IN "
+                                  "(SELECT key FROM answers ORDER BY last_used LIMIT ?)", (excess,)).rowcount
+
+    def expire(self, now: float) -> int:
+        return self._conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,)).rowcount
+
+    def entries(self, limit: int, offset: int) -> List[Dict]:
+        cursor = self._conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM answers "
+                                    "ORDER BY last_used DESC LIMIT ? OFFSET ?", (limit, offset))
+        return [self._entry(row) for row in cursor]
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class AnswerCache:
+    """Thread-safe TTL + LRU cache of generated answers, in memory or in a SQLite file
+
+    Uses wall-clock time so TTLs keep counting across restarts of a disk-backed cache.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 3600.0, max_entries: int = 10000,
+                 allow_sampled: bool = False, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.allow_sampled = allow_sampled
+        self.clock = clock
+        self._store = _SQLiteStore(path) if path else _MemoryStore()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.purged = 0
+
+    def cacheable(self, temperature: float) -> bool:
+        return temperature == 0 or self.allow_sampled
+
+    def get(self, query: str, ids: Sequence[str], model: str, temperature: float):
+        """Cached answer, or None (also None, and counted as skipped, when the temperature is not cacheable)"""
+        if not self.cacheable(temperature):
+            with self._lock:
+                self.skipped += 1
+            return None
+        key = answer_key(query, ids, model, temperature)
+        now = self.clock()
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is not None and entry["expires_at"] <= now:
+                self._store.delete(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._store.touch(key, now)
+            self.hits += 1
+            return entry["answer"]
+
+    def put(self, query: str, ids: Sequence[str], model: str, temperature: float, answer) -> bool:
+        """Store a JSON-serializable answer; returns False when the temperature is not cacheable"""
+        if not self.cacheable(temperature):
+            return False
+        now = self.clock()
+        entry = {"key": answer_key(query, ids, model, temperature), "query": normalize_query(query),
+                 "model": model, "temperature": float(temperature), "chunk_ids": list(ids), "answer": answer,
+                 "created_at": now, "expires_at": now + self.ttl, "hits": 0}
+        with self._lock:
+            self._store.put(entry)
+            self.evictions += self._store.evict(self.max_entries)
+        return True
+
+    def get_or_generate(self, query: str, ids: Sequence[str], model: str, temperature: float,
+                        generate: Callable[[], object]):
+        """Cached answer, or generate() stored for next time; returns (answer, hit)"""
+        answer = self.get(query, ids, model, temperature)
+        if answer is not None:
+            return answer, True
+        answer = generate()
+        self.put(query, ids, model, temperature, answer)
+        return answer, False
+
+    def entries(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """Most recently used entries first, for the admin endpoint"""
+        with self._lock:
+            self.expirations += self._store.expire(self.clock())
+            return self._store.entries(limit, offset)
+
+    def purge(self, key: Optional[str] = None, query: Optional[str] = None) -> int:
+        """Drop one entry by key, every entry of a (normalized) query, or everything; returns the count"""
+        with self._lock:
+            if key is not None:
+                count = self._store.delete(key)
+            elif query is not None:
+                count = self._store.delete_query(normalize_query(query))
+            else:
+                count = self._store.clear()
+            self.purged += count
+            return count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "sqlite" if self.path else "memory",
+                "entries": len(self._store),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "allow_sampled": self.allow_sampled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "skipped_sampled": self.skipped,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "purged": self.purged,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._store)
+
+    def close(self):
+        with self._lock:
+            self._store.close()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Dashboard stats benchmark: scanning every session vs the store's status counters
+Fills a store with N sessions spread over the chat statuses, then times the status counts the
+dashboards used to compute (every record, three list comprehensions) against status_counts(),
+plus the cost the counters add to a status change (modify_session), with MemoryBackend and
+SQLiteBackend; prints milliseconds per call.
+Usage: python bench_admin_stats.py --sessions 100000 --reads 20
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from chat_metrics import ChatMetrics
+from session_backend import MemoryBackend, SQLiteBackend
+
+STATUSES = ["bot", "bot", "ended", "ended", "ended", "waiting_agent", "with_agent"]
+
+
+def scan_counts(store):
+    """As dashboard_stats did"""
+    statuses = [s['status'] for s in store.sessions()]
+    return {
+        'active_sessions': len([s for s in statuses if s in ['bot', 'waiting_agent', 'with_agent']]),
+        'waiting_sessions': len([s for s in statuses if s == 'waiting_agent']),
+        'agent_sessions': len([s for s in statuses if s == 'with_agent']),
+    }
+
+
+def counter_counts(store):
+    statuses = store.status_counts()
+    return {
+        'active_sessions': sum(statuses.get(s, 0) for s in ('bot', 'waiting_agent', 'with_agent')),
+        'waiting_sessions': statuses.get('waiting_agent', 0),
+        'agent_sessions': statuses.get('with_agent', 0),
+    }
+
+
+def timed_ms(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        result = fn()
+    return (time.perf_counter() - started) / calls * 1000, result
+
+
+def run(store, sessions, reads, seed=1):
+    rng = random.Random(seed)
+    for i in range(sessions):
+        store.create_session(f"s{i}", {"session_id": f"s{i}", "status": rng.choice(STATUSES), "agent_id": None})
+    scan_ms, scanned = timed_ms(lambda: scan_counts(store), reads)
+    counter_ms, counted = timed_ms(lambda: counter_counts(store), reads * 10)
+    assert scanned == counted
+    ids = [f"s{rng.randrange(sessions)}" for _ in range(2000)]
+    started = time.perf_counter()
+    for sid in ids:
+        store.modify_session(sid, lambda r: r.update(status=rng.choice(STATUSES)))
+    write_ms = (time.perf_counter() - started) / len(ids) * 1000
+    return scan_ms, counter_ms, write_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--reads", type=int, default=20, help="stats calls timed per variant")
+    parser.add_argument("--no-sqlite", action="store_true")
+    args = parser.parse_args(argv)
+
+    print(f"{args.sessions} sessions (ms per call)")
+    print(f"{'store':<8} {'scan':>10} {'counters':>10} {'status change':>14}")
+    variants = [("memory", MemoryBackend)]
+    if not args.no_sqlite:
+        tmp = tempfile.mkdtemp()
+        variants.append(("sqlite", lambda: SQLiteBackend(os.path.join(tmp, "sessions.db"))))
+    for label, factory in variants:
+        scan_ms, counter_ms, write_ms = run(factory(), args.sessions, args.reads)
+        print(f"{label:<8} {scan_ms:10.3f} {counter_ms:10.3f} {write_ms:14.3f}")
+
+    metrics = ChatMetrics()
+    for i in range(100000):
+        metrics.message("user" if i % 2 else "bot")
+        if i % 50 == 0:
+            metrics.handoff(i % 900)
+    snapshot_ms, _ = timed_ms(metrics.snapshot, 1000)
+    print(f"ChatMetrics.snapshot() after 100k messages: {snapshot_ms:.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Agent queue benchmark at incident scale
+Queues N sessions, looks up the position of random waiting customers (what /chat does on every
+message while waiting), cancels a share of them (customers who give up) and drains the rest
+(/agent/pickup), with the old list (append / index / remove / pop(0)), AgentQueue and the SQLite
+backend; prints microseconds per operation.
+Usage: python bench_agent_queue.py --sessions 100000 --lookups 2000 --cancel 0.1
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from agent_queue import VIP_PRIORITY, AgentQueue
+from session_backend import SQLiteBackend
+
+
+class ListQueue:
+    """The queue as the apps used to keep it"""
+
+    def __init__(self):
+        self.items = []
+
+    def enqueue(self, session_id, lane=None, priority=0):
+        # As enhanced_chatbot_with_agent.py did; step6 also scanned for duplicates, O(n) per enqueue
+        self.items.append(session_id)
+        return len(self.items)
+
+    def position(self, session_id):
+        return self.items.index(session_id) + 1 if session_id in self.items else 0
+
+    def cancel(self, session_id):
+        if session_id in self.items:
+            self.items.remove(session_id)
+            return True
+        return False
+
+    def dequeue(self, lanes=None):
+        return self.items.pop(0) if self.items else None
+
+
+class BackendQueue:
+    """SessionBackend queue methods under the AgentQueue names"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.enqueue = backend.enqueue
+        self.position = backend.queue_position
+        self.cancel = backend.remove_from_queue
+        self.dequeue = backend.dequeue
+
+
+def timed(fn, args):
+    started = time.perf_counter()
+    for a in args:
+        fn(*a)
+    return (time.perf_counter() - started) / max(len(args), 1) * 1e6
+
+
+def run(queue, sessions, lookups, cancel, seed=1):
+    rng = random.Random(seed)
+    ids = [f"session-{i}" for i in range(sessions)]
+    lanes = ["default", "default", "default", "es", "billing"]
+    enqueues = [(sid, rng.choice(lanes), VIP_PRIORITY if rng.random() < 0.05 else 0) for sid in ids]
+    cancels = [(sid,) for sid in rng.sample(ids, int(sessions * cancel))]
+    positions = [(sid,) for sid in rng.sample(ids, lookups)]
+    result = {"enqueue": timed(queue.enqueue, enqueues), "position": timed(queue.position, positions),
+              "cancel": timed(queue.cancel, cancels)}
+    remaining = sessions - len(cancels)
+    result["dequeue"] = timed(queue.dequeue, [()] * remaining)
+    assert queue.dequeue() is None
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=2000, help="position lookups of random queued sessions")
+    parser.add_argument("--cancel", type=float, default=0.1, help="share of queued sessions that give up")
+    parser.add_argument("--no-sqlite", action="store_true")
+    args = parser.parse_args(argv)
+
+    print(f"{args.sessions} queued sessions, {args.lookups} position lookups, {args.cancel:.0%} cancelled "
+          "(us per operation)")
+    print(f"{'queue':<12} {'enqueue':>10} {'position':>10} {'cancel':>10} {'dequeue':>10}")
+    variants = [("list", ListQueue), ("AgentQueue", AgentQueue)]
+    if not args.no_sqlite:
+        tmp = tempfile.mkdtemp()
+        variants.append(("sqlite", lambda: BackendQueue(SQLiteBackend(os.path.join(tmp, "queue.db")))))
+    for label, factory in variants:
+        r = run(factory(), args.sessions, args.lookups, args.cancel)
+        print(f"{label:<12} {r['enqueue']:10.2f} {r['position']:10.2f} {r['cancel']:10.2f} {r['dequeue']:10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Push vs poll benchmark for the chat message channels
+Runs one stream() generator per connection (a thread each, as under the threaded dev server or
+gunicorn gthread), spread over several session channels, publishes messages at a fixed rate and
+reports delivery latency, bytes sent and CPU; then prices the polling the pages used to do (the
+full message list every poll interval) for the same connections, history and duration.
+Usage: python bench_event_hub.py --connections 2000 --channels 200 --messages 400 --rate 100 --history 50
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from datetime import datetime
+
+from event_hub import EventHub, stream
+
+
+def message(seq: int, channel: int) -> dict:
+    return {"id": f"{channel}-{seq}", "sender": "Agent", "content": "Thanks for waiting, let me check that order for you.",
+            "sender_type": "agent", "timestamp": datetime.now().isoformat(), "seq": seq}
+
+
+def run_push(connections, channels, messages, rate):
+    hub = EventHub()
+    latencies, sent_bytes = [], [0]
+    lock = threading.Lock()
+    ready = threading.Barrier(connections + 1)
+    done = threading.Event()
+
+    def connection(index):
+        events = stream(hub, f"session:{index % channels}", lambda after: [], heartbeat=1.0)
+        mine, size = [], 0
+        next(events)
+        ready.wait()
+        for text in events:
+            size += len(text)
+            if text.startswith("id:"):
+                payload = json.loads(text.split("data: ", 1)[1])
+                mine.append(time.perf_counter() - payload["sent"])
+            elif done.is_set():
+                break
+        events.close()
+        with lock:
+            latencies.extend(mine)
+            sent_bytes[0] += size
+
+    threads = [threading.Thread(target=connection, args=(i,), daemon=True) for i in range(connections)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    cpu, started = time.process_time(), time.perf_counter()
+    for seq in range(1, messages + 1):
+        data = {**message(seq, seq % channels), "sent": time.perf_counter()}
+        hub.publish(f"session:{seq % channels}", "message", data, event_id=seq)
+        time.sleep(max(0.0, started + seq / rate - time.perf_counter()))
+    time.sleep(0.5)
+    done.set()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return {"seconds": time.perf_counter() - started, "cpu": time.process_time() - cpu, "bytes": sent_bytes[0],
+            "delivered": len(latencies), "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0}
+
+
+def price_polling(connections, history, interval, seconds):
+    """Bytes and CPU of polls returning the full message list, measured on one response"""
+    body = {"messages": [message(seq, 0) for seq in range(history)], "status": "with_agent", "agent_id": "a1"}
+    started = time.process_time()
+    for _ in range(200):
+        size = len(json.dumps(body))
+    cpu_per_poll = (time.process_time() - started) / 200
+    polls = connections * seconds / interval
+    return {"polls": polls, "bytes": polls * size, "cpu": polls * cpu_per_poll}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=200, help="sessions the connections are spread over")
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=100.0, help="messages per second")
+    parser.add_argument("--history", type=int, default=50, help="messages already in each session")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="what the pages polled at")
+    args = parser.parse_args(argv)
+
+    threading.stack_size(256 << 10)
+    push = run_push(args.connections, args.channels, args.messages, args.rate)
+    poll = price_polling(args.connections, args.history, args.poll_interval, push["seconds"])
+    print(f"{args.connections} connections over {args.channels} sessions, {args.messages} messages at "
+          f"{args.rate:.0f}/s ({push['seconds']:.1f} s), {args.history} messages of history")
+    print(f"push: {push['delivered']} deliveries, latency p50 {push['p50_ms']:.2f} ms p95 {push['p95_ms']:.2f} ms, "
+          f"{push['bytes'] / 1e6:.2f} MB, {push['cpu']:.2f} s CPU")
+    print(f"poll every {args.poll_interval:g} s: {poll['polls']:.0f} requests, {poll['bytes'] / 1e6:.2f} MB, "
+          f"{poll['cpu']:.2f} s CPU for the JSON alone (plus a request per poll)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
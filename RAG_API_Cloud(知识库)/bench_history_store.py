@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark: ChatbotGenerator-style conversation history for many sessions
+Each variant runs in its own process and reports the process RSS after storing --sessions sessions
+of --turns turns: the old dict of lists of dicts with ISO timestamps, BoundedHistoryStore with no
+budget, and BoundedHistoryStore with --budget-mb (least recently used sessions evicted).
+Usage: python bench_history_store.py --sessions 1000000 --turns 2 --budget-mb 256
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from history_store import BoundedHistoryStore, Turn
+
+VARIANTS = ("dict", "store", "store-budget")
+QUESTIONS = ["Hello there", "How long do refunds take?", "What can you do?", "Can I talk to a human?"]
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux /proc), else peak RSS from getrusage"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_variant(variant: str, sessions: int, turns: int, budget_mb: float) -> dict:
+    gc.collect()
+    baseline = rss_mb()
+    started = time.perf_counter()
+    if variant == "dict":
+        history = {}
+    else:
+        budget = int(budget_mb * (1 << 20)) if variant == "store-budget" else 1 << 62
+        history = BoundedHistoryStore(max_turns=50, idle_ttl=1e9, memory_budget=budget)
+    for i in range(sessions):
+        session_id = str(uuid.uuid4())
+        for t in range(turns):
+            # Distinct strings per turn, as real messages would be
+            user = f"{QUESTIONS[(i + t) % len(QUESTIONS)]} #{i}"
+            assistant = f"I understand you said: '{user}'. This is a demo chatbot."
+            if variant == "dict":
+                history.setdefault(session_id, []).append({
+                    "user": user, "assistant": assistant,
+                    "timestamp": datetime.now().isoformat(), "mode": "simple"})
+            else:
+                history.append(session_id, Turn(user, assistant, mode="simple"))
+    seconds = time.perf_counter() - started
+    gc.collect()
+    result = {"variant": variant, "sessions_kept": len(history), "rss_mb": round(rss_mb() - baseline, 1),
+              "seconds": round(seconds, 2)}
+    if variant != "dict":
+        result["estimated_mb"] = round(history.stats()["estimated_bytes"] / (1 << 20), 1)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RSS of session history for many sessions")
+    parser.add_argument("--sessions", type=int, default=1000000)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--budget-mb", type=float, default=256.0)
+    parser.add_argument("--variant", choices=VARIANTS, help="run one variant in this process (used internally)")
+    args = parser.parse_args(argv)
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.sessions, args.turns, args.budget_mb)))
+        return 0
+    print(f"{args.sessions} sessions x {args.turns} turns, budget {args.budget_mb} MB")
+    print(f"{'variant':<14} {'kept':>9} {'RSS MB':>8} {'est. MB':>8} {'seconds':>8}")
+    for variant in VARIANTS:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--variant", variant,
+                                 "--sessions", str(args.sessions), "--turns", str(args.turns),
+                                 "--budget-mb", str(args.budget_mb)],
+                                check=True, capture_output=True, text=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        estimated = f"{r['estimated_mb']:.1f}" if "estimated_mb" in r else "-"
+        print(f"{r['variant']:<14} {r['sessions_kept']:>9} {r['rss_mb']:>8.1f} {estimated:>8} {r['seconds']:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark: per-call prepare_request() style vs KnowledgeBaseClient against the local stub
+Usage: python bench_kb_client.py [queries] [concurrency] [stub latency ms]
+"""
+
+import datetime
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from kb_client import CONTENT_TYPE, REGION, SEARCH_PATH, SERVICE, KnowledgeBaseClient
+from kb_stub_server import KnowledgeBaseStub
+from signer import Signer
+
+AK, SK = "AKBENCH", "SKBENCH"
+QUESTIONS = ["what does the LLM firewall block", "how long do refunds take", "how to enable rerank",
+             "reset my password", "what is dense_weight"]
+
+
+def legacy_search(domain, query):
+    """What prepare_request() + requests.request() did: new signer state and a new connection per call"""
+    body = json.dumps({"project": "", "name": "test", "query": query, "limit": 5,
+                       "pre_processing": {"need_instruction": False, "rewrite": False, "return_token_usage": False},
+                       "dense_weight": 0.5, "post_processing": {"chunk_group": True, "rerank_switch": False}})
+    headers = Signer(SERVICE, REGION, domain, CONTENT_TYPE).sign("POST", datetime.datetime.utcnow(), {}, AK, SK,
+                                                                   body, path=SEARCH_PATH)
+    headers.update({"Accept": "application/json", "V-Account-Id": "bench"})
+    return requests.request("POST", f"http://{domain}{SEARCH_PATH}", headers=headers, data=body).json()
+
+
+def timed(fn, queries, concurrency):
+    latencies = []
+
+    def one(q):
+        started = time.perf_counter()
+        fn(q)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        for q in queries:
+            one(q)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, queries))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {"qps": len(queries) / elapsed, "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000}
+
+
+def run(n, concurrency, latency_ms):
+    stub = KnowledgeBaseStub({AK: SK}, latency=latency_ms / 1000).start_in_thread()
+    queries = [QUESTIONS[i % len(QUESTIONS)] for i in range(n)]
+    try:
+        kb = KnowledgeBaseClient(AK, SK, "bench", domain=stub.address, collection="test", scheme="http",
+                                 pool_maxsize=concurrency)
+        kb_search = lambda q: kb.search_knowledge(q, limit=5)  # noqa: E731
+        legacy = lambda q: legacy_search(stub.address, q)  # noqa: E731
+        for label, fn, c in [("prepare_request, sequential", legacy, 1),
+                             ("KnowledgeBaseClient, sequential", kb_search, 1),
+                             (f"prepare_request, {concurrency} threads", legacy, concurrency),
+                             (f"KnowledgeBaseClient, {concurrency} threads", kb_search, concurrency)]:
+            r = timed(fn, queries, c)
+            print(f"{label:<36} {r['qps']:8.0f} q/s  p50 {r['p50_ms']:6.2f} ms  p95 {r['p95_ms']:6.2f} ms")
+        print("connections:", kb.connection_stats())
+    finally:
+        stub.stop_thread()
+    assert stub.signature_failures == 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(int(args[0]) if args else 1000, int(args[1]) if len(args) > 1 else 8,
+        float(args[2]) if len(args) > 2 else 0.0)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded conversation log against the local KB stub and compare time-to-first-token
+  sequential: bookkeeping, then search_knowledge, then non-stream chat/completions (the old /chat)
+  pipelined:  retrieval started before bookkeeping, streamed completion
+  pipelined + cache + prefetch: as above, with follow-up queries searched in the background
+The log is JSONL with one {"session": ..., "query": ...} per user turn, in order.
+Usage: python bench_rag_pipeline.py [--log conversation_log_sample.jsonl] [--search-ms 40] [--answer-ms 120]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from kb_client import KnowledgeBaseClient
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+from rag_pipeline import RAGPipeline, join_context
+from retrieval_cache import RetrievalCache, ngram_embedding
+
+AK, SK = "AKBENCH", "SKBENCH"
+PROMPT = "# Task\nAnswer from the context.\n<context>\n{}\n</context>\n"
+
+
+def load_sessions(path):
+    sessions = OrderedDict()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                turn = json.loads(line)
+                sessions.setdefault(turn["session"], []).append(turn["query"])
+    return list(sessions.values())
+
+
+def replay(sessions, turn_fn, think_time, concurrency):
+    """Run each session's turns in order (sessions in parallel); returns [(ttft, total)]"""
+    def run_session(queries):
+        timings = []
+        for i, query in enumerate(queries):
+            started = time.perf_counter()
+            ttft = turn_fn(query, queries[:i + 1], started)
+            timings.append((ttft, time.perf_counter() - started))
+            time.sleep(think_time)
+        return timings
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return [t for timings in pool.map(run_session, sessions) for t in timings]
+
+
+def summarize(label, timings):
+    ttft = sorted(t[0] * 1000 for t in timings)
+    total = sorted(t[1] * 1000 for t in timings)
+    p95 = lambda values: values[max(0, int(len(values) * 0.95) - 1)]  # noqa: E731
+    print(f"{label:<32} TTFT p50 {statistics.median(ttft):7.1f} ms  p95 {p95(ttft):7.1f} ms   "
+          f"total p50 {statistics.median(total):7.1f} ms  p95 {p95(total):7.1f} ms")
+
+
+def main(args):
+    sessions = load_sessions(args.log)
+    stub = KnowledgeBaseStub({AK: SK}, latency=args.search_ms / 1000, answer_latency=args.answer_ms / 1000,
+                             stream_interval=args.token_ms / 1000).start_in_thread()
+    bookkeeping = args.bookkeeping_ms / 1000
+
+    def client(cache=None):
+        return KnowledgeBaseClient(credentials=StaticCredentialProvider(AK, SK), domain=stub.address,
+                                   collection="test", scheme="http", cache=cache, invalidation_dir=None,
+                                   pool_maxsize=32)
+
+    try:
+        kb = client()
+
+        def sequential(query, history, started):
+            time.sleep(bookkeeping)
+            context = join_context(kb.search_knowledge(query, limit=5))
+            kb.chat_completions([{"role": "system", "content": PROMPT.format(context)},
+                                 {"role": "user", "content": query}])
+            return time.perf_counter() - started
+
+        def pipelined_turn(pipeline):
+            def turn(query, history, started):
+                retrieval = pipeline.retrieve(query)
+                time.sleep(bookkeeping)
+                ttft = None
+                for _ in pipeline.stream(query, retrieval):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                pipeline.prefetch(history, retrieval)
+                return ttft
+            return turn
+
+        plain = RAGPipeline(client(), PROMPT, search_options={"limit": 5})
+        cached_kb = client(RetrievalCache(embed=ngram_embedding, similarity_threshold=0.9, invalidation_dir=None))
+        prefetching = RAGPipeline(cached_kb, PROMPT, search_options={"limit": 5})
+
+        think = args.think_ms / 1000
+        summarize("sequential (old /chat)", replay(sessions, sequential, think, args.concurrency))
+        summarize("pipelined", replay(sessions, pipelined_turn(plain), think, args.concurrency))
+        summarize("pipelined + cache + prefetch", replay(sessions, pipelined_turn(prefetching), think,
+                                                         args.concurrency))
+        print(f"turns: {sum(len(s) for s in sessions)} in {len(sessions)} sessions, "
+              f"prefetches: {prefetching.prefetches}, cache: {cached_kb.cache.stats()}")
+        plain.close()
+        prefetching.close()
+    finally:
+        stub.stop_thread()
+    assert stub.signature_failures == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a conversation log against the KB stub")
+    parser.add_argument("--log", default="conversation_log_sample.jsonl")
+    parser.add_argument("--search-ms", type=float, default=40.0, help="stub latency of every call")
+    parser.add_argument("--answer-ms", type=float, default=120.0, help="extra latency before the first token")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="delay between streamed tokens")
+    parser.add_argument("--bookkeeping-ms", type=float, default=15.0, help="validation / session work per turn")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="pause between a session's turns")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions replayed in parallel")
+    main(parser.parse_args())
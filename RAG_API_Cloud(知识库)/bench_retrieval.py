@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality and latency sweep over the search_knowledge parameters
+Runs a labeled query set ({"query": ..., "relevant": [point_id or doc_id, ...]} per line) for every
+combination of limit, dense_weight, rerank_switch, chunk_diffusion_count and need_instruction, and
+reports recall@k, MRR, latency percentiles and token usage (embedding, rerank, prompt context).
+--record saves every response so --replay can rerun the sweep offline (e.g. in CI) with the
+recorded latencies; --stub runs against the local kb_stub_server.
+Usage: python bench_retrieval.py --queries retrieval_queries_sample.jsonl --stub --record responses.jsonl
+       python bench_retrieval.py --queries retrieval_queries_sample.jsonl --replay responses.jsonl
+       python bench_retrieval.py --queries q.jsonl --ak youak --sk yoursk --collection test --limit 5,10,20
+"""
+
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from kb_client import DEFAULT_DOMAIN, KnowledgeBaseClient, KnowledgeBaseError
+from context_assembler import estimate_tokens, format_point
+from credentials import EnvironmentCredentialProvider, StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+
+PARAMETERS = ("limit", "dense_weight", "rerank_switch", "chunk_diffusion_count", "need_instruction")
+
+
+def load_queries(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def param_grid(limits: Sequence[int], dense_weights: Sequence[float], rerank: Sequence[bool],
+               diffusion: Sequence[int], need_instruction: Sequence[bool]) -> List[Dict]:
+    return [dict(zip(PARAMETERS, values))
+            for values in itertools.product(limits, dense_weights, rerank, diffusion, need_instruction)]
+
+
+def response_key(query: str, params: Dict) -> str:
+    return json.dumps({"query": query, **params}, sort_keys=True)
+
+
+class LiveSearch:
+    """search_knowledge against a KnowledgeBaseClient (without a cache), timed"""
+
+    def __init__(self, kb: KnowledgeBaseClient):
+        self.kb = kb
+
+    def __call__(self, query: str, params: Dict) -> Tuple[Dict, float]:
+        started = time.perf_counter()
+        data = self.kb.search_knowledge(query, return_token_usage=True, **params)
+        return data, time.perf_counter() - started
+
+
+class RecordingSearch:
+    """Wraps a search and appends every response and its latency to a JSONL file"""
+
+    def __init__(self, search, path: str):
+        self.search = search
+        self._file = open(path, "w", encoding="utf-8")
+
+    def __call__(self, query: str, params: Dict) -> Tuple[Dict, float]:
+        data, seconds = self.search(query, params)
+        self._file.write(json.dumps({"key": response_key(query, params), "data": data, "seconds": seconds},
+                                    ensure_ascii=False) + "\n")
+        return data, seconds
+
+    def close(self):
+        self._file.close()
+
+
+class ReplaySearch:
+    """Serves responses recorded by RecordingSearch; no network"""
+
+    def __init__(self, path: str):
+        self.responses = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[record["key"]] = (record["data"], record["seconds"])
+
+    def __call__(self, query: str, params: Dict) -> Tuple[Dict, float]:
+        try:
+            return self.responses[response_key(query, params)]
+        except KeyError:
+            raise KeyError(f"no recorded response for {query!r} with {params}; record the sweep again") from None
+
+
+def rank_of_first_relevant(results: List[Dict], relevant: set) -> Optional[int]:
+    for rank, point in enumerate(results, 1):
+        if _ids(point) & relevant:
+            return rank
+    return None
+
+
+def _ids(point: Dict) -> set:
+    return {point.get("point_id"), point.get("id"), (point.get("doc_info") or {}).get("doc_id")} - {None}
+
+
+def recall_at(results: List[Dict], relevant: set, k: int) -> float:
+    found = set()
+    for point in results[:k]:
+        found |= _ids(point) & relevant
+    return len(found) / len(relevant) if relevant else 0.0
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def evaluate(search, queries: List[Dict], params: Dict, ks: Sequence[int]) -> Dict:
+    """Metrics of one parameter combination over the query set"""
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks, latencies, embedding, rerank, context = [], [], [], [], []
+    errors = 0
+    for item in queries:
+        relevant = set(item["relevant"])
+        try:
+            data, seconds = search(item["query"], params)
+        except KnowledgeBaseError:
+            errors += 1
+            continue
+        results = data.get("result_list") or []
+        for k in ks:
+            recalls[k].append(recall_at(results, relevant, k))
+        rank = rank_of_first_relevant(results, relevant)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        latencies.append(seconds * 1000)
+        usage = data.get("token_usage") or {}
+        embedding.append((usage.get("embedding_token_usage") or {}).get("prompt_tokens", 0))
+        rerank.append(usage.get("rerank_token_usage") or 0)
+        context.append(estimate_tokens("".join(format_point(point) for point in results)))
+    mean = lambda values: round(statistics.mean(values), 4) if values else 0.0  # noqa: E731
+    return {
+        **params,
+        **{f"recall@{k}": mean(recalls[k]) for k in ks},
+        "mrr": mean(reciprocal_ranks),
+        "p50_ms": round(_percentile(latencies, 0.5), 1) if latencies else None,
+        "p95_ms": round(_percentile(latencies, 0.95), 1) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 0.99), 1) if latencies else None,
+        "embedding_tokens": mean(embedding),
+        "rerank_tokens": mean(rerank),
+        "context_tokens": mean(context),
+        "errors": errors,
+    }
+
+
+def sweep(search, queries: List[Dict], grid: List[Dict], ks: Sequence[int]) -> List[Dict]:
+    """Every combination, best MRR first"""
+    rows = [evaluate(search, queries, params, ks) for params in grid]
+    return sorted(rows, key=lambda row: (-row["mrr"], -row[f"recall@{ks[-1]}"], row["p50_ms"] or 0))
+
+
+def print_table(rows: List[Dict], ks: Sequence[int], out=sys.stdout):
+    header = (f"{'limit':>5} {'dense':>5} {'rerank':>6} {'diff':>4} {'instr':>5} "
+              + " ".join(f"{'R@' + str(k):>6}" for k in ks)
+              + f" {'MRR':>6} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'emb':>5} {'rerank':>7} {'ctx':>6} {'err':>3}")
+    print(header, file=out)
+    for row in rows:
+        print(f"{row['limit']:>5} {row['dense_weight']:>5} {int(row['rerank_switch']):>6} "
+              f"{row['chunk_diffusion_count']:>4} {int(row['need_instruction']):>5} "
+              + " ".join(f"{row[f'recall@{k}']:>6.3f}" for k in ks)
+              + f" {row['mrr']:>6.3f} {row['p50_ms'] or 0:>7.1f} {row['p95_ms'] or 0:>7.1f} {row['p99_ms'] or 0:>7.1f}"
+              f" {row['embedding_tokens']:>5.1f} {row['rerank_tokens']:>7.1f} {row['context_tokens']:>6.0f}"
+              f" {row['errors']:>3}", file=out)
+
+
+def _list(cast):
+    return lambda text: [cast(value) for value in text.split(",")]
+
+
+def _flag(text: str) -> bool:
+    return text.lower() in ("1", "true", "yes", "on")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="search_knowledge parameter sweep: recall, MRR, latency, tokens")
+    parser.add_argument("--queries", required=True, help="JSONL of {query, relevant: [point_id or doc_id]}")
+    parser.add_argument("--limit", type=_list(int), default=[5, 10])
+    parser.add_argument("--dense-weight", type=_list(float), default=[0.0, 0.5, 1.0])
+    parser.add_argument("--rerank", type=_list(_flag), default=[False, True])
+    parser.add_argument("--diffusion", type=_list(int), default=[0, 1])
+    parser.add_argument("--need-instruction", type=_list(_flag), default=[False, True])
+    parser.add_argument("--k", type=_list(int), default=[1, 3, 5])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--replay", help="JSONL recorded with --record; no network")
+    source.add_argument("--stub", action="store_true", help="run against a local kb_stub_server")
+    parser.add_argument("--record", help="save every response to this JSONL for --replay")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--stub-rerank-ms", type=float, default=30.0)
+    parser.add_argument("--collection", default="test")
+    parser.add_argument("--project", default="")
+    parser.add_argument("--domain", default=DEFAULT_DOMAIN)
+    parser.add_argument("--account-id", default="")
+    parser.add_argument("--ak")
+    parser.add_argument("--sk")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    queries = load_queries(args.queries)
+    grid = param_grid(args.limit, args.dense_weight, args.rerank, args.diffusion, args.need_instruction)
+    stub = kb = None
+    if args.replay:
+        search = ReplaySearch(args.replay)
+    else:
+        if args.stub:
+            stub = KnowledgeBaseStub({"AKBENCH": "SKBENCH"}, latency=args.stub_latency_ms / 1000,
+                                     rerank_latency=args.stub_rerank_ms / 1000, seed=1).start_in_thread()
+            kb = KnowledgeBaseClient("AKBENCH", "SKBENCH", domain=stub.address, collection=args.collection,
+                                     scheme="http", invalidation_dir=None)
+        else:
+            credentials = StaticCredentialProvider(args.ak, args.sk) if args.ak else EnvironmentCredentialProvider()
+            kb = KnowledgeBaseClient(account_id=args.account_id, domain=args.domain, project=args.project,
+                                     collection=args.collection, credentials=credentials, invalidation_dir=None)
+        search = LiveSearch(kb)
+        if args.record:
+            search = RecordingSearch(search, args.record)
+    try:
+        rows = sweep(search, queries, grid, args.k)
+    finally:
+        if isinstance(search, RecordingSearch):
+            search.close()
+        if kb is not None:
+            kb.close()
+        if stub is not None:
+            stub.stop_thread()
+    print(f"{len(queries)} queries x {len(grid)} parameter combinations, best MRR first")
+    print_table(rows, args.k)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"queries": len(queries), "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
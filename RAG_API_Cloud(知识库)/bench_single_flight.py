@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Burst benchmark for single-flight coalescing against the local stub
+Many threads ask a few popular questions at once, with and without SingleFlight (no result
+cache, so every uncoalesced search goes upstream); prints upstream calls, QPS and latency.
+Usage: python bench_single_flight.py [requests] [threads] [distinct questions] [stub latency ms]
+"""
+
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kb_client import SEARCH_PATH, KnowledgeBaseClient
+from kb_stub_server import KnowledgeBaseStub
+from single_flight import SingleFlight
+
+AK, SK = "AKBENCH", "SKBENCH"
+QUESTIONS = ["how long do refunds take", "what does the LLM firewall block", "how to enable rerank",
+             "reset my password", "what is dense_weight", "which file types can I upload"]
+
+
+def burst(kb, queries, threads):
+    latencies = []
+
+    def one(q):
+        started = time.perf_counter()
+        kb.search_knowledge(q, limit=5)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {"seconds": elapsed, "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000}
+
+
+def run(n, threads, distinct, latency_ms):
+    queries = [QUESTIONS[i % distinct] for i in range(n)]
+    print(f"{n} searches, {threads} threads, {distinct} distinct questions, stub latency {latency_ms} ms")
+    for label, flight in (("direct", None), ("single-flight", SingleFlight(timeout=10))):
+        stub = KnowledgeBaseStub({AK: SK}, latency=latency_ms / 1000).start_in_thread()
+        kb = KnowledgeBaseClient(AK, SK, "bench", domain=stub.address, collection="test", scheme="http",
+                                 pool_maxsize=threads, invalidation_dir=None, single_flight=flight)
+        try:
+            r = burst(kb, queries, threads)
+        finally:
+            kb.close()
+            stub.stop_thread()
+        upstream = stub.paths.get(SEARCH_PATH, 0)
+        print(f"{label:<14} upstream {upstream:6d} calls ({upstream / r['seconds']:7.0f}/s)  "
+              f"p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms")
+        if flight is not None:
+            print("coalescing:", flight.stats()["calls"]["search_knowledge"])
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(int(args[0]) if args else 2000, int(args[1]) if len(args) > 1 else 64,
+        int(args[2]) if len(args) > 2 else 3, float(args[3]) if len(args) > 3 else 50.0)
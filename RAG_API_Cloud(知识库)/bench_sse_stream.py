@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Per-event CPU and tokens/sec of the /chat/stream re-framing loop
+  print + json:   the original loop (print each line, iter_lines str decode, json.loads, json.dumps)
+  iter_lines:     kb.chat_completions_stream() + json.dumps of the OpenAI chunk
+  decoder:        SSEDecoder + extract_delta + openai_frame on the raw bytes (kb.chat_completions_deltas)
+CPU is measured offline on a recorded byte stream; tokens/sec end to end against the stub.
+Usage: python bench_sse_stream.py [events] [stub tokens]
+"""
+
+import io
+import json
+import os
+import sys
+import time
+
+import requests
+
+from kb_client import KnowledgeBaseClient
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+from sse_stream import DONE_FRAME, SSEDecoder, extract_delta, openai_frame
+
+AK, SK = "AKBENCH", "SKBENCH"
+WORDS = ["The ", "firewall ", "inspects ", "prompts ", "和 ", "responses ", "to ", "block ", "injection. "]
+
+
+def recorded_stream(events):
+    lines = []
+    for i in range(events):
+        event = {"code": 0, "message": "success", "data": {"generated_answer": WORDS[i % len(WORDS)], "end": False}}
+        lines.append(b"data:" + json.dumps(event).encode("utf-8") + b"\n\n")
+    end = {"code": 0, "message": "success", "data": {"generated_answer": "", "end": True, "usage": "{}"}}
+    lines.append(b"data:" + json.dumps(end).encode("utf-8") + b"\n\n")
+    return b"".join(lines)
+
+
+def response(stream):
+    rsp = requests.Response()
+    rsp.raw = io.BytesIO(stream)
+    rsp.status_code = 200
+    rsp.encoding = "utf-8"
+    return rsp
+
+
+def print_json_loop(stream, out):
+    for line in response(stream).iter_lines(decode_unicode=True):
+        print(line, file=out)
+        if line and line.startswith("data:"):
+            data = json.loads(line[len("data:"):].strip()).get("data") or {}
+            answer = data.get("generated_answer", "")
+            if answer:
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': answer}}]})}\n\n"
+            if data.get("end"):
+                break
+    yield "data: [DONE]\n\n"
+
+
+def iter_lines_loop(stream, out):
+    for line in response(stream).iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = json.loads(line[len("data:"):].strip()).get("data") or {}
+        answer = data.get("generated_answer", "")
+        if answer:
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': answer}}]})}\n\n"
+        if data.get("end"):
+            break
+    yield "data: [DONE]\n\n"
+
+
+def decoder_loop(stream, out):
+    decoder = SSEDecoder()
+    raw = io.BytesIO(stream)
+    for chunk in iter(lambda: raw.read(512), b""):
+        for payload in decoder.feed(chunk):
+            answer, end, _ = extract_delta(payload)
+            if answer:
+                yield openai_frame(answer)
+            if end:
+                yield DONE_FRAME
+                return
+
+
+def cpu(loop, stream, events, out, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        frames = sum(1 for _ in loop(stream, out))
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    assert frames == events + 1
+    return best
+
+
+def main(events, stub_tokens):
+    stream = recorded_stream(events)
+    with open(os.devnull, "w") as out:
+        print(f"CPU over {events} recorded events (best of 5):")
+        for label, loop in [("print + json", print_json_loop), ("iter_lines", iter_lines_loop),
+                            ("decoder", decoder_loop)]:
+            seconds = cpu(loop, stream, events, out)
+            print(f"  {label:<14} {seconds / events * 1e6:7.2f} us/event  {events / seconds:12,.0f} events/s")
+
+    answer = "".join(WORDS[i % len(WORDS)] for i in range(stub_tokens))
+    stub = KnowledgeBaseStub({AK: SK}, documents={"bench": {"doc_name": "Bench", "doc_type": "txt",
+                                                            "chunks": [answer]}}).start_in_thread()
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider(AK, SK), domain=stub.address,
+                             collection="test", scheme="http", invalidation_dir=None)
+    messages = [{"role": "system", "content": answer}, {"role": "user", "content": answer}]
+    try:
+        print(f"End to end against the stub, {stub_tokens + 4}-token answers:")
+        for label, deltas in [
+            ("iter_lines", lambda: (d.get("generated_answer", "") for d in kb.chat_completions_stream(messages))),
+            ("decoder", lambda: kb.chat_completions_deltas(messages)),
+            ("decoder 20 ms", lambda: kb.chat_completions_deltas(messages, coalesce_window=0.02)),
+        ]:
+            started, cpu_started, tokens, frames = time.perf_counter(), time.process_time(), 0, 0
+            for _ in range(5):
+                for delta in deltas():
+                    if delta:
+                        tokens += len(delta.split())
+                        frames += 1
+            wall, cpu_seconds = time.perf_counter() - started, time.process_time() - cpu_started
+            print(f"  {label:<14} {tokens / wall:10,.0f} tokens/s  {frames // 5:6} frames/answer  "
+                  f"{cpu_seconds / tokens * 1e6:6.1f} us CPU/token (client + stub)")
+    finally:
+        stub.stop_thread()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000, int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Bulk, resumable document ingestion into a knowledge-base collection
+Reads a CSV / JSONL manifest (doc_id, doc_name, doc_type, url, any other column is passed to doc/add)
+or lists a directory that is served under --url-prefix, submits doc/add concurrently under a request
+rate limit, polls doc/info until every document is processed, and records each document's state in
+a SQLite journal so an interrupted run resumes where it stopped.
+Usage: python bulk_ingest.py --manifest docs.csv --collection test --rps 10 --workers 8
+       python bulk_ingest.py --dir ./pdfs --url-prefix https://bucket.example.com/pdfs/ --collection test
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import quote
+
+import requests
+
+from kb_client import DEFAULT_DOMAIN, KnowledgeBaseClient, KnowledgeBaseError
+from credentials import EnvironmentCredentialProvider, StaticCredentialProvider
+from retrieval_cache import notify_invalidation
+
+logger = logging.getLogger(__name__)
+
+# Journal states; "failed" rows keep the stage (submit / process) and the error
+PENDING, SUBMITTED, DONE, FAILED = "pending", "submitted", "done", "failed"
+DOC_EXISTS = 1001001
+DOC_NOT_FOUND = 1001002
+DOC_TYPES = {"pdf", "doc", "docx", "txt", "md", "markdown", "pptx", "xlsx", "csv", "jsonl", "html", "faq.xlsx"}
+
+
+def read_manifest(path: str) -> Iterator[Dict]:
+    """Documents from a .csv (header row) or .jsonl manifest; url is required"""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = (json.loads(line) for line in f if line.strip()) if path.endswith(".jsonl") else csv.DictReader(f)
+        for row in rows:
+            row = {k: v for k, v in row.items() if v not in (None, "")}
+            url = row["url"]
+            name = url.rstrip("/").rsplit("/", 1)[-1]
+            row.setdefault("doc_id", make_doc_id(name))
+            row.setdefault("doc_name", name)
+            row.setdefault("doc_type", _doc_type(name))
+            yield row
+
+
+def list_directory(directory: str, url_prefix: str, doc_types: Iterable[str] = DOC_TYPES) -> Iterator[Dict]:
+    """One document per file under directory, fetched by the KB from url_prefix + relative path"""
+    doc_types = set(doc_types)
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            doc_type = _doc_type(name)
+            if doc_type not in doc_types:
+                continue
+            relative = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+            yield {"doc_id": make_doc_id(relative), "doc_name": name, "doc_type": doc_type,
+                   "url": url_prefix.rstrip("/") + "/" + quote(relative)}
+
+
+def make_doc_id(name: str) -> str:
+    """Stable doc_id from a path: safe characters plus a checksum so similar names don't collide"""
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_")[:100]
+    return f"{safe}_{zlib.crc32(name.encode('utf-8')):08x}"
+
+
+def _doc_type(name: str) -> str:
+    lower = name.lower()
+    return "faq.xlsx" if lower.endswith(".faq.xlsx") else lower.rsplit(".", 1)[-1]
+
+
+def retry_call(fn: Callable[[int], object], max_attempts: int, backoff: float, max_backoff: float,
+               sleep: Callable[[float], None] = time.sleep, first_attempt: int = 1,
+               before: Optional[Callable[[], None]] = None,
+               on_retry: Optional[Callable[[int, Exception], None]] = None, retry_codes: Iterable = ()):
+    """fn(attempt) with exponential backoff after throttling, 5xx and connection errors
+
+    Other errors, and the error of the last attempt, are raised; retry_codes lists response codes
+    also worth retrying. before() runs ahead of every attempt (e.g. a rate limiter),
+    on_retry(attempt, error) after each one that will be retried.
+    """
+    for attempt in range(first_attempt, max_attempts + 1):
+        if before is not None:
+            before()
+        try:
+            return fn(attempt)
+        except KnowledgeBaseError as e:
+            if not (e.retryable or e.code in retry_codes) or attempt == max_attempts:
+                raise
+            error = e
+        except requests.RequestException as e:
+            if attempt == max_attempts:
+                raise
+            error = e
+        if on_retry is not None:
+            on_retry(attempt, error)
+        sleep(min(max_backoff, backoff * 2 ** (attempt - 1)))
+    raise RuntimeError(f"no attempts left ({first_attempt - 1} of {max_attempts} made)")
+
+
+class RateLimiter:
+    """Blocking token bucket shared by threads: at most `rate` acquisitions per second"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token now; a negative balance is the queue of waiting callers
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+
+
+class IngestJournal:
+    """SQLite record of every document's ingestion state, safe to share between threads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS docs (
+                doc_id TEXT PRIMARY KEY, doc_name TEXT, doc_type TEXT, url TEXT, extra TEXT,
+                state TEXT NOT NULL, stage TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT,
+                submit_seconds REAL, submitted_at REAL, finished_at REAL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS docs_state ON docs (state)")
+
+    def load(self, docs: Iterable[Dict]) -> int:
+        """Add documents not yet in the journal; returns how many were new"""
+        rows = []
+        for doc in docs:
+            extra = {k: v for k, v in doc.items() if k not in ("doc_id", "doc_name", "doc_type", "url")}
+            rows.append((doc["doc_id"], doc["doc_name"], doc["doc_type"], doc["url"], json.dumps(extra), PENDING))
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO docs (doc_id, doc_name, doc_type, url, extra, state) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def docs(self, state: str, limit: int = -1) -> List[Dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT doc_id, doc_name, doc_type, url, extra, attempts, stage FROM docs "
+                                        "WHERE state = ? ORDER BY rowid LIMIT ?", (state, limit))
+            return [{"doc_id": r[0], "doc_name": r[1], "doc_type": r[2], "url": r[3], "extra": json.loads(r[4]),
+                     "attempts": r[5], "stage": r[6]} for r in cursor]
+
+    def submitted(self, doc_id: str, attempts: int, seconds: float):
+        self._update("UPDATE docs SET state = ?, stage = NULL, attempts = ?, error = NULL, submit_seconds = ?, "
+                     "submitted_at = ? WHERE doc_id = ?", (SUBMITTED, attempts, seconds, time.time(), doc_id))
+
+    def done(self, doc_id: str):
+        self._update("UPDATE docs SET state = ?, finished_at = ? WHERE doc_id = ?", (DONE, time.time(), doc_id))
+
+    def failed(self, doc_id: str, stage: str, error: str, attempts: Optional[int] = None):
+        self._update("UPDATE docs SET state = ?, stage = ?, error = ?, attempts = COALESCE(?, attempts), "
+                     "finished_at = ? WHERE doc_id = ?", (FAILED, stage, error, attempts, time.time(), doc_id))
+
+    def reset_failed(self) -> List[Dict]:
+        """Move failed documents back to pending; returns them (with the stage they failed in)"""
+        rows = self.docs(FAILED)
+        self._update("UPDATE docs SET state = ?, attempts = 0, error = NULL WHERE state = ?", (PENDING, FAILED))
+        return rows
+
+    def _update(self, sql: str, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM docs GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in (PENDING, SUBMITTED, DONE, FAILED)}
+
+    def failures(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT doc_id, stage, error FROM docs WHERE state = ? ORDER BY finished_at "
+                                        "LIMIT ?", (FAILED, limit))
+            return [{"doc_id": r[0], "stage": r[1], "error": r[2]} for r in cursor]
+
+    def submit_latencies(self) -> List[float]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT submit_seconds FROM docs WHERE submit_seconds IS NOT NULL")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BulkIngestor:
+    """Submits the journal's pending documents and polls them to completion
+
+    rps limits doc/add calls and poll_rps doc/info calls; throttled (429) and 5xx responses
+    and connection errors are retried with exponential backoff up to max_attempts.
+    """
+
+    def __init__(self, kb: KnowledgeBaseClient, journal: IngestJournal, collection: Optional[str] = None,
+                 workers: int = 8, rps: float = 10.0, poll_rps: float = 20.0, poll_interval: float = 5.0,
+                 max_attempts: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+                 timeout: float = 3600.0, sleep: Callable[[float], None] = time.sleep):
+        self.kb = kb
+        self.journal = journal
+        self.collection = collection or kb.collection
+        self.workers = workers
+        self.submit_limiter = RateLimiter(rps)
+        self.poll_limiter = RateLimiter(poll_rps)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.sleep = sleep
+        self.retries = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._submitting = threading.Event()
+
+    def _submit(self, doc: Dict):
+        last = [doc["attempts"]]
+
+        def add(attempt):
+            last[0] = attempt
+            started = time.perf_counter()
+            try:
+                self.kb.add_doc(doc["doc_id"], doc["doc_name"], doc["doc_type"], url=doc["url"],
+                                collection=self.collection, **doc["extra"])
+            except KnowledgeBaseError as e:
+                if e.code != DOC_EXISTS:
+                    raise
+                # Submitted by an earlier run that stopped before journaling it
+            self.journal.submitted(doc["doc_id"], attempt, time.perf_counter() - started)
+
+        def on_retry(attempt, error):
+            with self._lock:
+                self.retries += 1
+                self.throttled += getattr(error, "status", None) == 429
+            logger.debug("doc/add %s attempt %d failed: %s", doc["doc_id"], attempt, error)
+
+        if doc["attempts"] >= self.max_attempts:
+            self.journal.failed(doc["doc_id"], "submit", f"gave up after {self.max_attempts} attempts",
+                                self.max_attempts)
+            return
+        try:
+            retry_call(add, self.max_attempts, self.backoff, self.max_backoff, self.sleep,
+                       first_attempt=doc["attempts"] + 1, before=self.submit_limiter.acquire, on_retry=on_retry)
+        except KnowledgeBaseError as e:
+            error = str(e) if not e.retryable else f"gave up after {self.max_attempts} attempts: {e}"
+            self.journal.failed(doc["doc_id"], "submit", error, last[0])
+        except requests.RequestException as e:
+            self.journal.failed(doc["doc_id"], "submit",
+                                f"gave up after {self.max_attempts} attempts: {type(e).__name__}: {e}", last[0])
+
+    def _poll(self, doc: Dict):
+        self.poll_limiter.acquire()
+        try:
+            status = (self.kb.doc_info(doc["doc_id"], self.collection).get("status") or {})
+        except KnowledgeBaseError as e:
+            if e.code == DOC_NOT_FOUND:
+                self.journal.failed(doc["doc_id"], "process", str(e))
+            elif not e.retryable:
+                logger.warning("doc/info %s failed: %s", doc["doc_id"], e)
+            return
+        except requests.RequestException as e:
+            logger.debug("doc/info %s failed: %s", doc["doc_id"], e)
+            return
+        process_status = status.get("process_status")
+        if process_status == 0:
+            self.journal.done(doc["doc_id"])
+        elif process_status == 1:
+            self.journal.failed(doc["doc_id"], "process", f"{status.get('failed_code')} {status.get('failed_msg', '')}")
+
+    def _poll_loop(self, pool: ThreadPoolExecutor):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            submitting = self._submitting.is_set()
+            docs = self.journal.docs(SUBMITTED)
+            if not docs and not submitting:
+                return
+            list(pool.map(self._poll, docs))
+            if self.journal.counts()[SUBMITTED] or self._submitting.is_set():
+                self.sleep(self.poll_interval)
+        logger.warning("stopped polling after %.0f s with documents still processing", self.timeout)
+
+    def retry_failed(self):
+        """Resubmit failed documents; ones that failed processing are deleted from the collection first"""
+        for doc in self.journal.reset_failed():
+            if doc["stage"] == "process":
+                try:
+                    self.kb.delete_doc(doc["doc_id"], self.collection)
+                except KnowledgeBaseError as e:
+                    if e.code != DOC_NOT_FOUND:
+                        logger.warning("could not delete %s before retrying: %s", doc["doc_id"], e)
+
+    def run(self) -> Dict:
+        """Submit every pending document and wait for processing; returns the report"""
+        started = time.perf_counter()
+        pending = self.journal.docs(PENDING)
+        self._submitting.set()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="ingest") as submit_pool, \
+                ThreadPoolExecutor(self.workers, thread_name_prefix="ingest-poll") as poll_pool:
+            poller = threading.Thread(target=self._poll_loop, args=(poll_pool,), daemon=True)
+            poller.start()
+            try:
+                list(submit_pool.map(self._submit, pending))
+            finally:
+                self._submitting.clear()
+            submit_seconds = time.perf_counter() - started
+            poller.join()
+        if pending:
+            notify_invalidation(self.collection)
+        return self.report(len(pending), submit_seconds, time.perf_counter() - started)
+
+    def report(self, submitted: int, submit_seconds: float, total_seconds: float) -> Dict:
+        counts = self.journal.counts()
+        latencies = sorted(self.journal.submit_latencies())
+        report = {
+            "documents": sum(counts.values()),
+            "submitted_this_run": submitted,
+            **counts,
+            "submit_seconds": round(submit_seconds, 2),
+            "total_seconds": round(total_seconds, 2),
+            "submit_per_second": round(submitted / submit_seconds, 2) if submit_seconds else 0.0,
+            "processed_per_second": round(counts[DONE] / total_seconds, 2) if total_seconds else 0.0,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.journal.failures(),
+        }
+        if latencies:
+            report["submit_latency_ms"] = {"p50": round(statistics.median(latencies) * 1000, 1),
+                                           "p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1)}
+        try:
+            info = retry_call(lambda attempt: self.kb.collection_info(self.collection), self.max_attempts,
+                              self.backoff, self.max_backoff, self.sleep)
+            report["collection_doc_num"] = info.get("doc_num")
+        except (KnowledgeBaseError, requests.RequestException) as e:
+            logger.warning("collection/info failed: %s", e)
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk, resumable doc/add into a knowledge-base collection")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="CSV or JSONL with url and optional doc_id, doc_name, doc_type")
+    source.add_argument("--dir", help="directory of documents, served at --url-prefix")
+    parser.add_argument("--url-prefix", help="URL the KB fetches --dir files from")
+    parser.add_argument("--collection", default="test")
+    parser.add_argument("--project", default="")
+    parser.add_argument("--domain", default=DEFAULT_DOMAIN)
+    parser.add_argument("--scheme", default="https")
+    parser.add_argument("--account-id", default="")
+    parser.add_argument("--ak", help="access key (default: VOLC_ACCESSKEY / VOLC_SECRETKEY)")
+    parser.add_argument("--sk")
+    parser.add_argument("--journal", default="ingest_journal.db", help="SQLite checkpoint; rerun to resume")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rps", type=float, default=10.0, help="doc/add calls per second")
+    parser.add_argument("--poll-rps", type=float, default=20.0, help="doc/info calls per second")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=3600.0, help="stop polling after this many seconds")
+    parser.add_argument("--retry-failed", action="store_true", help="resubmit documents that failed before")
+    args = parser.parse_args(argv)
+    if args.dir and not args.url_prefix:
+        parser.error("--dir needs --url-prefix")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    credentials = StaticCredentialProvider(args.ak, args.sk) if args.ak else EnvironmentCredentialProvider()
+    kb = KnowledgeBaseClient(account_id=args.account_id, domain=args.domain, project=args.project,
+                             collection=args.collection, credentials=credentials, scheme=args.scheme,
+                             pool_maxsize=args.workers * 2, invalidation_dir=None)
+    journal = IngestJournal(args.journal)
+    docs = read_manifest(args.manifest) if args.manifest else list_directory(args.dir, args.url_prefix)
+    logger.info("%d new documents added to %s", journal.load(docs), args.journal)
+    ingestor = BulkIngestor(kb, journal, workers=args.workers, rps=args.rps, poll_rps=args.poll_rps,
+                            poll_interval=args.poll_interval, max_attempts=args.max_attempts, timeout=args.timeout)
+    if args.retry_failed:
+        ingestor.retry_failed()
+    report = ingestor.run()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    journal.close()
+    kb.close()
+    return 0 if not report[FAILED] and not report[SUBMITTED] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
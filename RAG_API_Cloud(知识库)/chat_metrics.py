@@ -0,0 +1,213 @@
+"""
+Rolling-window metrics for the agent apps, served in O(1) and as Prometheus text
+Events (a stored message, an agent picking up a customer, a change in how many agents are busy)
+are added to the current slot of a ring covering the last `window` seconds and to running window
+totals; slots that fall out of the window are subtracted as time moves on. Reads combine the
+totals, so their cost depends on the number of slots and histogram buckets, never on how many
+sessions or messages there are. Counters and histograms since start are kept too, for Prometheus.
+Numbers are per process; with several workers, scrape each (or sum them) as usual.
+Usage: metrics.message("user"); metrics.handoff(wait_seconds); metrics.agents(busy, logged_in)
+       metrics.snapshot()  # messages/sec, wait-time histogram and percentiles, agent utilization
+"""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) of the handoff wait-time histogram buckets
+DEFAULT_WAIT_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Slot:
+    """Event counts of one slot, or the sum of several"""
+
+    __slots__ = ("messages", "waits", "wait_sum", "busy_seconds", "staffed_seconds")
+
+    def __init__(self, buckets: int):
+        self.messages: Dict[str, int] = {}
+        self.waits = [0] * (buckets + 1)  # the last one is +Inf
+        self.wait_sum = 0.0
+        self.busy_seconds = 0.0
+        self.staffed_seconds = 0.0
+
+    def subtract(self, other: "_Slot"):
+        for sender, count in other.messages.items():
+            self.messages[sender] -= count
+        for i, count in enumerate(other.waits):
+            self.waits[i] -= count
+        self.wait_sum -= other.wait_sum
+        self.busy_seconds -= other.busy_seconds
+        self.staffed_seconds -= other.staffed_seconds
+
+
+class ChatMetrics:
+    """Thread-safe rolling counters: window seconds in `slots` slots"""
+
+    def __init__(self, window: float = 300.0, slots: int = 60, wait_buckets: Iterable[float] = DEFAULT_WAIT_BUCKETS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.slots = slots
+        self.width = window / slots
+        self.wait_buckets = tuple(sorted(wait_buckets))
+        self.clock = clock
+        self._ring = [_Slot(len(self.wait_buckets)) for _ in range(slots)]
+        self._window = _Slot(len(self.wait_buckets))
+        self._total = _Slot(len(self.wait_buckets))  # since start, never subtracted
+        self._started = clock()
+        self._tick = int(self._started // self.width)
+        self._accrued_to = self._started
+        self._busy = 0
+        self._staffed = 0
+        self._lock = threading.Lock()
+
+    def _advance(self, now: float):
+        """Move the ring to now (caller holds the lock), accruing agent time slot by slot"""
+        tick = int(now // self.width)
+        if tick - self._tick > self.slots:
+            # Idle for longer than the window: every slot expires, skip to the last window
+            self._tick = tick - self.slots
+            self._accrued_to = max(self._accrued_to, self._tick * self.width)
+        while self._tick < tick:
+            self._accrue((self._tick + 1) * self.width)
+            self._tick += 1
+            slot = self._ring[self._tick % self.slots]
+            self._window.subtract(slot)
+            self._ring[self._tick % self.slots] = _Slot(len(self.wait_buckets))
+        self._accrue(now)
+
+    def _accrue(self, until: float):
+        seconds = until - self._accrued_to
+        if seconds <= 0:
+            return
+        slot = self._ring[self._tick % self.slots]
+        for target in (slot, self._window, self._total):
+            target.busy_seconds += self._busy * seconds
+            target.staffed_seconds += self._staffed * seconds
+        self._accrued_to = until
+
+    def message(self, sender_type: str):
+        with self._lock:
+            self._advance(self.clock())
+            for target in (self._ring[self._tick % self.slots], self._window, self._total):
+                target.messages[sender_type] = target.messages.get(sender_type, 0) + 1
+
+    def handoff(self, wait_seconds: float):
+        """A customer reached an agent after waiting wait_seconds in the queue"""
+        index = next((i for i, bound in enumerate(self.wait_buckets) if wait_seconds <= bound), len(self.wait_buckets))
+        with self._lock:
+            self._advance(self.clock())
+            for target in (self._ring[self._tick % self.slots], self._window, self._total):
+                target.waits[index] += 1
+                target.wait_sum += wait_seconds
+
+    def agents(self, busy: int, staffed: int):
+        """How many agents are busy out of those logged in, from now on"""
+        with self._lock:
+            self._advance(self.clock())
+            self._busy, self._staffed = busy, staffed
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            now = self.clock()
+            self._advance(now)
+            # The ring spans the slots - 1 before the current one and the current one so far; rates
+            # are over one slot at least, so the first events after a start do not read as a spike
+            covered = max(min(now - self._started, now - (self._tick - self.slots + 1) * self.width), self.width)
+            window = self._window
+            handoffs = sum(window.waits)
+            bounds = [str(b) for b in self.wait_buckets] + ["+Inf"]
+            return {
+                "window_seconds": round(covered, 1),
+                "messages": sum(window.messages.values()),
+                "messages_per_second": round(sum(window.messages.values()) / covered, 3),
+                "messages_by_sender": {k: v for k, v in window.messages.items() if v},
+                "handoffs": handoffs,
+                "wait_seconds": {
+                    "mean": round(window.wait_sum / handoffs, 1) if handoffs else None,
+                    "p50": self._quantile(window.waits, 0.5),
+                    "p90": self._quantile(window.waits, 0.9),
+                    "p99": self._quantile(window.waits, 0.99),
+                    "histogram": dict(zip(bounds, window.waits)),
+                },
+                "agent_utilization": (round(window.busy_seconds / window.staffed_seconds, 3)
+                                      if window.staffed_seconds > 0 else None),
+                "agents_busy": self._busy,
+                "agents_logged_in": self._staffed,
+            }
+
+    def _quantile(self, waits: List[int], q: float) -> Optional[float]:
+        """Linear interpolation within the bucket holding the q-th wait, as Prometheus does"""
+        count = sum(waits)
+        if not count:
+            return None
+        rank, seen = q * count, 0
+        for i, n in enumerate(waits):
+            if n and seen + n >= rank:
+                if i == len(self.wait_buckets):
+                    return float(self.wait_buckets[-1]) if self.wait_buckets else None
+                lower = self.wait_buckets[i - 1] if i else 0.0
+                return round(lower + (self.wait_buckets[i] - lower) * (rank - seen) / n, 1)
+            seen += n
+        return None
+
+    def prometheus(self, prefix: str = "chatbot") -> str:
+        """Counters and the wait histogram since start, and the window's rates, in the text format"""
+        snapshot = self.snapshot()
+        with self._lock:
+            total = self._total
+            messages = sorted(total.messages.items())
+            waits, wait_sum = list(total.waits), total.wait_sum
+        buckets, cumulative = [], 0
+        for bound, n in zip([_number(b) for b in self.wait_buckets] + ["+Inf"], waits):
+            cumulative += n
+            buckets.append(({"le": bound}, cumulative))
+        return "".join([
+            format_metric(f"{prefix}_messages_total", "counter", "Chat messages stored, by sender type",
+                          [({"sender_type": sender}, n) for sender, n in messages]),
+            format_metric(f"{prefix}_handoff_wait_seconds", "histogram",
+                          "Time customers waited in the queue before an agent picked them up",
+                          buckets, suffix="_bucket")
+            + f"{prefix}_handoff_wait_seconds_sum {_number(wait_sum)}\n"
+            + f"{prefix}_handoff_wait_seconds_count {cumulative}\n",
+            format_metric(f"{prefix}_messages_per_second", "gauge",
+                          f"Chat messages per second over the last {_number(self.window)} s",
+                          [({}, snapshot["messages_per_second"])]),
+            format_metric(f"{prefix}_agent_utilization", "gauge",
+                          f"Share of logged-in agent time spent busy over the last {_number(self.window)} s",
+                          [({}, snapshot["agent_utilization"] or 0)]),
+        ])
+
+
+def _number(value) -> str:
+    if isinstance(value, float) and (math.isinf(value) or math.isnan(value)):
+        return "+Inf" if value > 0 else ("-Inf" if value < 0 else "NaN")
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_metric(name: str, kind: str, help_text: str, samples: Iterable[Tuple[Dict[str, object], float]],
+                  suffix: str = "") -> str:
+    """One metric family in the Prometheus text exposition format"""
+    lines = [f"# HELP {name} {help_text}\n", f"# TYPE {name} {kind}\n"]
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{_escape(v)}"' for key, v in labels.items())
+        lines.append(f"{name}{suffix}{{{label_text}}} {_number(value)}\n" if label_text
+                     else f"{name}{suffix} {_number(value)}\n")
+    return "".join(lines)
+
+
+def store_gauges(store, prefix: str = "chatbot") -> str:
+    """Session, queue and agent gauges from a SessionBackend's counters (no session scan)"""
+    return "".join([
+        format_metric(f"{prefix}_sessions", "gauge", "Chat sessions by status",
+                      [({"status": status}, n) for status, n in sorted(store.status_counts().items())]),
+        format_metric(f"{prefix}_queue_length", "gauge", "Customers waiting for an agent, by lane",
+                      [({"lane": lane}, n) for lane, n in sorted(store.queue_lengths().items())]),
+        format_metric(f"{prefix}_agents", "gauge", "Logged-in agents by status",
+                      [({"status": status}, n) for status, n in sorted(store.agent_status_counts().items())]),
+    ])
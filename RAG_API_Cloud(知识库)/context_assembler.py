@@ -0,0 +1,155 @@
+"""
+Token-budgeted prompt context from search_knowledge results
+Chunks are taken best score first, near-duplicates (word-shingle Jaccard or containment, e.g. the
+overlap chunk_group / chunk_diffusion_count produce) are dropped, and chunks are added while they fit
+the token budget. Each chunk keeps generate_prompt()'s formatting, including FAQ questions and
+table_chunk_fields, and every call reports how many tokens the naive concatenation would have cost.
+"""
+
+import logging
+import re
+import threading
+import zlib
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# CJK ideographs / kana / hangul are roughly one token each; other words about four characters per token
+_CJK = "[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]"
+_TOKEN_PIECE = re.compile(_CJK + r"|[^\W_]+|[^\w\s]")
+_WORD = re.compile(_CJK + r"|[^\W_]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local estimate of the model's token count (no tokenizer download)"""
+    tokens = 0
+    for piece in _TOKEN_PIECE.findall(text):
+        tokens += 1 if len(piece) <= 4 else (len(piece) + 3) // 4
+    return tokens
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[int]:
+    """Hashed word `size`-grams of the lower-cased text (single characters for CJK runs)"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([zlib.crc32(" ".join(words).encode("utf-8"))]) if words else frozenset()
+    return frozenset(zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1))
+
+
+def format_point(point: Dict, table_fields: Sequence[str] = ()) -> str:
+    """One search_knowledge result in generate_prompt()'s layout, ending with the --- separator"""
+    text = ""
+    doc_info = point.get("doc_info") or {}
+    for system_field in ["doc_name", "title", "chunk_title", "content"]:
+        if system_field == "doc_name" or system_field == "title":
+            if system_field in doc_info:
+                text += f"{system_field}: {doc_info[system_field]}\n"
+        elif system_field in point:
+            if system_field == "content" and doc_info.get("doc_type") == "faq.xlsx":
+                # FAQ best practices
+                text += ("content: When a similar question is asked, refer to the corresponding answer: "
+                         f"Question: {point.get('original_question', '')}; Answer: {point[system_field]}\n")
+            else:
+                text += f"{system_field}: {point[system_field]}\n"
+    if "table_chunk_fields" in point:
+        table_chunk_fields = point["table_chunk_fields"]
+        for self_field in table_fields:
+            find_one = next((item for item in table_chunk_fields if item["field_name"] == self_field), None)
+            if find_one:
+                text += f"{self_field}: {find_one['field_value']}\n"
+    return text + "---\n"
+
+
+def _dedup_text(point: Dict) -> str:
+    """What two chunks must share to count as duplicates: the chunk text (or its table fields)"""
+    content = point.get("content", "")
+    if not content and point.get("table_chunk_fields"):
+        content = " ".join(str(item.get("field_value", "")) for item in point["table_chunk_fields"])
+    return content
+
+
+class ContextAssembler:
+    """Dedup + score order + token budget for the <context> block
+
+    token_budget counts the formatted chunks only; the prompt template and question are extra.
+    """
+
+    def __init__(self, token_budget: int = 3000, similarity_threshold: float = 0.8,
+                 containment_threshold: float = 0.9, shingle_size: int = 3, table_fields: Sequence[str] = (),
+                 estimate: Callable[[str], int] = estimate_tokens, formatter: Callable[..., str] = format_point):
+        self.token_budget = token_budget
+        self.similarity_threshold = similarity_threshold
+        self.containment_threshold = containment_threshold
+        self.shingle_size = shingle_size
+        self.table_fields = tuple(table_fields)
+        self.estimate = estimate
+        self.formatter = formatter
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_used = 0
+        self.tokens_saved = 0
+        self.duplicates_dropped = 0
+        self.over_budget_dropped = 0
+
+    def _duplicate(self, a: FrozenSet[int], b: FrozenSet[int]) -> bool:
+        if not a or not b:
+            return False
+        common = len(a & b)
+        return (common / len(a | b) >= self.similarity_threshold
+                or common / min(len(a), len(b)) >= self.containment_threshold)
+
+    def assemble(self, points: List[Dict], token_budget: Optional[int] = None) -> Dict:
+        """Pick and format points; returns context, kept points and the token report"""
+        budget = self.token_budget if token_budget is None else token_budget
+        formatted = [self.formatter(point, self.table_fields) for point in points]
+        costs = [self.estimate(text) for text in formatted]
+        order = sorted(range(len(points)), key=lambda i: (-float(points[i].get("score") or 0.0), i))
+
+        kept, kept_shingles, used = [], [], 0
+        duplicates = over_budget = 0
+        for i in order:
+            signature = shingles(_dedup_text(points[i]), self.shingle_size)
+            if any(self._duplicate(signature, other) for other in kept_shingles):
+                duplicates += 1
+                continue
+            if used + costs[i] > budget:
+                # A smaller, lower-scored chunk may still fit
+                over_budget += 1
+                continue
+            kept.append(i)
+            kept_shingles.append(signature)
+            used += costs[i]
+
+        report = {
+            "chunks": len(points),
+            "kept": len(kept),
+            "duplicates_dropped": duplicates,
+            "over_budget_dropped": over_budget,
+            "tokens_total": sum(costs),
+            "tokens_used": used,
+            "tokens_saved": sum(costs) - used,
+        }
+        with self._lock:
+            self.requests += 1
+            self.tokens_used += used
+            self.tokens_saved += report["tokens_saved"]
+            self.duplicates_dropped += duplicates
+            self.over_budget_dropped += over_budget
+        logger.info("context: kept %d/%d chunks, %d tokens, saved %d (%d duplicates, %d over budget)",
+                    len(kept), len(points), used, report["tokens_saved"], duplicates, over_budget)
+        return {"context": "".join(formatted[i] for i in kept), "points": [points[i] for i in kept],
+                "report": report}
+
+    def build(self, result: Dict) -> str:
+        """search_knowledge data -> context string (RAGPipeline(build_context=...))"""
+        return self.assemble(result.get("result_list", []))["context"]
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "tokens_used": self.tokens_used,
+            "tokens_saved": self.tokens_saved,
+            "avg_tokens_saved": round(self.tokens_saved / self.requests, 1) if self.requests else 0.0,
+            "duplicates_dropped": self.duplicates_dropped,
+            "over_budget_dropped": self.over_budget_dropped,
+        }
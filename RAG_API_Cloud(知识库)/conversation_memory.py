@@ -0,0 +1,114 @@
+"""
+Per-conversation memory for multi-turn RAG
+The last few turns are kept verbatim in a ring buffer; turns that fall out of it are folded into a
+running summary (incrementally, one evicted turn at a time) instead of being resent, and the built
+request is capped at max_request_tokens. search_options() turns on the KB `rewrite` pre-processing
+only once there is history to rewrite against.
+"""
+
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+from context_assembler import estimate_tokens
+
+_SENTENCE = re.compile(r"(.+?[.!?。！？])(\s|$)", re.S)
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    match = _SENTENCE.match(text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3].rstrip() + "..."
+
+
+def extractive_summary(summary: str, user: str, assistant: str, max_tokens: int = 200) -> str:
+    """Default summarizer: append "Q: question A: first sentence of answer", dropping the oldest lines
+    once the summary exceeds max_tokens. Pass an LLM-backed summarize= for abstractive summaries."""
+    lines = summary.splitlines() if summary else []
+    lines.append(f"Q: {_first_sentence(user, 200)} A: {_first_sentence(assistant, 300)}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """Ring buffer of recent turns plus a rolling summary of older ones"""
+
+    __slots__ = ("turns", "summary", "summarize", "summary_tokens", "max_request_tokens", "summarized_turns")
+
+    def __init__(self, max_turns: int = 4, summary_tokens: int = 200, max_request_tokens: int = 6000,
+                 summarize: Callable[..., str] = extractive_summary):
+        self.turns = deque(maxlen=max_turns)  # (user, assistant)
+        self.summary = ""
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.max_request_tokens = max_request_tokens
+        self.summarized_turns = 0
+
+    def __bool__(self):
+        return bool(self.turns or self.summary)
+
+    def add_turn(self, user: str, assistant: str):
+        if len(self.turns) == self.turns.maxlen:
+            old_user, old_assistant = self.turns[0]
+            self.summary = self.summarize(self.summary, old_user, old_assistant, self.summary_tokens)
+            self.summarized_turns += 1
+        self.turns.append((user, assistant))
+
+    def history(self) -> List[Dict]:
+        messages = []
+        for user, assistant in self.turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        return messages
+
+    def search_options(self, query: str) -> Dict:
+        """pre_processing for search_knowledge: rewrite the query against history only when there is any"""
+        if not self.turns:
+            return {"rewrite": False}
+        return {"rewrite": True, "messages": self.history() + [{"role": "user", "content": query}]}
+
+    def messages(self, system_prompt: str, query: str) -> List[Dict]:
+        """system (+ summary), recent turns, question; oldest turns are dropped to fit max_request_tokens"""
+        system = system_prompt
+        if self.summary:
+            system += f"\n# Earlier in this conversation\n{self.summary}\n"
+        history = self.history()
+        fixed = estimate_tokens(system) + estimate_tokens(query)
+        budget = self.max_request_tokens - fixed
+        while history and sum(estimate_tokens(m["content"]) for m in history) > budget:
+            del history[:2]
+        return [{"role": "system", "content": system}, *history, {"role": "user", "content": query}]
+
+    def request_tokens(self, system_prompt: str, query: str) -> int:
+        return sum(estimate_tokens(m["content"]) for m in self.messages(system_prompt, query))
+
+
+class ConversationStore:
+    """Thread-safe conversation_id -> ConversationMemory, least recently used dropped beyond max_conversations"""
+
+    def __init__(self, max_conversations: int = 1000, **memory_options):
+        self.max_conversations = max_conversations
+        self.memory_options = memory_options
+        self._memories: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> ConversationMemory:
+        with self._lock:
+            memory = self._memories.get(conversation_id)
+            if memory is None:
+                memory = self._memories[conversation_id] = ConversationMemory(**self.memory_options)
+                while len(self._memories) > self.max_conversations:
+                    self._memories.popitem(last=False)
+            else:
+                self._memories.move_to_end(conversation_id)
+            return memory
+
+    def drop(self, conversation_id: str) -> Optional[ConversationMemory]:
+        with self._lock:
+            return self._memories.pop(conversation_id, None)
+
+    def __len__(self):
+        return len(self._memories)
@@ -1,9 +1,14 @@
-from flask import Flask, request, render_template, jsonify, session
-import json
-import requests
-from volcengine.auth.SignerV4 import SignerV4
-from volcengine.base.Request import Request
-from volcengine.Credentials import Credentials
+from flask import Flask, Response, request, render_template, jsonify, session
+import os
+from agent_queue import DEFAULT_LANE, NORMAL_PRIORITY, VIP_PRIORITY
+from chat_metrics import PROMETHEUS_CONTENT_TYPE, ChatMetrics, store_gauges
+from context_assembler import ContextAssembler
+from event_hub import SSE_HEADERS, EventHub, last_event_id, stream
+from kb_client import KnowledgeBaseClient, KnowledgeBaseError
+from rag_pipeline import RAGPipeline
+from retrieval_cache import RetrievalCache, ngram_embedding
+from session_backend import open_backend
+from single_flight import SingleFlight
 import uuid
 from datetime import datetime
 import threading
@@ -28,21 +33,68 @@ You are a helpful assistant. Answer accurately based on the context.
 """
 
 # === AGENT SYSTEM ===
-# In-memory storage (in production, use Redis or database)
-agent_queue = []  # List of chat sessions waiting for agent
-active_agents = {}  # {agent_id: {session_id, name, status}}
-chat_sessions = {}  # {session_id: {messages, status, agent_id, customer_info}}
-agent_sessions = {}  # {agent_id: session_info}
+# Chat sessions, active agents and the agent queue live in a session store (see session_backend.py).
+# The default keeps them in this process; CHAT_SESSION_STORE=sqlite:///path/sessions.db shares them
+# between gunicorn workers, e.g. gunicorn -w 4 enhanced_chatbot_with_agent:app
+store = open_backend(os.environ.get("CHAT_SESSION_STORE"))
+# New messages and status changes are pushed to the pages over SSE (/session/events/<id>,
+# /agent/events) instead of the pages polling for the whole message list. A store shared between
+# workers is also checked every 2 s for changes another worker made
+hub = EventHub()
+STREAM_POLL = 2.0 if store.shared else None
+AGENTS_CHANNEL = "agents"  # queue and agent changes, for the agent dashboards
+# Messages/sec, handoff wait times and agent utilization over the last 5 minutes, updated as
+# things happen; the session counts come from counters the store keeps (see /metrics)
+metrics = ChatMetrics(window=300)
+ACTIVE_STATUSES = ("bot", "waiting_agent", "with_agent")
+PREFETCH_HISTORY = 10  # recent messages the follow-up prediction looks at
+
+def sample_agents():
+    counts = store.agent_status_counts()
+    metrics.agents(counts.get("busy", 0), sum(counts.values()))
+    return counts
+
+def notify_agents():
+    """A queue or agent change: refresh the agent dashboards"""
+    sample_agents()
+    hub.publish(AGENTS_CHANNEL, "changed")
+
+def record_handoff(requested_at):
+    if requested_at:
+        metrics.handoff((datetime.now() - datetime.fromisoformat(requested_at)).total_seconds())
 
 class ChatSession:
-    def __init__(self, session_id):
-        self.session_id = session_id
-        self.messages = []
-        self.status = 'bot'  # 'bot', 'waiting_agent', 'with_agent', 'ended'
-        self.agent_id = None
-        self.created_at = datetime.now()
-        self.customer_info = {}
-        
+    """A session record in the store; status changes and messages are written through to it"""
+
+    def __init__(self, record):
+        self.session_id = record['session_id']
+        self.status = record['status']  # 'bot', 'waiting_agent', 'with_agent', 'ended'
+        self.agent_id = record['agent_id']
+        self.created_at = record['created_at']
+        self.customer_info = record['customer_info']
+        self.agent_requested_at = record.get('agent_requested_at')
+
+    @classmethod
+    def load(cls, session_id):
+        record = store.get_session(session_id) if session_id else None
+        return cls(record) if record is not None else None
+
+    @property
+    def messages(self):
+        return store.messages(self.session_id)
+
+    @property
+    def channel(self):
+        return f"session:{self.session_id}"
+
+    def status_event(self):
+        agent = store.get_agent(self.agent_id) if self.agent_id else None
+        return {'status': self.status, 'agent_id': self.agent_id, 'agent_name': agent['name'] if agent else None}
+
+    def _publish_status(self):
+        if hub.subscribers(self.channel):
+            hub.publish(self.channel, 'status', self.status_event())
+
     def add_message(self, sender, content, sender_type='user'):
         message = {
             'id': str(uuid.uuid4()),
@@ -51,109 +103,128 @@ class ChatSession:
             'sender_type': sender_type,  # 'user', 'bot', 'agent'
             'timestamp': datetime.now().isoformat()
         }
-        self.messages.append(message)
+        message['seq'] = store.append_message(self.session_id, message)
+        metrics.message(sender_type)
+        hub.publish(self.channel, 'message', message, event_id=message['seq'])
         return message
-        
+
+    def update(self, **fields):
+        store.update_session(self.session_id, **fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._publish_status()
+
+    def request_agent(self):
+        """bot -> waiting_agent, atomically (False if the session was not with the bot)"""
+        def transition(record):
+            if record['status'] != 'bot':
+                return False
+            record['status'] = 'waiting_agent'
+            record['agent_requested_at'] = requested_at
+            return True
+        requested_at = datetime.now().isoformat()
+        if store.modify_session(self.session_id, transition):
+            self.status = 'waiting_agent'
+            self.agent_requested_at = requested_at
+            self._publish_status()
+            return True
+        return False
+
+    def assign_agent(self, agent_id):
+        """waiting_agent -> with_agent, atomically (False if the customer left or was taken)"""
+        def transition(record):
+            if record['status'] != 'waiting_agent':
+                return False
+            record['status'] = 'with_agent'
+            record['agent_id'] = agent_id
+            return True
+        if store.modify_session(self.session_id, transition):
+            self.status = 'with_agent'
+            self.agent_id = agent_id
+            self._publish_status()
+            return True
+        return False
+
+    def leave_queue(self):
+        """waiting_agent -> ended and out of the queue, for a customer who gives up waiting"""
+        def transition(record):
+            if record['status'] != 'waiting_agent':
+                return False
+            record['status'] = 'ended'
+            return True
+        if not store.modify_session(self.session_id, transition):
+            return False
+        self.status = 'ended'
+        store.remove_from_queue(self.session_id)
+        self._publish_status()
+        notify_agents()
+        return True
+
+    def recent_queries(self):
+        """The customer's latest questions, which follow-up prediction skips"""
+        return [m['content'] for m in store.recent_messages(self.session_id, PREFETCH_HISTORY)
+                if m['sender_type'] == 'user']
+
+    def queue_route(self, lane=None):
+        """(lane, priority) to queue under: the language / skill asked for, VIP customers first"""
+        priority = VIP_PRIORITY if self.customer_info.get('tier') == 'vip' else NORMAL_PRIORITY
+        return lane or DEFAULT_LANE, priority
+
     def to_dict(self):
         return {
             'session_id': self.session_id,
             'messages': self.messages,
             'status': self.status,
             'agent_id': self.agent_id,
-            'created_at': self.created_at.isoformat(),
+            'created_at': self.created_at,
             'customer_info': self.customer_info
         }
 
-def prepare_request(method, path, params=None, data=None, doseq=0):
-    r = Request()
-    r.set_shema("https")
-    r.set_method(method)
-    r.set_connection_timeout(10)
-    r.set_socket_timeout(10)
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json; charset=utf-8",
-        "Host": g_knowledge_base_domain,
-        "V-Account-Id": account_id,
-    }
-    r.set_headers(headers)
-    if params:
-        r.set_query(params)
-    r.set_host(g_knowledge_base_domain)
-    r.set_path(path)
-    if data is not None:
-        r.set_body(json.dumps(data))
-    credentials = Credentials(AK, SK, "air", "cn-north-1")
-    SignerV4.sign(r, credentials)
-    return r
-
-def search_knowledge(query):
-    method = "POST"
-    path = "/api/knowledge/collection/search_knowledge"
-    request_params = {
-        "project": "",
-        "name": "test",
-        "query": query,
-        "limit": 5,
-        "pre_processing": {
-            "need_instruction": False,
-            "rewrite": False,
-            "return_token_usage": False
-        },
-        "dense_weight": 0.5,
-        "post_processing": {
-            "chunk_group": True,
-            "rerank_switch": False
-        }
-    }
-    info_req = prepare_request(method, path, data=request_params)
-    rsp = requests.request(
-        method=info_req.method,
-        url=f"https://{g_knowledge_base_domain}{info_req.path}",
-        headers=info_req.headers,
-        data=info_req.body
-    )
-    print("🔍 KB Search Response:", rsp.text)
-    data = rsp.json()
-    chunks = data.get("data", {}).get("result_list", [])
-    return "\n".join([c.get("content", "") for c in chunks])
+# One signed, keep-alive client shared by every call: the credential, connection pool and
+# derived signing keys are reused instead of being rebuilt per request (see kb_client.py)
+# Repeated and near-identical questions reuse cached search results for up to 5 minutes;
+# adding or deleting documents (kb_client or the step3 scripts) drops the collection's entries
+# Identical searches arriving while one is in flight (a popular question in many threads) wait
+# for it instead of each calling the API; waiters give up after 10 s
+kb = KnowledgeBaseClient(AK, SK, account_id, domain=g_knowledge_base_domain,
+                         project=project_name, collection=collection_name,
+                         cache=RetrievalCache(max_entries=2048, ttl=300, embed=ngram_embedding,
+                                              similarity_threshold=0.9),
+                         single_flight=SingleFlight(timeout=10, timeouts={"chat_completions": 60}))
+# Starts retrieval as soon as a query arrives and prefetches likely follow-ups into the cache
+# Retrieved chunks are deduplicated and trimmed to a token budget, best score first
+context_assembler = ContextAssembler(token_budget=3000)
+pipeline = RAGPipeline(kb, base_prompt, search_options={"limit": 5, "dense_weight": 0.5},
+                       build_context=context_assembler.build)
 
 def chat_completion(prompt, user_query):
-    method = "POST"
-    path = "/api/knowledge/chat/completions"
     messages = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": user_query}
     ]
-    request_params = {
-        "messages": messages,
-        "stream": False,
-        "return_token_usage": True,
-        "model": "Skylark-pro",
-        "max_tokens": 1024,
-        "temperature": 0.7
-    }
-    info_req = prepare_request(method, path, data=request_params)
-    rsp = requests.request(
-        method=info_req.method,
-        url=f"https://{g_knowledge_base_domain}{info_req.path}",
-        headers=info_req.headers,
-        data=info_req.body
-    )
     try:
-        result = rsp.json()
-        return result.get("data", {}).get("generated_answer", "⚠️ No answer generated.")
-    except Exception as e:
-        return f"⚠️ Failed to parse response. Raw: {rsp.text}"
+        result = kb.chat_completions(messages, model="Skylark-pro", max_tokens=1024, temperature=0.7,
+                                     return_token_usage=True)
+    except KnowledgeBaseError as e:
+        return f"⚠️ Failed to parse response. Raw: {e}"
+    return result.get("generated_answer", "⚠️ No answer generated.")
 
 def get_or_create_session(session_id=None):
     if not session_id:
         session_id = str(uuid.uuid4())
     
-    if session_id not in chat_sessions:
-        chat_sessions[session_id] = ChatSession(session_id)
-    
-    return chat_sessions[session_id]
+    return ChatSession(store.create_session(session_id, {
+        'session_id': session_id,
+        'status': 'bot',
+        'agent_id': None,
+        'created_at': datetime.now().isoformat(),
+        'agent_requested_at': None,
+        'customer_info': {}
+    }))
+
+def goes_to_bot(status, wants_agent):
+    """Whether the bot answers a message sent in this status (not while queued or with an agent)"""
+    return status not in ('waiting_agent', 'with_agent') and not (wants_agent and status == 'bot')
 
 def detect_agent_request(message):
     """Detect if user wants to talk to an agent"""
@@ -181,26 +252,35 @@ def chat():
     user_query = data.get("query", "")
     session_id = data.get("session_id") or session.get('session_id')
     
+    if not user_query:
+        return jsonify({"error": "No query provided"}), 400
+    
     # Get or create session
     chat_session = get_or_create_session(session_id)
     session['session_id'] = chat_session.session_id
     
-    # Add user message
-    chat_session.add_message("Customer", user_query, "user")
+    # Only a message the bot will answer needs a search; it runs while the message is stored
+    wants_agent = detect_agent_request(user_query)
+    retrieval = pipeline.retrieve(user_query) if goes_to_bot(chat_session.status, wants_agent) else None
+    
+    # Add user message; last_seq tells the page where its message stream should resume
+    last_seq = chat_session.add_message("Customer", user_query, "user")['seq']
     
     # Check if user wants to talk to agent
-    if detect_agent_request(user_query) and chat_session.status == 'bot':
-        chat_session.status = 'waiting_agent'
-        agent_queue.append(chat_session.session_id)
+    if wants_agent and chat_session.request_agent():
+        # "lane" routes the customer to agents with that language or skill (e.g. "es", "billing")
+        queue_position = store.enqueue(chat_session.session_id, *chat_session.queue_route(data.get("lane")))
+        notify_agents()
         
         response = "I understand you'd like to speak with a human agent. I'm connecting you now. Please wait a moment while I find an available agent to assist you."
-        chat_session.add_message("System", response, "bot")
+        last_seq = chat_session.add_message("System", response, "bot")['seq']
         
         return jsonify({
             "answer": response,
             "session_id": chat_session.session_id,
             "status": "waiting_agent",
-            "queue_position": len(agent_queue)
+            "queue_position": queue_position,
+            "last_seq": last_seq
         })
     
     # If already with agent, don't process with bot
@@ -208,31 +288,37 @@ def chat():
         return jsonify({
             "answer": "Your message has been sent to the agent. Please wait for their response.",
             "session_id": chat_session.session_id,
-            "status": "with_agent"
+            "status": "with_agent",
+            "last_seq": last_seq
         })
     
     # If waiting for agent, update queue position
     if chat_session.status == 'waiting_agent':
-        queue_position = agent_queue.index(chat_session.session_id) + 1 if chat_session.session_id in agent_queue else 0
+        queue_position = store.queue_position(chat_session.session_id)
         return jsonify({
             "answer": f"You are currently in queue position {queue_position}. An agent will be with you shortly.",
             "session_id": chat_session.session_id,
             "status": "waiting_agent",
-            "queue_position": queue_position
+            "queue_position": queue_position,
+            "last_seq": last_seq
         })
     
-    # Normal bot response
-    kb_context = search_knowledge(user_query)
+    # Normal bot response (the search is usually finished by now; started here if the status
+    # changed since it was read)
+    retrieval = retrieval or pipeline.retrieve(user_query)
+    kb_context = pipeline.context(retrieval)
     prompt = base_prompt.format(kb_context)
     answer = chat_completion(prompt, user_query)
     
     # Add bot response
-    chat_session.add_message("AI Assistant", answer, "bot")
+    last_seq = chat_session.add_message("AI Assistant", answer, "bot")['seq']
+    pipeline.prefetch(chat_session.recent_queries(), retrieval)
     
     return jsonify({
         "answer": answer,
         "session_id": chat_session.session_id,
-        "status": "bot"
+        "status": "bot",
+        "last_seq": last_seq
     })
 
 @app.route("/agent/login", methods=["POST"])
@@ -241,45 +327,57 @@ def agent_login():
     agent_name = data.get("name", "")
     agent_id = str(uuid.uuid4())
     
-    active_agents[agent_id] = {
+    store.put_agent(agent_id, {
         "name": agent_name,
         "status": "available",
         "session_id": None,
+        # Queue lanes (languages / skills) this agent serves; None serves every lane
+        "lanes": data.get("lanes") or None,
         "login_time": datetime.now().isoformat()
-    }
+    })
     
     session['agent_id'] = agent_id
+    notify_agents()
     
     return jsonify({
         "agent_id": agent_id,
         "status": "logged_in",
-        "queue_length": len(agent_queue)
+        "queue_length": store.queue_length()
     })
 
 @app.route("/agent/pickup", methods=["POST"])
 def agent_pickup():
     agent_id = session.get('agent_id')
-    if not agent_id or agent_id not in active_agents:
+    agent = store.get_agent(agent_id) if agent_id else None
+    if agent is None:
         return jsonify({"error": "Agent not logged in"}), 401
     
-    if not agent_queue:
-        return jsonify({"error": "No customers in queue"}), 400
-    
-    # Get next customer from queue
-    session_id = agent_queue.pop(0)
-    chat_session = chat_sessions.get(session_id)
-    
-    if not chat_session:
-        return jsonify({"error": "Session not found"}), 404
-    
-    # Assign agent to session
-    chat_session.status = 'with_agent'
-    chat_session.agent_id = agent_id
-    active_agents[agent_id]['status'] = 'busy'
-    active_agents[agent_id]['session_id'] = session_id
+    # One customer at a time: claim the agent (available -> busy) before taking anyone
+    def claim(agent_record):
+        if agent_record['status'] == 'busy' or agent_record.get('session_id'):
+            return False
+        agent_record['status'] = 'busy'
+        return True
+    if not store.modify_agent(agent_id, claim):
+        return jsonify({"error": "Agent already has a session"}), 409
+    
+    # Get next customer from the agent's lanes (an atomic pop, so two agents never get the same customer);
+    # one who left the queue between the pop and the assignment is skipped
+    while True:
+        session_id = store.dequeue(agent.get('lanes'))
+        if session_id is None:
+            store.update_agent(agent_id, status='available')
+            return jsonify({"error": "No customers in queue"}), 400
+        chat_session = ChatSession.load(session_id)
+        if chat_session is not None and chat_session.assign_agent(agent_id):
+            break
+    
+    store.update_agent(agent_id, session_id=session_id)
+    record_handoff(chat_session.agent_requested_at)
+    notify_agents()
     
     # Add system message
-    agent_name = active_agents[agent_id]['name']
+    agent_name = agent['name']
     chat_session.add_message("System", f"Agent {agent_name} has joined the conversation.", "bot")
     
     return jsonify({
@@ -292,62 +390,63 @@ def agent_pickup():
 @app.route("/agent/send", methods=["POST"])
 def agent_send():
     agent_id = session.get('agent_id')
-    if not agent_id or agent_id not in active_agents:
+    agent = store.get_agent(agent_id) if agent_id else None
+    if agent is None:
         return jsonify({"error": "Agent not logged in"}), 401
     
     data = request.get_json()
     message = data.get("message", "")
-    session_id = active_agents[agent_id].get('session_id')
+    session_id = agent.get('session_id')
     
     if not session_id:
         return jsonify({"error": "No active session"}), 400
     
-    chat_session = chat_sessions.get(session_id)
+    chat_session = ChatSession.load(session_id)
     if not chat_session:
         return jsonify({"error": "Session not found"}), 404
     
     # Add agent message
-    agent_name = active_agents[agent_id]['name']
-    chat_session.add_message(agent_name, message, "agent")
+    sent = chat_session.add_message(agent['name'], message, "agent")
     
-    return jsonify({"status": "sent", "message_id": chat_session.messages[-1]['id']})
+    return jsonify({"status": "sent", "message_id": sent['id']})
 
 @app.route("/agent/end", methods=["POST"])
 def agent_end_session():
     agent_id = session.get('agent_id')
-    if not agent_id or agent_id not in active_agents:
+    agent = store.get_agent(agent_id) if agent_id else None
+    if agent is None:
         return jsonify({"error": "Agent not logged in"}), 401
     
-    session_id = active_agents[agent_id].get('session_id')
+    session_id = agent.get('session_id')
     if session_id:
-        chat_session = chat_sessions.get(session_id)
+        chat_session = ChatSession.load(session_id)
         if chat_session:
-            chat_session.status = 'ended'
+            chat_session.update(status='ended')
             chat_session.add_message("System", "Agent has ended the conversation. Thank you for contacting us!", "bot")
     
     # Reset agent status
-    active_agents[agent_id]['status'] = 'available'
-    active_agents[agent_id]['session_id'] = None
+    store.update_agent(agent_id, status='available', session_id=None)
+    notify_agents()
     
     return jsonify({"status": "session_ended"})
 
 @app.route("/agent/status")
 def agent_status():
     agent_id = session.get('agent_id')
-    if not agent_id or agent_id not in active_agents:
+    agent_info = store.get_agent(agent_id) if agent_id else None
+    if agent_info is None:
         return jsonify({"error": "Agent not logged in"}), 401
     
-    agent_info = active_agents[agent_id]
     session_id = agent_info.get('session_id')
     
     response = {
         "agent_info": agent_info,
-        "queue_length": len(agent_queue),
-        "active_agents_count": len([a for a in active_agents.values() if a['status'] == 'available'])
+        "queue_length": store.queue_length(),
+        "active_agents_count": store.agent_status_counts().get('available', 0)
     }
     
     if session_id:
-        chat_session = chat_sessions.get(session_id)
+        chat_session = ChatSession.load(session_id)
         if chat_session:
             response['current_session'] = chat_session.to_dict()
     
@@ -355,29 +454,92 @@ def agent_status():
 
 @app.route("/session/messages/<session_id>")
 def get_session_messages(session_id):
-    chat_session = chat_sessions.get(session_id)
+    chat_session = ChatSession.load(session_id)
     if not chat_session:
         return jsonify({"error": "Session not found"}), 404
     
+    # ?after=<seq> returns only newer messages
     return jsonify({
-        "messages": chat_session.messages,
+        "messages": store.messages(session_id, after=request.args.get("after", 0, type=int)),
         "status": chat_session.status,
         "agent_id": chat_session.agent_id
     })
 
+@app.route("/session/events/<session_id>")
+def session_events(session_id):
+    """SSE stream of the session's status and messages, resuming after Last-Event-ID (a message seq)"""
+    if not ChatSession.load(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    
+    def load(after):
+        chat_session = ChatSession.load(session_id)
+        events = [("status", chat_session.status_event(), None)] if chat_session else []
+        return events + [("message", m, m['seq']) for m in store.messages(session_id, after=after)]
+    
+    return Response(stream(hub, f"session:{session_id}", load, last_event_id(request), poll=STREAM_POLL),
+                    mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@app.route("/agent/events")
+def agent_events():
+    """SSE stream of the agent's record and the dashboard stats, sent again when they change"""
+    agent_id = session.get('agent_id')
+    if not agent_id or store.get_agent(agent_id) is None:
+        return jsonify({"error": "Agent not logged in"}), 401
+    
+    def load(after):
+        # One stats computation per change, shared by every connected dashboard
+        stats = hub.memo(AGENTS_CHANNEL, "stats", dashboard_stats, max_age=STREAM_POLL)
+        return [("agent", {"agent_id": agent_id, **(store.get_agent(agent_id) or {})}, None), ("stats", stats, None)]
+    
+    return Response(stream(hub, AGENTS_CHANNEL, load, poll=STREAM_POLL, reload_on_event=True),
+                    mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@app.route("/session/leave/<session_id>", methods=["POST"])
+def leave_session(session_id):
+    chat_session = ChatSession.load(session_id)
+    if not chat_session:
+        return jsonify({"error": "Session not found"}), 404
+    
+    left = chat_session.leave_queue()
+    return jsonify({"status": chat_session.status, "left_queue": left})
+
+def dashboard_stats():
+    """From the store's status counters and the rolling metrics; no session scan"""
+    sessions = store.status_counts()
+    agents = sample_agents()
+    return {
+        "total_sessions": store.session_count(),
+        "active_sessions": sum(sessions.get(status, 0) for status in ACTIVE_STATUSES),
+        "waiting_sessions": sessions.get('waiting_agent', 0),
+        "agent_sessions": sessions.get('with_agent', 0),
+        "queue_length": store.queue_length(),
+        "queue_lanes": store.queue_lengths(),
+        "active_agents": sum(agents.values()),
+        "available_agents": agents.get('available', 0),
+        "busy_agents": agents.get('busy', 0),
+        "metrics": metrics.snapshot()
+    }
+
 @app.route("/admin/stats")
 def admin_stats():
     return jsonify({
-        "total_sessions": len(chat_sessions),
-        "queue_length": len(agent_queue),
-        "active_agents": len(active_agents),
-        "available_agents": len([a for a in active_agents.values() if a['status'] == 'available']),
-        "busy_agents": len([a for a in active_agents.values() if a['status'] == 'busy'])
+        **dashboard_stats(),
+        "push": hub.stats(),
+        "retrieval_cache": kb.cache.stats(),
+        "single_flight": kb.single_flight.stats(),
+        "prompt_context": context_assembler.stats()
     })
 
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text format: message and handoff counters, session / queue / agent gauges"""
+    sample_agents()
+    return Response(metrics.prometheus() + store_gauges(store), content_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     print("🚀 Enhanced Chatbot with Agent Support Starting...")
     print("📱 Customer Interface: http://localhost:5000/")
     print("👨‍💼 Agent Dashboard: http://localhost:5000/agent")
     print("📊 Admin Stats: http://localhost:5000/admin/stats")
+    print("📈 Metrics: http://localhost:5000/metrics")
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+In-process push channels for the chatbots' Server-Sent Events endpoints
+Publishers append events to a channel (e.g. "session:<id>"); each subscriber blocks until
+something newer than its cursor arrives and gets only the new events, so a connection costs work
+proportional to what changes instead of poll rate x history length. Publishing to a channel with
+no subscribers is a no-op; a short replay buffer covers subscribers busy writing, and one that
+fell further behind reloads from the session store, which is also how a reconnecting client
+resumes from its Last-Event-ID.
+Usage: hub.publish("session:" + sid, "message", message, event_id=message["seq"])
+       return Response(stream(hub, "session:" + sid, load, last_id), mimetype="text/event-stream")
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class Event:
+    __slots__ = ("cursor", "event", "data", "event_id")
+
+    def __init__(self, cursor: int, event: str, data, event_id: Optional[int]):
+        self.cursor = cursor
+        self.event = event
+        self.data = data
+        self.event_id = event_id
+
+
+class _Channel:
+    __slots__ = ("condition", "events", "cursor", "subscribers")
+
+    def __init__(self, lock: threading.Lock, buffer_size: int):
+        # One condition per channel, so a publish wakes only that channel's subscribers
+        self.condition = threading.Condition(lock)
+        self.events = deque(maxlen=buffer_size)
+        self.cursor = 0
+        self.subscribers = 0
+
+
+class Subscription:
+    """A subscriber's cursor in one channel; close() (or the with block) unsubscribes"""
+
+    def __init__(self, hub: "EventHub", channel: str, state: _Channel):
+        self.hub = hub
+        self.channel = channel
+        self._state = state
+        self.cursor = state.cursor
+        self.closed = False
+
+    def next(self, timeout: float) -> Optional[List[Event]]:
+        """Events published since the last call, [] after timeout seconds without any, or None
+        when some were dropped from the replay buffer (reload from the store)"""
+        state = self._state
+        with state.condition:
+            if state.cursor == self.cursor:
+                state.condition.wait(timeout)
+            if state.cursor == self.cursor:
+                return []
+            events = state.events
+            lost = not events or events[0].cursor > self.cursor + 1
+            fresh = [] if lost else [e for e in reversed(events) if e.cursor > self.cursor][::-1]
+            self.cursor = state.cursor
+        with self.hub._lock:
+            if lost:
+                self.hub.lost += 1
+            else:
+                self.hub.delivered += len(fresh)
+        return None if lost else fresh
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub._unsubscribe(self.channel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class EventHub:
+    """Thread-safe publish / subscribe of events per channel"""
+
+    def __init__(self, buffer_size: int = 256):
+        self.buffer_size = buffer_size
+        self._channels: Dict[str, _Channel] = {}
+        self._memo: Dict[Tuple[str, str], Tuple[int, float, object]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.lost = 0
+        self.connections = 0
+
+    def subscribe(self, channel: str) -> Subscription:
+        with self._lock:
+            state = self._channels.get(channel)
+            if state is None:
+                state = self._channels[channel] = _Channel(self._lock, self.buffer_size)
+            state.subscribers += 1
+            self.connections += 1
+            return Subscription(self, channel, state)
+
+    def _unsubscribe(self, channel: str):
+        with self._lock:
+            state = self._channels[channel]
+            state.subscribers -= 1
+            if not state.subscribers:
+                del self._channels[channel]
+                for key in [k for k in self._memo if k[0] == channel]:
+                    del self._memo[key]
+
+    def publish(self, channel: str, event: str, data=None, event_id: Optional[int] = None) -> int:
+        """Deliver to the channel's subscribers; returns how many there are"""
+        with self._lock:
+            state = self._channels.get(channel)
+            if state is None:
+                return 0
+            state.cursor += 1
+            state.events.append(Event(state.cursor, event, data, event_id))
+            self.published += 1
+            state.condition.notify_all()
+            return state.subscribers
+
+    def memo(self, channel: str, name: str, fn: Callable[[], object], max_age: Optional[float] = None):
+        """fn() computed at most once per event on the channel (and per max_age seconds, for
+        changes made by other processes) and shared by its subscribers"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._channels.get(channel)
+            cursor = state.cursor if state is not None else -1
+            cached = self._memo.get((channel, name))
+            if cached is not None and cached[0] == cursor and (max_age is None or now - cached[1] < max_age):
+                return cached[2]
+        value = fn()
+        with self._lock:
+            if channel in self._channels:
+                self._memo[(channel, name)] = (cursor, now, value)
+        return value
+
+    def subscribers(self, channel: str) -> int:
+        state = self._channels.get(channel)
+        return state.subscribers if state is not None else 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "subscribers": sum(s.subscribers for s in self._channels.values()),
+                "connections": self.connections,
+                "published": self.published,
+                "delivered": self.delivered,
+                "lost": self.lost,
+            }
+
+
+def format_sse(event: str, data, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def last_event_id(request) -> int:
+    """Resume point of an EventSource: the Last-Event-ID header it sends on reconnect, or
+    ?last_event_id= on the first connection"""
+    value = request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def stream(hub: EventHub, channel: str, load: Callable[[int], List[Tuple[str, object, Optional[int]]]],
+           last_id: int = 0, heartbeat: float = 15.0, poll: Optional[float] = None,
+           reload_on_event: bool = False, throttle: float = 1.0) -> Iterator[str]:
+    """SSE text for a subscriber of channel
+
+    Subscribes on the first read (a generator that is never started holds nothing) and before
+    the first load, so nothing published in between is missed. load(last_id) returns
+    (event, data, event_id) tuples from the store: the current state plus everything numbered
+    after last_id. It runs first, whenever the subscriber fell behind the replay buffer, and
+    every poll seconds when other processes write to the store too. Numbered events at or below
+    last_id are skipped, and so is an unnumbered event identical to the last one of its name, so
+    reloads cost bandwidth only when something changed. With reload_on_event, pushed events just
+    trigger a load, at most once per throttle seconds.
+    """
+    subscription = hub.subscribe(channel)
+    sent: Dict[str, str] = {}
+    pending: Optional[List[Event]] = None  # None: load from the store
+    last_write = last_load = 0.0
+    try:
+        yield "retry: 3000\n\n"
+        last_write = time.monotonic()
+        while True:
+            if pending is None or (reload_on_event and pending):
+                if pending and time.monotonic() - last_load < throttle:
+                    time.sleep(throttle - (time.monotonic() - last_load))
+                    subscription.next(0)  # whatever arrived meanwhile is covered by this load
+                items = load(last_id)
+                last_load = time.monotonic()
+            else:
+                items = [(e.event, e.data, e.event_id) for e in pending]
+            for event, data, event_id in items:
+                if event_id is not None:
+                    if event_id <= last_id:
+                        continue
+                    last_id = event_id
+                    text = format_sse(event, data, event_id)
+                else:
+                    text = format_sse(event, data)
+                    if sent.get(event) == text:
+                        continue
+                    sent[event] = text
+                last_write = time.monotonic()
+                yield text
+            now = time.monotonic()
+            timeout = heartbeat - (now - last_write)
+            if poll:
+                timeout = min(timeout, last_load + poll - now)
+            pending = subscription.next(max(timeout, 0.0))
+            if pending == []:
+                now = time.monotonic()
+                if poll and now >= last_load + poll:
+                    pending = None
+                elif now - last_write >= heartbeat:
+                    last_write = now
+                    yield ": keep-alive\n\n"
+    finally:
+        subscription.close()
@@ -0,0 +1,184 @@
+"""
+Bounded per-session conversation history
+Replaces an unbounded {session_id: [dict, ...]} with a store that keeps at most max_turns turns
+per session, drops sessions idle for longer than idle_ttl, and evicts the least recently used
+sessions once the estimated size of all history exceeds memory_budget bytes. Turns are compact
+__slots__ records with a float timestamp; to_dict() gives the old JSON shape back.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class Turn:
+    """One user message and the reply"""
+
+    __slots__ = ("user", "assistant", "timestamp", "mode")
+
+    def __init__(self, user: str, assistant: str, timestamp: Optional[float] = None, mode: str = "simple"):
+        self.user = user
+        self.assistant = assistant
+        self.timestamp = time.time() if timestamp is None else timestamp
+        # Few distinct modes; interning shares one string object between all turns
+        self.mode = sys.intern(mode)
+
+    def to_dict(self) -> Dict:
+        return {"user": self.user, "assistant": self.assistant,
+                "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(), "mode": self.mode}
+
+    def size(self) -> int:
+        """Estimated bytes held by this turn (the mode string is shared)"""
+        return _TURN_OVERHEAD + sys.getsizeof(self.user) + sys.getsizeof(self.assistant)
+
+
+_TURN_OVERHEAD = sys.getsizeof(Turn("", "", 0.0)) + sys.getsizeof(0.0)
+
+
+class _Session:
+    # A plain list, not a deque: a deque allocates a 64-slot block even for one turn
+    __slots__ = ("turns", "last_seen", "size")
+
+    def __init__(self, now: float):
+        self.turns: List[Turn] = []
+        self.last_seen = now
+        self.size = 0
+
+
+# The session record, its turn list and its node in the store's ordered dict
+_SESSION_OVERHEAD = sys.getsizeof(_Session(0.0)) + sys.getsizeof([None] * 4) + 100
+
+
+class HistoryStore:
+    """Interface of a session history store; BoundedHistoryStore is the in-process one"""
+
+    def append(self, session_id: str, turn: Turn):
+        raise NotImplementedError
+
+    def get(self, session_id: str) -> List[Turn]:
+        raise NotImplementedError
+
+    def clear(self, session_id: str):
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"sessions": len(self)}
+
+
+class BoundedHistoryStore(HistoryStore):
+    """Thread-safe history store with per-session caps, idle TTL and a global LRU memory budget
+
+    Sessions are kept in last-access order, so expiry and eviction both pop from the front and
+    cost O(1) per dropped session.
+    """
+
+    def __init__(self, max_turns: int = 50, idle_ttl: float = 3600.0, memory_budget: int = 128 << 20,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self.clock = clock
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.expired = 0
+        self.evicted = 0
+        self.trimmed_turns = 0
+
+    def append(self, session_id: str, turn: Turn):
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(now)
+                session.size = _SESSION_OVERHEAD
+                self.bytes += session.size
+            else:
+                self._sessions.move_to_end(session_id)
+                session.last_seen = now
+            session.turns.append(turn)
+            if len(session.turns) > self.max_turns:
+                # O(max_turns), and max_turns is small
+                dropped = session.turns.pop(0).size()
+                session.size -= dropped
+                self.bytes -= dropped
+                self.trimmed_turns += 1
+            added = turn.size()
+            session.size += added
+            self.bytes += added
+            # The session just written is last in order, so it is evicted only if it alone is over budget
+            while self.bytes > self.memory_budget and len(self._sessions) > 1:
+                self._drop_oldest()
+                self.evicted += 1
+
+    def get(self, session_id: str) -> List[Turn]:
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session.turns[:]
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self.bytes -= session.size
+
+    def sweep(self) -> int:
+        """Drop idle sessions now (they are also dropped lazily on every access)"""
+        with self._lock:
+            before = self.expired
+            self._expire(self.clock())
+            return self.expired - before
+
+    def _expire(self, now: float):
+        """Caller holds the lock"""
+        deadline = now - self.idle_ttl
+        sessions = self._sessions
+        while sessions:
+            oldest = next(iter(sessions.values()))
+            if oldest.last_seen > deadline:
+                break
+            self._drop_oldest()
+            self.expired += 1
+
+    def _drop_oldest(self):
+        _, session = self._sessions.popitem(last=False)
+        self.bytes -= session.size
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._sessions))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "estimated_bytes": self.bytes,
+                "memory_budget": self.memory_budget,
+                "max_turns": self.max_turns,
+                "idle_ttl": self.idle_ttl,
+                "expired_sessions": self.expired,
+                "evicted_sessions": self.evicted,
+                "trimmed_turns": self.trimmed_turns,
+            }
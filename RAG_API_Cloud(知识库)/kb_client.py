@@ -0,0 +1,317 @@
+"""
+Pooled knowledge-base client for the RAG scripts
+One credential, one keep-alive session to api-knowledgebase and cached signing keys, instead of
+building a new Credentials / Request and running SignerV4.sign for every call in prepare_request().
+Signing is shared with HMAC_Sign_Template (signer.py / client.py / credentials.py).
+"""
+
+import datetime
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterator, List, Optional
+
+_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "HMAC_Sign_Template")
+if _TEMPLATE_DIR not in sys.path:
+    sys.path.insert(0, _TEMPLATE_DIR)
+
+import requests  # noqa: E402
+
+from client import DEFAULT_TIMEOUT, PooledSession  # noqa: E402
+from credentials import Credential, CredentialProvider, StaticCredentialProvider  # noqa: E402
+from signer import Signer, hash_body  # noqa: E402
+
+from retrieval_cache import INVALIDATION_DIR, RetrievalCache, notify_invalidation  # noqa: E402
+from single_flight import SingleFlight, SingleFlightTimeout  # noqa: E402
+from sse_stream import coalesce, extract_delta, iter_payloads  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOMAIN = "api-knowledgebase.mlp.cn-hongkong.bytepluses.com"
+# The knowledge base API is signed as service "air" in cn-north-1 regardless of the endpoint
+SERVICE = "air"
+REGION = "cn-north-1"
+CONTENT_TYPE = "application/json; charset=utf-8"
+
+SEARCH_PATH = "/api/knowledge/collection/search_knowledge"
+CHAT_PATH = "/api/knowledge/chat/completions"
+DOC_ADD_PATH = "/api/knowledge/doc/add"
+DOC_DELETE_PATH = "/api/knowledge/doc/delete"
+DOC_INFO_PATH = "/api/knowledge/doc/info"
+COLLECTION_INFO_PATH = "/api/knowledge/collection/info"
+COLLECTION_LIST_PATH = "/api/knowledge/collection/list"
+FILE_LIST_PATH = "/api/knowledge/file/list"
+
+
+class KnowledgeBaseError(Exception):
+    """Non-zero `code` in a knowledge-base response (status is the HTTP status when known)"""
+
+    def __init__(self, path: str, code, message: str, status: Optional[int] = None):
+        super().__init__(f"{path} failed: code={code} {message}")
+        self.path = path
+        self.code = code
+        self.message = message
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        """Throttled or a server-side failure; worth retrying with backoff"""
+        return self.status is not None and (self.status == 429 or self.status >= 500)
+
+
+class KnowledgeBaseClient:
+    """Typed, thread-safe client for the knowledge-base HTTP API"""
+
+    def __init__(self, ak: Optional[str] = None, sk: Optional[str] = None, account_id: str = "",
+                 domain: str = DEFAULT_DOMAIN, project: str = "", collection: str = "",
+                 credentials: Optional[CredentialProvider] = None, session: Optional[PooledSession] = None,
+                 pool_maxsize: int = 20, timeout=DEFAULT_TIMEOUT, scheme: str = "https",
+                 cache: Optional[RetrievalCache] = None, invalidation_dir: Optional[str] = INVALIDATION_DIR,
+                 single_flight: Optional[SingleFlight] = None):
+        self.account_id = account_id
+        self.domain = domain
+        self.project = project
+        self.collection = collection
+        self.scheme = scheme
+        self.signer = Signer(SERVICE, REGION, domain, CONTENT_TYPE)
+        self.credentials = credentials if credentials is not None else StaticCredentialProvider(ak, sk)
+        self.credentials.subscribe(self._on_rotate)
+        self.session = session if session is not None else PooledSession(pool_maxsize=pool_maxsize,
+                                                                          timeout=timeout)
+        self._base_headers = {"Accept": "application/json", "V-Account-Id": account_id}
+        # Optional search_knowledge result cache; document changes invalidate it, and touch
+        # the marker in invalidation_dir so caches in other processes drop the collection too
+        self.cache = cache
+        self.invalidation_dir = invalidation_dir
+        # Optional coalescing of identical concurrent searches and temperature-0 completions
+        self.single_flight = single_flight
+
+    def _on_rotate(self, old: Credential, new: Credential):
+        self.signer.key_cache.invalidate(old.secret_access_key)
+
+    def request(self, path: str, body: Optional[Dict] = None, method: str = "POST",
+                stream: bool = False) -> requests.Response:
+        """Sign and send one call, returning the raw response"""
+        data = json.dumps(body) if body is not None else None
+        content_sha256, payload, _ = hash_body(data)
+        credential = self.credentials.get()
+        sign_result = self.signer.sign(method, datetime.datetime.utcnow(), {}, credential.access_key_id,
+                                       credential.secret_access_key, None, path=path,
+                                       content_sha256=content_sha256,
+                                       session_token=credential.session_token)
+        return self.session.request(method, f"{self.scheme}://{self.domain}{path}",
+                                    headers={**self._base_headers, **sign_result}, data=payload,
+                                    stream=stream)
+
+    def call(self, path: str, body: Optional[Dict] = None) -> Dict:
+        """POST and return the `data` field, raising KnowledgeBaseError on a non-zero code"""
+        rsp = self.request(path, body)
+        try:
+            result = rsp.json()
+        except ValueError:
+            raise KnowledgeBaseError(path, rsp.status_code, rsp.text[:200], rsp.status_code)
+        if result.get("code", 0) != 0:
+            raise KnowledgeBaseError(path, result.get("code"), result.get("message", ""), rsp.status_code)
+        return result.get("data") or {}
+
+    def search_knowledge(self, query: str, limit: int = 5, dense_weight: float = 0.5,
+                         need_instruction: bool = False, rewrite: bool = False,
+                         return_token_usage: bool = False, chunk_group: bool = True,
+                         rerank_switch: bool = False, chunk_diffusion_count: int = 0,
+                         collection: Optional[str] = None, messages: Optional[List[Dict]] = None, **extra) -> Dict:
+        """collection/search_knowledge; returns data with result_list
+
+        With a cache attached, single-turn searches (no messages) are served from it.
+        With single_flight set, identical searches already in flight share their result.
+        """
+        collection = collection or self.collection
+        options = dict(need_instruction=need_instruction, rewrite=rewrite, return_token_usage=return_token_usage,
+                       chunk_group=chunk_group, rerank_switch=rerank_switch,
+                       chunk_diffusion_count=chunk_diffusion_count, **extra)
+        if self.cache is not None and not messages:
+            return self.cache.get_or_fetch(
+                query, lambda: self._search(query, limit, dense_weight, collection, None, options),
+                collection, limit, dense_weight, **options)
+        return self._search(query, limit, dense_weight, collection, messages, options)
+
+    def _search(self, query, limit, dense_weight, collection, messages, options) -> Dict:
+        options = dict(options)
+        pre_processing = {name: options.pop(name) for name in ("need_instruction", "rewrite", "return_token_usage")}
+        post_processing = {name: options.pop(name) for name in ("chunk_group", "rerank_switch",
+                                                                "chunk_diffusion_count")}
+        if messages:
+            pre_processing["messages"] = messages
+        body = {
+            "project": self.project,
+            "name": collection,
+            "query": query,
+            "limit": limit,
+            "pre_processing": pre_processing,
+            "dense_weight": dense_weight,
+            "post_processing": post_processing,
+            **options,
+        }
+        return self._coalesced("search_knowledge", SEARCH_PATH, body)
+
+    def _coalesced(self, kind: str, path: str, body: Dict) -> Dict:
+        """call(path, body), shared with an identical call already in flight when single_flight is set"""
+        if self.single_flight is None:
+            return self.call(path, body)
+        key = (kind, json.dumps(body, sort_keys=True, ensure_ascii=False))
+        try:
+            return self.single_flight.do(key, lambda: self.call(path, body))
+        except SingleFlightTimeout as e:
+            raise KnowledgeBaseError(path, "coalesce_timeout", str(e), 504) from None
+
+    def _chat_body(self, messages, model, stream, max_tokens, temperature, return_token_usage, extra):
+        body = {
+            "messages": messages,
+            "stream": stream,
+            "return_token_usage": return_token_usage,
+            "model": model,
+            "temperature": temperature,
+            **extra,
+        }
+        if max_tokens is not None:
+            body["max_tokens"] = max_tokens
+        return body
+
+    def chat_completions(self, messages: List[Dict], model: str = "Skylark-pro", max_tokens: Optional[int] = 1024,
+                         temperature: float = 0.7, return_token_usage: bool = True, **extra) -> Dict:
+        """Non-stream chat/completions; returns data with generated_answer
+
+        With single_flight set, identical temperature-0 (deterministic) requests in flight at the
+        same time share one upstream call; sampled completions are never coalesced.
+        """
+        body = self._chat_body(messages, model, False, max_tokens, temperature, return_token_usage, extra)
+        if temperature == 0:
+            return self._coalesced("chat_completions", CHAT_PATH, body)
+        return self.call(CHAT_PATH, body)
+
+    def chat_completions_stream(self, messages: List[Dict], model: str = "Skylark-pro",
+                                max_tokens: Optional[int] = None, temperature: float = 0.7,
+                                return_token_usage: bool = False, **extra) -> Iterator[Dict]:
+        """Stream chat/completions; yields the `data` object of each SSE event until `end`"""
+        body = self._chat_body(messages, model, True, max_tokens, temperature, return_token_usage, extra)
+        with self.request(CHAT_PATH, body, stream=True) as rsp:
+            for line in rsp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[len("data:"):].strip())
+                except ValueError:
+                    logger.warning("unparsable stream line: %r", line)
+                    continue
+                data = event.get("data") or {}
+                yield data
+                if data.get("end"):
+                    break
+
+    def chat_completions_deltas(self, messages: List[Dict], model: str = "Skylark-pro",
+                                max_tokens: Optional[int] = None, temperature: float = 0.7,
+                                coalesce_window: float = 0.0, **extra) -> Iterator[str]:
+        """Stream chat/completions as generated_answer text deltas
+
+        Decodes the raw response bytes incrementally (sse_stream.py) instead of per-line str +
+        json.loads; deltas arriving within coalesce_window seconds are merged. Raises
+        KnowledgeBaseError for an error response or error event.
+        """
+        body = self._chat_body(messages, model, True, max_tokens, temperature, False, extra)
+        yield from coalesce(self._stream_deltas(body), coalesce_window)
+
+    def _stream_deltas(self, body: Dict) -> Iterator[str]:
+        with self.request(CHAT_PATH, body, stream=True) as rsp:
+            # Errors come back as a plain JSON body instead of an event stream
+            if rsp.status_code != 200 or rsp.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    result = rsp.json()
+                except ValueError:
+                    raise KnowledgeBaseError(CHAT_PATH, rsp.status_code, rsp.text[:200])
+                raise KnowledgeBaseError(CHAT_PATH, result.get("code", rsp.status_code), result.get("message", ""))
+            # The last event is flushed even when the stream ends without its blank line
+            for payload in iter_payloads(rsp.iter_content(chunk_size=None)):
+                try:
+                    answer, end, event = extract_delta(payload)
+                except ValueError:
+                    logger.warning("unparsable stream event: %r", payload[:200])
+                    continue
+                if event is not None and event.get("code", 0) != 0:
+                    raise KnowledgeBaseError(CHAT_PATH, event.get("code"), event.get("message", ""))
+                if answer:
+                    yield answer
+                if end:
+                    return
+
+    def add_doc(self, doc_id: str, doc_name: str, doc_type: str, url: Optional[str] = None,
+                add_type: str = "url", collection: Optional[str] = None, **extra) -> Dict:
+        """doc/add, e.g. add_doc("DS_PDF", "Deepseek PDF", "pdf", url="https://...")"""
+        body = {
+            "collection_name": collection or self.collection,
+            "project": self.project,
+            "add_type": add_type,
+            "doc_id": doc_id,
+            "doc_name": doc_name,
+            "doc_type": doc_type,
+            **extra,
+        }
+        if url is not None:
+            body["url"] = url
+        result = self.call(DOC_ADD_PATH, body)
+        self._documents_changed(body["collection_name"])
+        return result
+
+    def delete_doc(self, doc_id: str, collection: Optional[str] = None) -> Dict:
+        collection = collection or self.collection
+        result = self.call(DOC_DELETE_PATH, {"collection_name": collection, "project": self.project,
+                                             "doc_id": doc_id})
+        self._documents_changed(collection)
+        return result
+
+    def _documents_changed(self, collection: str):
+        if self.cache is not None:
+            self.cache.invalidate(collection)
+        if self.invalidation_dir is not None:
+            notify_invalidation(collection, self.invalidation_dir)
+
+    def doc_info(self, doc_id: str, collection: Optional[str] = None) -> Dict:
+        """doc/info; data["status"]["process_status"] is 0 done, 1 failed, 2 / 3 queued or processing"""
+        return self.call(DOC_INFO_PATH, {"collection_name": collection or self.collection, "project": self.project,
+                                         "doc_id": doc_id})
+
+    def collection_info(self, collection: Optional[str] = None) -> Dict:
+        return self.call(COLLECTION_INFO_PATH, {"project": self.project, "name": collection or self.collection})
+
+    def list_collections(self, brief: bool = False) -> Dict:
+        return self.call(COLLECTION_LIST_PATH, {"project": self.project, "brief": brief})
+
+    def list_files(self, collection: Optional[str] = None, offset: Optional[int] = None,
+                   limit: Optional[int] = None) -> Dict:
+        body = {"collection_name": collection or self.collection}
+        if offset is not None:
+            body["offset"] = offset
+        if limit is not None:
+            body["limit"] = limit
+        return self.call(FILE_LIST_PATH, body)
+
+    def iter_files(self, collection: Optional[str] = None, page_size: int = 100) -> Iterator[Dict]:
+        """Every document of the collection, paging through file/list"""
+        offset = 0
+        while True:
+            docs = self.list_files(collection, offset, page_size).get("doc_list") or []
+            yield from docs
+            if len(docs) < page_size:
+                return
+            offset += len(docs)
+
+    def connection_stats(self):
+        return self.session.connection_stats()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
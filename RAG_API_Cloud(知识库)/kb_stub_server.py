@@ -0,0 +1,328 @@
+"""
+Local stand-in for the knowledge-base API, for offline tests and benchmarks
+Verifies the HMAC-SHA256 signature like the real service, searches an in-memory corpus by keyword
+overlap and answers chat/completions (stream and non-stream) from the retrieved context.
+Usage: python kb_stub_server.py --port 8081 --ak youak --sk yoursk --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import re
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import kb_client  # noqa: F401  (puts HMAC_Sign_Template on sys.path)
+from kb_client import (CHAT_PATH, COLLECTION_INFO_PATH, COLLECTION_LIST_PATH, DOC_ADD_PATH, DOC_DELETE_PATH,
+                       DOC_INFO_PATH, FILE_LIST_PATH, SEARCH_PATH)
+from mock_openapi_server import MockOpenAPIServer, TokenBucket, verify_signature
+from retrieval_cache import _cosine, _unit, ngram_embedding
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_DOCS = {
+    "llm_firewall": {
+        "doc_name": "LLM Firewall Guide", "doc_type": "pdf",
+        "chunks": [
+            "The LLM firewall inspects prompts and responses to block prompt injection and data leakage.",
+            "Firewall policies can be configured per application with allow lists and sensitive word filters.",
+            "The firewall adds less than 10 ms of latency to each model call.",
+        ],
+    },
+    "kb_quickstart": {
+        "doc_name": "Knowledge Base Quickstart", "doc_type": "pdf",
+        "chunks": [
+            "Create a collection, upload documents by URL and wait until processing finishes.",
+            "search_knowledge returns the most relevant chunks; dense_weight balances semantic and keyword retrieval.",
+            "Enable rerank_switch to rerank retrieved chunks with a cross-encoder for better precision.",
+        ],
+    },
+    "faq": {
+        "doc_name": "Support FAQ", "doc_type": "faq.xlsx",
+        "chunks": [
+            "Reset your password from the console login page using the forgot password link.",
+            "Refunds are processed within five business days after approval.",
+            "Request a refund from the billing page within 30 days of purchase.",
+            "Change the account email under profile settings; a confirmation link is sent to the new address.",
+        ],
+        "questions": ["How do I reset my password?", "How long do refunds take?", "How do I request a refund?",
+                      "How do I change my account email?"],
+    },
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+class KnowledgeBaseStub(MockOpenAPIServer):
+    """Signed knowledge-base API over an in-memory collection
+
+    latency applies to every call and answer_latency additionally to chat/completions;
+    stream_interval is the delay between streamed answer tokens. Documents added through
+    doc/add report "processing" in doc/info for processing_time seconds, and URLs containing
+    "fail" end up failed. throttle_rps answers excess calls per AK with 429.
+    search_knowledge blends keyword overlap with a character n-gram "semantic" score by dense_weight,
+    rerank_switch rescores the candidates by query coverage (adding rerank_latency), and
+    chunk_diffusion_count appends neighbouring chunks, so parameter sweeps see real differences.
+    """
+
+    def __init__(self, credentials: Dict[str, str], documents: Optional[Dict[str, Dict]] = None,
+                 collection: str = "test", answer_latency: float = 0.0, stream_interval: float = 0.0,
+                 processing_time: float = 0.0, rerank_latency: float = 0.0, **kwargs):
+        super().__init__(credentials, responses={}, **kwargs)
+        self.collection = collection
+        self.answer_latency = answer_latency
+        self.stream_interval = stream_interval
+        self.processing_time = processing_time
+        self.rerank_latency = rerank_latency
+        # doc_id -> (ready_at, failed) for documents added through doc/add
+        self.processing: Dict[str, Tuple[float, bool]] = {}
+        self.documents: Dict[str, Dict] = {}
+        self.paths: Dict[str, int] = {}
+        self._chunks: List[Dict] = []
+        for doc_id, doc in (SAMPLE_DOCS if documents is None else documents).items():
+            self.add_document(doc_id, doc)
+
+    def add_document(self, doc_id: str, doc: Dict):
+        self.documents[doc_id] = doc
+        self._reindex()
+
+    def _reindex(self):
+        self._chunks = []
+        for doc_id, doc in self.documents.items():
+            questions = doc.get("questions") or []
+            for i, content in enumerate(doc["chunks"]):
+                chunk = {"doc_id": doc_id, "chunk_id": i, "content": content,
+                         "terms": set(tokenize(content + " " + doc["doc_name"]))}
+                if i < len(questions):
+                    chunk["original_question"] = questions[i]
+                    chunk["terms"] |= set(tokenize(questions[i]))
+                chunk["vector"] = _unit(ngram_embedding(f"{chunk.get('original_question', '')} {content}"))
+                self._chunks.append(chunk)
+
+    def search(self, query: str, limit: int = 10, dense_weight: float = 0.0, rerank: bool = False,
+               diffusion: int = 0) -> List[Dict]:
+        """Keyword-overlap retrieval blended with n-gram similarity by dense_weight, best first"""
+        terms = set(tokenize(query))
+        vector = _unit(ngram_embedding(query)) if dense_weight or rerank else None
+        scored = []
+        for chunk in self._chunks:
+            overlap = len(terms & chunk["terms"])
+            semantic = _cosine(vector, chunk["vector"]) if vector is not None else 0.0
+            if overlap or semantic >= 0.3:
+                keyword = overlap / math.sqrt(len(chunk["terms"]))
+                scored.append(((1 - dense_weight) * keyword + dense_weight * semantic, semantic, chunk))
+        scored.sort(key=lambda item: (-item[0], item[2]["doc_id"], item[2]["chunk_id"]))
+        if rerank:
+            candidates = scored[:max(limit * 3, 10)]
+            scored = sorted(((len(terms & c["terms"]) / max(1, len(terms)) * 0.5 + semantic * 0.5, semantic, c)
+                             for _, semantic, c in candidates),
+                            key=lambda item: (-item[0], item[2]["doc_id"], item[2]["chunk_id"]))
+        hits = [(score, chunk) for score, _, chunk in scored[:limit]]
+        if diffusion:
+            hits = self._diffuse(hits, diffusion)
+        return [self._point(score, chunk) for score, chunk in hits]
+
+    def _diffuse(self, hits, count: int):
+        """Add up to count chunks before and after each hit from the same document"""
+        by_position = {(c["doc_id"], c["chunk_id"]): c for c in self._chunks}
+        seen = {(c["doc_id"], c["chunk_id"]) for _, c in hits}
+        diffused = []
+        for score, chunk in hits:
+            diffused.append((score, chunk))
+            for offset in [o for d in range(1, count + 1) for o in (-d, d)]:
+                key = (chunk["doc_id"], chunk["chunk_id"] + offset)
+                if key in by_position and key not in seen:
+                    seen.add(key)
+                    diffused.append((score * 0.5, by_position[key]))
+        return diffused
+
+    def _point(self, score: float, chunk: Dict) -> Dict:
+        doc = self.documents[chunk["doc_id"]]
+        point = {
+            "id": f"{chunk['doc_id']}-{chunk['chunk_id']}",
+            "point_id": f"{chunk['doc_id']}-{chunk['chunk_id']}",
+            "chunk_id": chunk["chunk_id"],
+            "content": chunk["content"],
+            "score": round(score, 6),
+            "chunk_title": doc["doc_name"],
+            "doc_info": {"doc_id": chunk["doc_id"], "doc_name": doc["doc_name"],
+                         "doc_type": doc["doc_type"], "title": doc["doc_name"]},
+        }
+        if "original_question" in chunk:
+            point["original_question"] = chunk["original_question"]
+        return point
+
+    def answer(self, messages: List[Dict]) -> str:
+        question = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        context = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        hits = self.search(question, 1)
+        if hits and hits[0]["content"] in context:
+            return f"According to the documents: {hits[0]['content']}"
+        return "I could not find this in the reference materials."
+
+    async def handle(self, method, target, headers, body) -> Tuple[int, object]:
+        self.requests += 1
+        path = urlsplit(target).path
+        self.paths[path] = self.paths.get(path, 0) + 1
+        ok, reason = verify_signature(method, target, headers, body, self.credentials,
+                                      self._key_cache, self.max_skew)
+        if not ok:
+            self.signature_failures += 1
+            return 401, {"code": 1000001, "message": reason, "request_id": uuid.uuid4().hex}
+        if self.throttle_rps:
+            ak = headers["authorization"].split("Credential=", 1)[1].split("/", 1)[0]
+            bucket = self._buckets.get(ak)
+            if bucket is None:
+                bucket = self._buckets[ak] = TokenBucket(self.throttle_rps)
+            if not bucket.take():
+                return 429, {"code": 1000029, "message": "rate limit exceeded", "request_id": uuid.uuid4().hex}
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.latency_jitter))
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 500, {"code": 1000010, "message": "injected error", "request_id": uuid.uuid4().hex}
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"code": 1000003, "message": "invalid JSON body"}
+        handler = self._routes().get(path)
+        if handler is None:
+            return 404, {"code": 1000002, "message": f"unknown path {path}"}
+        return await handler(request)
+
+    def _routes(self):
+        return {
+            SEARCH_PATH: self._search,
+            CHAT_PATH: self._chat,
+            DOC_ADD_PATH: self._doc_add,
+            DOC_DELETE_PATH: self._doc_delete,
+            DOC_INFO_PATH: self._doc_info,
+            COLLECTION_INFO_PATH: self._collection_info,
+            COLLECTION_LIST_PATH: self._collection_list,
+            FILE_LIST_PATH: self._file_list,
+        }
+
+    @staticmethod
+    def _ok(data) -> Tuple[int, Dict]:
+        return 200, {"code": 0, "message": "success", "request_id": uuid.uuid4().hex, "data": data}
+
+    async def _search(self, request):
+        query = request.get("query", "")
+        pre = request.get("pre_processing") or {}
+        post = request.get("post_processing") or {}
+        rerank = bool(post.get("rerank_switch"))
+        if rerank and self.rerank_latency:
+            await asyncio.sleep(self.rerank_latency)
+        results = self.search(query, int(request.get("limit", 10)), float(request.get("dense_weight", 0.0)),
+                              rerank, int(post.get("chunk_diffusion_count", 0) or 0))
+        data = {"collection_name": request.get("name", self.collection), "count": len(results),
+                "result_list": results}
+        if pre.get("return_token_usage"):
+            # need_instruction prepends a retrieval instruction to the query before embedding
+            query_tokens = len(tokenize(query)) + (12 if pre.get("need_instruction") else 0)
+            data["token_usage"] = {"embedding_token_usage": {"prompt_tokens": query_tokens}}
+            if rerank:
+                data["token_usage"]["rerank_token_usage"] = sum(len(tokenize(query + " " + r["content"]))
+                                                                for r in results)
+        return self._ok(data)
+
+    async def _chat(self, request):
+        if self.answer_latency:
+            await asyncio.sleep(self.answer_latency)
+        messages = request.get("messages") or []
+        answer = self.answer(messages)
+        prompt_tokens = sum(len(tokenize(m.get("content", ""))) for m in messages)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokenize(answer)),
+                 "total_tokens": prompt_tokens + len(tokenize(answer))}
+        if not request.get("stream"):
+            data = {"generated_answer": answer}
+            if request.get("return_token_usage"):
+                data["usage"] = json.dumps(usage)
+            return self._ok(data)
+        return 200, self._stream(answer, usage)
+
+    async def _stream(self, answer: str, usage: Dict):
+        for token in re.findall(r"\S+\s*", answer):
+            event = {"code": 0, "message": "success", "data": {"generated_answer": token, "end": False}}
+            yield b"data:" + json.dumps(event).encode("utf-8") + b"\n\n"
+            if self.stream_interval:
+                await asyncio.sleep(self.stream_interval)
+        event = {"code": 0, "message": "success",
+                 "data": {"generated_answer": "", "end": True, "usage": json.dumps(usage)}}
+        yield b"data:" + json.dumps(event).encode("utf-8") + b"\n\n"
+
+    async def _doc_add(self, request):
+        doc_id = request.get("doc_id", "")
+        if doc_id in self.documents:
+            return 200, {"code": 1001001, "message": f"doc {doc_id} already exists"}
+        # The stub cannot fetch URLs; an optional "content" field stands in for the document text
+        content = request.get("content") or f"{request.get('doc_name', doc_id)} imported from {request.get('url', '')}"
+        self.add_document(doc_id, {"doc_name": request.get("doc_name", doc_id),
+                                   "doc_type": request.get("doc_type", "txt"),
+                                   "chunks": [c for c in content.split("\n\n") if c.strip()]})
+        self.processing[doc_id] = (time.monotonic() + self.processing_time, "fail" in request.get("url", ""))
+        return self._ok({"collection_name": self.collection, "doc_id": doc_id})
+
+    async def _doc_delete(self, request):
+        doc_id = request.get("doc_id", "")
+        if self.documents.pop(doc_id, None) is None:
+            return 200, {"code": 1001002, "message": f"doc {doc_id} not found"}
+        self.processing.pop(doc_id, None)
+        self._reindex()
+        return self._ok({})
+
+    async def _doc_info(self, request):
+        doc_id = request.get("doc_id", "")
+        doc = self.documents.get(doc_id)
+        if doc is None:
+            return 200, {"code": 1001002, "message": f"doc {doc_id} not found"}
+        ready_at, failed = self.processing.get(doc_id, (0.0, False))
+        if time.monotonic() < ready_at:
+            status = {"process_status": 2}
+        elif failed:
+            status = {"process_status": 1, "failed_code": 10001, "failed_msg": "document could not be parsed"}
+        else:
+            status = {"process_status": 0}
+        return self._ok({"collection_name": self.collection, "doc_id": doc_id, "doc_name": doc["doc_name"],
+                         "doc_type": doc["doc_type"], "point_num": len(doc["chunks"]), "status": status})
+
+    async def _collection_info(self, request):
+        return self._ok({"collection_name": request.get("name", self.collection), "project": "default",
+                         "doc_num": len(self.documents), "point_num": len(self._chunks)})
+
+    async def _collection_list(self, request):
+        return self._ok({"collection_list": [{"collection_name": self.collection,
+                                              "doc_num": len(self.documents)}]})
+
+    async def _file_list(self, request):
+        docs = [{"doc_id": doc_id, "doc_name": doc["doc_name"], "doc_type": doc["doc_type"]}
+                for doc_id, doc in self.documents.items()]
+        offset = int(request.get("offset", 0))
+        limit = int(request.get("limit", 100))
+        return self._ok({"doc_list": docs[offset:offset + limit], "total_num": len(docs)})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local knowledge-base API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--ak", default="youak")
+    parser.add_argument("--sk", default="yoursk")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--answer-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stub = KnowledgeBaseStub({args.ak: args.sk}, host=args.host, port=args.port,
+                             latency=args.latency_ms / 1000, answer_latency=args.answer_latency_ms / 1000)
+    try:
+        asyncio.run(stub.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Incremental sync of a local corpus into a knowledge-base collection
+Hashes every local document, compares with the hashes recorded at the last sync (a JSON state file)
+and the collection's file/list, and issues only the doc/add (new), doc/delete + doc/add (changed)
+and doc/delete (removed) calls that are needed, in parallel under a rate limit.
+Only documents this sync added before are deleted unless --delete-unmanaged is given.
+Usage: python kb_sync.py --dir ./docs --url-prefix https://bucket.example.com/docs/ --collection test
+       python kb_sync.py --manifest docs.csv --collection test --dry-run
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import unquote
+
+import requests
+
+from kb_client import DEFAULT_DOMAIN, KnowledgeBaseClient, KnowledgeBaseError
+from bulk_ingest import DOC_EXISTS, DOC_NOT_FOUND, RateLimiter, list_directory, read_manifest, retry_call
+from credentials import EnvironmentCredentialProvider, StaticCredentialProvider
+from retrieval_cache import notify_invalidation
+
+logger = logging.getLogger(__name__)
+
+ADD, UPDATE, DELETE = "add", "update", "delete"
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def local_corpus(docs: Iterable[Dict], root: Optional[str] = None) -> Dict[str, Dict]:
+    """doc_id -> document with its content "hash"
+
+    The hash comes from a "hash" field (e.g. an ETag from the manifest), otherwise from the
+    file at "path" (relative to root), otherwise from the URL itself.
+    """
+    corpus = {}
+    for doc in docs:
+        doc = dict(doc)
+        if "hash" not in doc:
+            path = doc.pop("path", None)
+            if path is not None:
+                doc["hash"] = file_sha256(os.path.join(root, path) if root else path)
+            else:
+                doc["hash"] = hashlib.sha256(doc["url"].encode("utf-8")).hexdigest()
+        corpus[doc["doc_id"]] = doc
+    return corpus
+
+
+def directory_corpus(directory: str, url_prefix: str) -> Dict[str, Dict]:
+    docs = []
+    for doc in list_directory(directory, url_prefix):
+        relative = doc["url"][len(url_prefix.rstrip("/")) + 1:]
+        docs.append({**doc, "path": unquote(relative)})
+    return local_corpus(docs, directory)
+
+
+class SyncState:
+    """JSON file of doc_id -> hash / url of what was last synced to the collection"""
+
+    def __init__(self, path: str, collection: str):
+        self.path = path
+        self.collection = collection
+        self.docs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("collection") == collection:
+                self.docs = state.get("docs", {})
+            else:
+                logger.warning("%s belongs to collection %r, starting fresh", path, state.get("collection"))
+
+    def record(self, doc_id: str, doc: Optional[Dict]):
+        with self._lock:
+            if doc is None:
+                self.docs.pop(doc_id, None)
+            else:
+                self.docs[doc_id] = {"hash": doc["hash"], "url": doc["url"], "synced_at": time.time()}
+
+    def save(self):
+        """Atomic rewrite (temp file + rename), so an interrupted sync never leaves a torn state file"""
+        with self._save_lock:
+            with self._lock:
+                payload = json.dumps({"collection": self.collection, "docs": self.docs}, indent=1, sort_keys=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, self.path)
+
+
+def plan(local: Dict[str, Dict], synced: Dict[str, Dict], remote: Iterable[str],
+         delete_unmanaged: bool = False, adopt: bool = False) -> Dict[str, List[str]]:
+    """doc_ids to add, update (delete + add) and delete, plus the unchanged ones
+
+    A remote document with no recorded hash is updated, unless adopt is set, in which case
+    it is assumed to match the local copy (first sync of a collection built by the step3 scripts).
+    """
+    remote = set(remote)
+    actions = {ADD: [], UPDATE: [], DELETE: [], "unchanged": []}
+    for doc_id, doc in local.items():
+        recorded = synced.get(doc_id)
+        if doc_id not in remote:
+            actions[ADD].append(doc_id)
+        elif recorded is None and not adopt or recorded is not None and recorded["hash"] != doc["hash"]:
+            actions[UPDATE].append(doc_id)
+        else:
+            actions["unchanged"].append(doc_id)
+    for doc_id in sorted(remote - set(local)):
+        if delete_unmanaged or doc_id in synced:
+            actions[DELETE].append(doc_id)
+    return actions
+
+
+class KnowledgeBaseSync:
+    """Applies a plan with a thread pool, retrying throttled / 5xx calls with backoff"""
+
+    def __init__(self, kb: KnowledgeBaseClient, state: SyncState, collection: Optional[str] = None,
+                 workers: int = 8, rps: float = 10.0, max_attempts: int = 5, backoff: float = 1.0,
+                 max_backoff: float = 60.0, save_every: int = 50, sleep: Callable[[float], None] = time.sleep):
+        self.kb = kb
+        self.state = state
+        self.collection = collection or kb.collection
+        self.workers = workers
+        self.limiter = RateLimiter(rps)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.save_every = save_every
+        self.sleep = sleep
+        self.calls = 0
+        self.failures: List[Dict] = []
+        self._lock = threading.Lock()
+        self._completed = 0
+
+    def _call(self, fn, *args, ignore_code=None, retry_code=None, **kwargs):
+        def attempt_call(attempt):
+            with self._lock:
+                self.calls += 1
+            try:
+                return fn(*args, **kwargs)
+            except KnowledgeBaseError as e:
+                if e.code != ignore_code:
+                    raise
+                return None
+
+        return retry_call(attempt_call, self.max_attempts, self.backoff, self.max_backoff, self.sleep,
+                          before=self.limiter.acquire, retry_codes=(retry_code,) if retry_code is not None else ())
+
+    def _add(self, doc: Dict, replacing: bool = False):
+        """doc/add; a document already there counts as added, unless this add replaces it (UPDATE):
+        then the delete before it has not taken effect yet, so the add is retried, and fails (the
+        new hash is not recorded) if the old document stays"""
+        extra = {k: v for k, v in doc.items() if k not in ("doc_id", "doc_name", "doc_type", "url", "hash", "path")}
+        self._call(self.kb.add_doc, doc["doc_id"], doc["doc_name"], doc["doc_type"], url=doc["url"],
+                   collection=self.collection, ignore_code=None if replacing else DOC_EXISTS,
+                   retry_code=DOC_EXISTS if replacing else None, **extra)
+
+    def _delete(self, doc_id: str):
+        self._call(self.kb.delete_doc, doc_id, self.collection, ignore_code=DOC_NOT_FOUND)
+
+    def _apply(self, action: str, doc_id: str, doc: Optional[Dict]):
+        try:
+            if action in (UPDATE, DELETE):
+                self._delete(doc_id)
+            if action in (ADD, UPDATE):
+                self._add(doc, replacing=action == UPDATE)
+        except (KnowledgeBaseError, requests.RequestException) as e:
+            with self._lock:
+                self.failures.append({"doc_id": doc_id, "action": action, "error": str(e)})
+            return
+        self.state.record(doc_id, doc if action != DELETE else None)
+        with self._lock:
+            self._completed += 1
+            save = self._completed % self.save_every == 0
+        if save:
+            self.state.save()
+
+    def run(self, local: Dict[str, Dict], delete_unmanaged: bool = False, adopt: bool = False,
+            dry_run: bool = False) -> Dict:
+        started = time.perf_counter()
+        remote = [doc["doc_id"] for doc in self.kb.iter_files(self.collection)]
+        actions = plan(local, self.state.docs, remote, delete_unmanaged, adopt)
+        # Adopted documents are recorded without any call
+        for doc_id in actions["unchanged"]:
+            if doc_id not in self.state.docs:
+                self.state.record(doc_id, local[doc_id])
+        report = {
+            "local": len(local),
+            "remote": len(remote),
+            **{name: len(ids) for name, ids in actions.items()},
+            # A full reindex deletes everything remote and adds everything local
+            "full_reindex_calls": len(remote) + len(local),
+            "delta_calls": len(actions[ADD]) + 2 * len(actions[UPDATE]) + len(actions[DELETE]),
+        }
+        if dry_run:
+            report["plan"] = {name: ids for name, ids in actions.items() if name != "unchanged"}
+            return report
+        try:
+            with ThreadPoolExecutor(self.workers, thread_name_prefix="kb-sync") as pool:
+                futures = [pool.submit(self._apply, action, doc_id, local.get(doc_id))
+                           for action in (DELETE, UPDATE, ADD) for doc_id in actions[action]]
+                for future in futures:
+                    future.result()
+        finally:
+            self.state.save()
+        if report["delta_calls"]:
+            notify_invalidation(self.collection)
+        report.update(calls=self.calls, failed=len(self.failures), failures=self.failures[:20],
+                      seconds=round(time.perf_counter() - started, 2))
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental sync of a local corpus into a KB collection")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="CSV or JSONL with url, optional doc_id / doc_name / doc_type, "
+                                           "and hash or a local path to hash")
+    source.add_argument("--dir", help="directory of documents, served at --url-prefix")
+    parser.add_argument("--url-prefix", help="URL the KB fetches --dir files from")
+    parser.add_argument("--collection", default="test")
+    parser.add_argument("--project", default="")
+    parser.add_argument("--domain", default=DEFAULT_DOMAIN)
+    parser.add_argument("--scheme", default="https")
+    parser.add_argument("--account-id", default="")
+    parser.add_argument("--ak", help="access key (default: VOLC_ACCESSKEY / VOLC_SECRETKEY)")
+    parser.add_argument("--sk")
+    parser.add_argument("--state", help="sync state file (default: .kb_sync_<collection>.json)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument("--delete-unmanaged", action="store_true",
+                        help="also delete remote documents this sync never added")
+    parser.add_argument("--adopt", action="store_true",
+                        help="treat remote documents without a recorded hash as up to date")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without calling doc/add or delete")
+    args = parser.parse_args(argv)
+    if args.dir and not args.url_prefix:
+        parser.error("--dir needs --url-prefix")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    credentials = StaticCredentialProvider(args.ak, args.sk) if args.ak else EnvironmentCredentialProvider()
+    kb = KnowledgeBaseClient(account_id=args.account_id, domain=args.domain, project=args.project,
+                             collection=args.collection, credentials=credentials, scheme=args.scheme,
+                             pool_maxsize=args.workers * 2, invalidation_dir=None)
+    if args.dir:
+        local = directory_corpus(args.dir, args.url_prefix)
+    else:
+        local = local_corpus(read_manifest(args.manifest), os.path.dirname(os.path.abspath(args.manifest)))
+    state = SyncState(args.state or f".kb_sync_{args.collection}.json", args.collection)
+    report = KnowledgeBaseSync(kb, state, workers=args.workers, rps=args.rps).run(
+        local, delete_unmanaged=args.delete_unmanaged, adopt=args.adopt, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    kb.close()
+    return 1 if report.get("failed") else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
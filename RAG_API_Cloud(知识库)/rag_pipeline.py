@@ -0,0 +1,115 @@
+"""
+Pipelined retrieve-and-generate for the RAG chatbots
+retrieve() starts search_knowledge on a worker thread so it overlaps request validation and session
+bookkeeping; answer() / stream() hand the chunks to chat/completions the moment the search returns.
+After each turn, likely follow-up queries (FAQ questions among the retrieved chunks that the session has
+not asked yet) are searched in the background so the retrieval cache already holds them.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+from kb_client import KnowledgeBaseClient, KnowledgeBaseError
+from retrieval_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def follow_up_queries(history: List[str], result: Dict, max_queries: int = 3) -> List[str]:
+    """Guess the next questions: FAQ questions from the hits that are not in history
+
+    Questions already asked are left out; their searches are in the retrieval cache already.
+    """
+    seen = {normalize_query(q) for q in history}
+    unique = []
+    for point in result.get("result_list", []):
+        question = point.get("original_question")
+        key = normalize_query(question) if question else ""
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(question)
+    return unique[:max_queries]
+
+
+def join_context(result: Dict) -> str:
+    """The chatbots' "\\n".join of chunk contents"""
+    return "\n".join(c.get("content", "") for c in result.get("result_list", []))
+
+
+class RAGPipeline:
+    """Overlaps retrieval with request handling and warms the cache for follow-up questions"""
+
+    def __init__(self, kb: KnowledgeBaseClient, prompt_template: str, search_options: Optional[Dict] = None,
+                 chat_options: Optional[Dict] = None, max_workers: int = 8, prefetch_workers: int = 2,
+                 predict: Optional[Callable[[List[str], Dict], List[str]]] = follow_up_queries,
+                 build_context: Callable[[Dict], str] = join_context):
+        self.kb = kb
+        self.prompt_template = prompt_template
+        self.search_options = search_options or {}
+        self.chat_options = chat_options or {}
+        self.predict = predict
+        self.build_context = build_context
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="rag-retrieve")
+        # Prefetches run on their own small pool so they never delay a user's retrieval
+        self._prefetch_pool = ThreadPoolExecutor(prefetch_workers, thread_name_prefix="rag-prefetch")
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.prefetches = 0
+
+    def retrieve(self, query: str) -> Future:
+        """Start search_knowledge now; the Future resolves to the search `data`"""
+        return self._pool.submit(self.kb.search_knowledge, query, **self.search_options)
+
+    def context(self, retrieval: Future) -> str:
+        """Wait for the search and build the prompt context ("" if it failed)"""
+        try:
+            result = retrieval.result()
+        except KnowledgeBaseError as e:
+            logger.warning("search_knowledge failed, answering without context: %s", e)
+            return ""
+        return self.build_context(result)
+
+    def _messages(self, query: str, retrieval: Future) -> List[Dict]:
+        return [
+            {"role": "system", "content": self.prompt_template.format(self.context(retrieval))},
+            {"role": "user", "content": query},
+        ]
+
+    def answer(self, query: str, retrieval: Optional[Future] = None) -> Dict:
+        """Non-stream completion; returns the chat/completions `data`"""
+        messages = self._messages(query, retrieval or self.retrieve(query))
+        return self.kb.chat_completions(messages, **self.chat_options)
+
+    def stream(self, query: str, retrieval: Optional[Future] = None) -> Iterator[str]:
+        """Streamed completion; yields generated_answer deltas"""
+        messages = self._messages(query, retrieval or self.retrieve(query))
+        options = {k: v for k, v in self.chat_options.items() if k not in ("max_tokens", "return_token_usage")}
+        yield from self.kb.chat_completions_deltas(messages, **options)
+
+    def prefetch(self, history: List[str], retrieval: Future):
+        """Search likely follow-up queries in the background (only useful with kb.cache set)"""
+        if self.kb.cache is None or self.predict is None or not retrieval.done() or retrieval.exception():
+            return
+        for query in self.predict(history, retrieval.result()):
+            key = normalize_query(query)
+            with self._lock:
+                if key in self._pending:
+                    continue
+                self._pending.add(key)
+                self.prefetches += 1
+            self._prefetch_pool.submit(self._prefetch_one, query, key)
+
+    def _prefetch_one(self, query: str, key: str):
+        try:
+            self.kb.search_knowledge(query, **self.search_options)
+        except Exception as e:
+            logger.debug("prefetch of %r failed: %s", query, e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self._prefetch_pool.shutdown(wait=False)
@@ -0,0 +1,240 @@
+"""
+Query-result cache in front of search_knowledge
+Keys are the normalized query plus collection, limit, dense_weight and any other search options.
+Entries expire after a TTL, the least recently used are evicted first, and an optional embedding
+path lets paraphrased questions reuse the chunks of a sufficiently similar cached query.
+Adding or deleting documents (KnowledgeBaseClient.add_doc / delete_doc, or the step3 scripts via
+notify_invalidation()) drops the collection's entries.
+"""
+
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple, Union
+
+# Marker files touched by notify_invalidation(); caches in other processes watch their mtime
+INVALIDATION_DIR = os.path.join(tempfile.gettempdir(), "kb_retrieval_cache")
+
+Vector = Union[Dict[int, float], Sequence[float]]
+
+_PUNCT = re.compile(r"[^\w\s]+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """NFKC, lower case, punctuation dropped, whitespace collapsed"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return _SPACE.sub(" ", _PUNCT.sub(" ", query)).strip()
+
+
+def ngram_embedding(text: str, dims: int = 1024, n: int = 3) -> Dict[int, float]:
+    """Cheap local embedding: hashed character n-grams of the normalized text plus whole words
+
+    Good enough to match reordered or lightly reworded questions; pass a real embedding
+    model as RetrievalCache(embed=...) for true paraphrases.
+    """
+    text = normalize_query(text)
+    vector: Dict[int, float] = {}
+    padded = f" {text} "
+    for i in range(len(padded) - n + 1):
+        bucket = zlib.crc32(padded[i:i + n].encode("utf-8")) % dims
+        vector[bucket] = vector.get(bucket, 0.0) + 1.0
+    for word in text.split():
+        bucket = zlib.crc32(word.encode("utf-8")) % dims
+        vector[bucket] = vector.get(bucket, 0.0) + 2.0
+    return vector
+
+
+def _unit(vector: Vector) -> Vector:
+    if isinstance(vector, dict):
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {k: v / norm for k, v in vector.items()}
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return tuple(v / norm for v in vector)
+
+
+def _cosine(a: Vector, b: Vector) -> float:
+    """Dot product of two unit vectors (sparse dicts or dense sequences)"""
+    if isinstance(a, dict):
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(v * b.get(k, 0.0) for k, v in a.items())
+    return sum(x * y for x, y in zip(a, b))
+
+
+def notify_invalidation(collection: str, directory: str = INVALIDATION_DIR):
+    """Tell caches in every process on this host that collection changed"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{collection or '_default'}.invalidate")
+    with open(path, "a"):
+        pass
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class RetrievalCache:
+    """Thread-safe TTL + LRU cache of search_knowledge results with an optional similarity path
+
+    Cached results are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0,
+                 embed: Optional[Callable[[str], Vector]] = None, similarity_threshold: float = 0.92,
+                 invalidation_dir: Optional[str] = INVALIDATION_DIR, check_interval: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.invalidation_dir = invalidation_dir
+        self.check_interval = check_interval
+        self.clock = clock
+        # key -> (expires_at, value); key = (normalized query, group)
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Dict]]" = OrderedDict()
+        # group -> {key: unit vector}, only when embed is set
+        self._vectors: Dict[Hashable, Dict[Tuple[str, Hashable], Vector]] = {}
+        self._markers: Dict[str, Tuple[float, Optional[int]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._hit_seconds = 0.0
+        self._miss_seconds = 0.0
+
+    @staticmethod
+    def group(collection: str, limit: int, dense_weight: float, **params) -> Hashable:
+        """Everything except the query text that changes the search result"""
+        return (collection, limit, dense_weight, repr(sorted(params.items())))
+
+    def get(self, query: str, collection: str, limit: int, dense_weight: float, **params) -> Optional[Dict]:
+        """Cached result for the query, or None"""
+        group = self.group(collection, limit, dense_weight, **params)
+        self._check_marker(collection)
+        normalized = normalize_query(query)
+        key = (normalized, group)
+        now = self.clock()
+        with self._lock:
+            value = self._lookup(key, now)
+            if value is not None:
+                self.hits += 1
+                return value
+        if self.embed is None or not self._vectors.get(group):
+            return None
+        vector = _unit(self.embed(normalized))
+        with self._lock:
+            best_key, best = None, self.similarity_threshold
+            for other, other_vector in self._vectors.get(group, {}).items():
+                similarity = _cosine(vector, other_vector)
+                if similarity >= best:
+                    best_key, best = other, similarity
+            if best_key is not None:
+                value = self._lookup(best_key, now)
+                if value is not None:
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return value
+        return None
+
+    def put(self, query: str, collection: str, limit: int, dense_weight: float, value: Dict, **params):
+        group = self.group(collection, limit, dense_weight, **params)
+        normalized = normalize_query(query)
+        key = (normalized, group)
+        vector = _unit(self.embed(normalized)) if self.embed is not None else None
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if vector is not None:
+                self._vectors.setdefault(group, {})[key] = vector
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._drop_vector(oldest)
+                self.evictions += 1
+
+    def get_or_fetch(self, query: str, fetch: Callable[[], Dict], collection: str, limit: int,
+                     dense_weight: float, **params) -> Dict:
+        """Return the cached result or call fetch() and cache it, timing both paths"""
+        started = time.perf_counter()
+        value = self.get(query, collection, limit, dense_weight, **params)
+        if value is not None:
+            with self._lock:
+                self._hit_seconds += time.perf_counter() - started
+            return value
+        value = fetch()
+        self.put(query, collection, limit, dense_weight, value, **params)
+        with self._lock:
+            self.misses += 1
+            self._miss_seconds += time.perf_counter() - started
+        return value
+
+    def invalidate(self, collection: Optional[str] = None):
+        """Drop every entry of collection (all entries when None)"""
+        with self._lock:
+            stale = [k for k in self._entries if collection is None or k[1][0] == collection]
+            for key in stale:
+                del self._entries[key]
+                self._drop_vector(key)
+            self.invalidations += 1
+
+    def _lookup(self, key, now) -> Optional[Dict]:
+        """Caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            self._drop_vector(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _drop_vector(self, key):
+        vectors = self._vectors.get(key[1])
+        if vectors is not None:
+            vectors.pop(key, None)
+            if not vectors:
+                del self._vectors[key[1]]
+
+    def _check_marker(self, collection: str):
+        """Invalidate when another process touched the collection's marker file"""
+        if self.invalidation_dir is None:
+            return
+        now = self.clock()
+        checked_at, seen = self._markers.get(collection, (None, None))
+        if checked_at is not None and now - checked_at < self.check_interval:
+            return
+        try:
+            mtime = os.stat(os.path.join(self.invalidation_dir, f"{collection or '_default'}.invalidate")).st_mtime_ns
+        except OSError:
+            mtime = None
+        self._markers[collection] = (now, mtime)
+        if checked_at is not None and mtime != seen:
+            self.invalidate(collection)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "avg_hit_ms": round(self._hit_seconds / self.hits * 1000, 3) if self.hits else 0.0,
+                "avg_miss_ms": round(self._miss_seconds / self.misses * 1000, 3) if self.misses else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
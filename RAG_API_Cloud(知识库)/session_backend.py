@@ -0,0 +1,687 @@
+"""
+Session, agent and queue storage for the Flask chatbots
+The apps used to keep chat sessions, active agents and the agent queue in module globals, so only
+one process could serve them. MemoryBackend keeps the same data in process; SQLiteBackend keeps it
+in a SQLite file in WAL mode that every gunicorn worker on the host opens, with each queue or
+read-modify-write operation in one transaction. Records are plain JSON-serializable dicts and
+come back as copies; change them through modify_session / modify_agent, not in place. Both keep
+per-status counts and indexes of sessions and agents up to date on every write, so dashboard
+counts do not scan the sessions. A session's last activity (creation or its latest message) is
+indexed too, so delete_idle() drops idle sessions without a scan.
+Usage: store = open_backend(os.environ.get("CHAT_SESSION_STORE"))  # "memory" or "sqlite:///path/sessions.db"
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from agent_queue import DEFAULT_LANE, NORMAL_PRIORITY, AgentQueue
+from history_store import HistoryStore, Turn
+
+
+class SessionBackend:
+    """Interface shared by the backends
+
+    Messages get a store-wide increasing "seq", so a reader can ask for the ones after the last
+    it has seen. A record's "status" field is indexed: status_counts / sessions_with_status and
+    agent_status_counts answer from counters kept by every write. The queue holds session IDs in lanes (language / skill) at a priority (VIP above
+    normal); agents take the oldest of the highest priority among their lanes. enqueue is idempotent.
+    """
+
+    # Other processes write to it too, so in-process change notifications do not cover every change
+    shared = False
+
+    # Sessions
+    def create_session(self, session_id: str, record: Dict) -> Dict:
+        """Insert record unless the session exists; returns the stored record"""
+        raise NotImplementedError
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def modify_session(self, session_id: str, fn: Callable[[Dict], object]):
+        """Atomically apply fn to the session record (in place) and save it; returns fn's result,
+        or None if there is no such session. fn must not call the backend."""
+        raise NotImplementedError
+
+    def update_session(self, session_id: str, **fields) -> bool:
+        return self.modify_session(session_id, lambda record: record.update(fields) or True) is True
+
+    def sessions(self) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def session_count(self) -> int:
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str):
+        raise NotImplementedError
+
+    def delete_idle(self, idle_ttl: float, limit: Optional[int] = None) -> int:
+        """Delete up to limit (default every) sessions created or last appended to idle_ttl or more
+        seconds ago, with their messages and queue entries, oldest first; returns how many"""
+        raise NotImplementedError
+
+    def status_counts(self) -> Dict[str, int]:
+        """Sessions per status (records without one are left out)"""
+        raise NotImplementedError
+
+    def sessions_with_status(self, status: str, limit: Optional[int] = None) -> List[str]:
+        raise NotImplementedError
+
+    # Messages
+    def append_message(self, session_id: str, message: Dict) -> int:
+        """Store message (adding its "seq") and return the seq"""
+        raise NotImplementedError
+
+    def messages(self, session_id: str, after: int = 0) -> List[Dict]:
+        raise NotImplementedError
+
+    def recent_messages(self, session_id: str, count: int) -> List[Dict]:
+        """The newest count messages of the session, oldest first"""
+        raise NotImplementedError
+
+    def trim_messages(self, session_id: str, keep: int):
+        """Keep only the newest `keep` messages of the session"""
+        raise NotImplementedError
+
+    # Agents
+    def put_agent(self, agent_id: str, record: Dict):
+        raise NotImplementedError
+
+    def get_agent(self, agent_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def modify_agent(self, agent_id: str, fn: Callable[[Dict], object]):
+        raise NotImplementedError
+
+    def update_agent(self, agent_id: str, **fields) -> bool:
+        return self.modify_agent(agent_id, lambda record: record.update(fields) or True) is True
+
+    def agents(self) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def agent_status_counts(self) -> Dict[str, int]:
+        """Agents per status"""
+        raise NotImplementedError
+
+    # Agent queue
+    def enqueue(self, session_id: str, lane: str = DEFAULT_LANE, priority: int = NORMAL_PRIORITY) -> int:
+        """Append to the queue unless already queued; returns the 1-based position"""
+        raise NotImplementedError
+
+    def dequeue(self, lanes: Optional[List[str]] = None) -> Optional[str]:
+        """Pop the next session for an agent serving lanes (every lane when None), or None"""
+        raise NotImplementedError
+
+    def remove_from_queue(self, session_id: str) -> bool:
+        """Cancel a queued session (the customer left); False when it was not queued"""
+        raise NotImplementedError
+
+    def queue_position(self, session_id: str) -> int:
+        """1-based position within its lane, 0 when not queued"""
+        raise NotImplementedError
+
+    def queue_length(self) -> int:
+        raise NotImplementedError
+
+    def queue_lengths(self) -> Dict[str, int]:
+        """Queued sessions per lane"""
+        raise NotImplementedError
+
+    def queued(self, limit: Optional[int] = None) -> List[str]:
+        """The first limit (default every) sessions in the order agents serving all lanes take them"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(SessionBackend):
+    """Single-process backend; one lock around everything"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._sessions: Dict[str, Dict] = {}
+        self._messages: Dict[str, List[Dict]] = {}
+        # Session ID -> last activity, least recently active first
+        self._last_active: "OrderedDict[str, float]" = OrderedDict()
+        self._agents: Dict[str, Dict] = {}
+        # status -> IDs in it, per kind; a status's count is the size of its set
+        self._session_index: Dict[str, Set[str]] = {}
+        self._agent_index: Dict[str, Set[str]] = {}
+        self._queue = AgentQueue()
+        self._seq = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _reindex(index: Dict[str, Set[str]], key: str, old: Optional[str], new: Optional[str]):
+        if old == new:
+            return
+        if old is not None:
+            members = index[old]
+            members.discard(key)
+            if not members:
+                del index[old]
+        if new is not None:
+            index.setdefault(new, set()).add(key)
+
+    def create_session(self, session_id, record):
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = copy.deepcopy(record)
+                self._messages[session_id] = []
+                self._last_active[session_id] = self.clock()
+                self._reindex(self._session_index, session_id, None, record.get("status"))
+            return copy.deepcopy(self._sessions[session_id])
+
+    def get_session(self, session_id):
+        with self._lock:
+            record = self._sessions.get(session_id)
+            return copy.deepcopy(record) if record is not None else None
+
+    def modify_session(self, session_id, fn):
+        return self._modify(self._sessions, self._session_index, session_id, fn)
+
+    def _modify(self, records: Dict[str, Dict], index: Dict[str, Set[str]], key: str, fn):
+        with self._lock:
+            record = records.get(key)
+            if record is None:
+                return None
+            old = record.get("status")
+            try:
+                return fn(record)
+            finally:
+                self._reindex(index, key, old, record.get("status"))
+
+    def sessions(self):
+        with self._lock:
+            return iter(copy.deepcopy(list(self._sessions.values())))
+
+    def session_count(self):
+        return len(self._sessions)
+
+    def delete_session(self, session_id):
+        with self._lock:
+            record = self._sessions.pop(session_id, None)
+            if record is not None:
+                self._reindex(self._session_index, session_id, record.get("status"), None)
+            self._messages.pop(session_id, None)
+            self._last_active.pop(session_id, None)
+            self._queue.cancel(session_id)
+
+    def delete_idle(self, idle_ttl, limit=None):
+        deadline = self.clock() - idle_ttl
+        deleted = 0
+        with self._lock:
+            while self._last_active and (limit is None or deleted < limit):
+                session_id, last_active = next(iter(self._last_active.items()))
+                if last_active > deadline:
+                    break
+                self.delete_session(session_id)
+                deleted += 1
+        return deleted
+
+    def status_counts(self):
+        with self._lock:
+            return {status: len(members) for status, members in self._session_index.items()}
+
+    def sessions_with_status(self, status, limit=None):
+        with self._lock:
+            return list(islice(self._session_index.get(status, ()), limit))
+
+    def append_message(self, session_id, message):
+        with self._lock:
+            self._seq += 1
+            self._messages.setdefault(session_id, []).append({**message, "seq": self._seq})
+            if session_id in self._last_active:
+                self._last_active[session_id] = self.clock()
+                self._last_active.move_to_end(session_id)
+            return self._seq
+
+    def messages(self, session_id, after=0):
+        with self._lock:
+            messages = self._messages.get(session_id, [])
+            # Seqs increase, so only the tail after `after` is visited
+            start = len(messages)
+            while start and messages[start - 1]["seq"] > after:
+                start -= 1
+            return [dict(m) for m in messages[start:]]
+
+    def recent_messages(self, session_id, count):
+        with self._lock:
+            return [dict(m) for m in self._messages.get(session_id, [])[-count:]] if count > 0 else []
+
+    def trim_messages(self, session_id, keep):
+        with self._lock:
+            messages = self._messages.get(session_id)
+            if messages and len(messages) > keep:
+                del messages[:len(messages) - keep]
+
+    def put_agent(self, agent_id, record):
+        with self._lock:
+            old = self._agents.get(agent_id, {}).get("status")
+            self._agents[agent_id] = copy.deepcopy(record)
+            self._reindex(self._agent_index, agent_id, old, record.get("status"))
+
+    def get_agent(self, agent_id):
+        with self._lock:
+            record = self._agents.get(agent_id)
+            return copy.deepcopy(record) if record is not None else None
+
+    def modify_agent(self, agent_id, fn):
+        return self._modify(self._agents, self._agent_index, agent_id, fn)
+
+    def agents(self):
+        with self._lock:
+            return copy.deepcopy(self._agents)
+
+    def agent_status_counts(self):
+        with self._lock:
+            return {status: len(members) for status, members in self._agent_index.items()}
+
+    # The queue has its own lock
+    def enqueue(self, session_id, lane=DEFAULT_LANE, priority=NORMAL_PRIORITY):
+        return self._queue.enqueue(session_id, lane, priority)
+
+    def dequeue(self, lanes=None):
+        return self._queue.dequeue(lanes)
+
+    def remove_from_queue(self, session_id):
+        return self._queue.cancel(session_id)
+
+    def queue_position(self, session_id):
+        return self._queue.position(session_id)
+
+    def queue_length(self):
+        return len(self._queue)
+
+    def queue_lengths(self):
+        return self._queue.lengths()
+
+    def queued(self, limit=None):
+        return self._queue.items(limit)
+
+
+class SQLiteBackend(SessionBackend):
+    """Backend shared by every process that opens the same SQLite file (WAL mode)
+
+    Each process (and a forked gunicorn worker) opens its own connection; writes run in
+    BEGIN IMMEDIATE transactions, so a queue pop or a read-modify-write is atomic across processes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, busy_timeout: float = 10.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        with self._transaction() as conn:
+            counted = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'status_counts'").fetchone()
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                         "status TEXT, last_active REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS messages (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "session_id TEXT NOT NULL, data TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq)")
+            conn.execute("CREATE TABLE IF NOT EXISTS agents (agent_id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                         "status TEXT)")
+            # The status column mirrors the record's "status" and status_counts counts the rows per
+            # status ("" for records without one), kept by every write; a file from before them is
+            # indexed and counted once here
+            for table, key in (("sessions", "session_id"), ("agents", "agent_id")):
+                if "status" not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN status TEXT")
+                    for record_key, data in conn.execute(f"SELECT {key}, data FROM {table}").fetchall():
+                        conn.execute(f"UPDATE {table} SET status = ? WHERE {key} = ?",
+                                     (json.loads(data).get("status"), record_key))
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_status ON sessions (status)")
+            # Sessions in a file from before last_active count as active now
+            if "last_active" not in {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}:
+                conn.execute("ALTER TABLE sessions ADD COLUMN last_active REAL")
+                conn.execute("UPDATE sessions SET last_active = ?", (self.clock(),))
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_idle ON sessions (last_active)")
+            conn.execute("CREATE TABLE IF NOT EXISTS status_counts (kind TEXT NOT NULL, status TEXT NOT NULL, "
+                         "count INTEGER NOT NULL, PRIMARY KEY (kind, status)) WITHOUT ROWID")
+            if not counted:
+                for table in ("sessions", "agents"):
+                    conn.execute(f"INSERT INTO status_counts (kind, status, count) SELECT ?, COALESCE(status, ''), "
+                                 f"COUNT(*) FROM {table} GROUP BY 2", (table,))
+            # A file from before lanes: requeue its sessions in order below
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(queue)")}
+            requeue = []
+            if columns and "rank" not in columns:
+                requeue = [row[0] for row in conn.execute("SELECT session_id FROM queue ORDER BY seq")]
+                conn.execute("DROP TABLE queue")
+            # rank numbers the sessions of a lane + priority in arrival order; queue_lanes counts
+            # them and queue_cancelled holds the ranks removed behind the head, so a position is
+            # rank - head + 1 - (cancelled ranks ahead) instead of a count over the queue
+            conn.execute("CREATE TABLE IF NOT EXISTS queue (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "session_id TEXT NOT NULL UNIQUE, lane TEXT NOT NULL, priority INTEGER NOT NULL, "
+                         "rank INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS queue_order ON queue (priority DESC, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS queue_rank ON queue (lane, priority, rank)")
+            conn.execute("CREATE TABLE IF NOT EXISTS queue_lanes (lane TEXT NOT NULL, priority INTEGER NOT NULL, "
+                         "next_rank INTEGER NOT NULL, live INTEGER NOT NULL, PRIMARY KEY (lane, priority))")
+            conn.execute("CREATE TABLE IF NOT EXISTS queue_cancelled (lane TEXT NOT NULL, priority INTEGER NOT NULL, "
+                         "rank INTEGER NOT NULL, PRIMARY KEY (lane, priority, rank)) WITHOUT ROWID")
+            for session_id in requeue:
+                self._enqueue(conn, session_id, DEFAULT_LANE, NORMAL_PRIORITY)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Caller holds the lock; reconnects after a fork"""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    def _read(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, table: str, status: Optional[str], delta: int):
+        conn.execute("INSERT OR IGNORE INTO status_counts (kind, status, count) VALUES (?, ?, 0)",
+                     (table, status or ""))
+        conn.execute("UPDATE status_counts SET count = count + ? WHERE kind = ? AND status = ?",
+                     (delta, table, status or ""))
+
+    def _status_counts(self, table: str) -> Dict[str, int]:
+        return dict(self._read("SELECT status, count FROM status_counts WHERE kind = ? AND status != '' "
+                               "AND count > 0", (table,)))
+
+    # Sessions
+    def create_session(self, session_id, record):
+        with self._transaction() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO sessions (session_id, data, status, last_active) "
+                                  "VALUES (?, ?, ?, ?)",
+                                  (session_id, json.dumps(record), record.get("status"), self.clock()))
+            if cursor.rowcount:
+                self._count(conn, "sessions", record.get("status"), 1)
+            row = conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0])
+
+    def get_session(self, session_id):
+        rows = self._read("SELECT data FROM sessions WHERE session_id = ?", (session_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def modify_session(self, session_id, fn):
+        return self._modify("sessions", "session_id", session_id, fn)
+
+    def _modify(self, table: str, column: str, key: str, fn):
+        with self._transaction() as conn:
+            row = conn.execute(f"SELECT data, status FROM {table} WHERE {column} = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            record, old = json.loads(row[0]), row[1]
+            result = fn(record)
+            new = record.get("status")
+            conn.execute(f"UPDATE {table} SET data = ?, status = ? WHERE {column} = ?", (json.dumps(record), new, key))
+            if new != old:
+                self._count(conn, table, old, -1)
+                self._count(conn, table, new, 1)
+            return result
+
+    def sessions(self):
+        return (json.loads(row[0]) for row in self._read("SELECT data FROM sessions"))
+
+    def session_count(self):
+        return self._read("SELECT COALESCE(SUM(count), 0) FROM status_counts WHERE kind = 'sessions'")[0][0]
+
+    def delete_session(self, session_id):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            self._delete(conn, session_id, row)
+
+    def _delete(self, conn: sqlite3.Connection, session_id: str, row: Optional[tuple]):
+        """Delete a session, its messages and its queue entry; row is its (status,) or None"""
+        if row is not None:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._count(conn, "sessions", row[0], -1)
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        self._remove(conn, session_id)
+
+    def delete_idle(self, idle_ttl, limit=None):
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT session_id, status FROM sessions WHERE last_active <= ? "
+                                "ORDER BY last_active LIMIT ?",
+                                (self.clock() - idle_ttl, -1 if limit is None else limit)).fetchall()
+            for session_id, status in rows:
+                self._delete(conn, session_id, (status,))
+        return len(rows)
+
+    def status_counts(self):
+        return self._status_counts("sessions")
+
+    def sessions_with_status(self, status, limit=None):
+        return [row[0] for row in self._read("SELECT session_id FROM sessions WHERE status = ? LIMIT ?",
+                                             (status, -1 if limit is None else limit))]
+
+    # Messages
+    def append_message(self, session_id, message):
+        with self._transaction() as conn:
+            cursor = conn.execute("INSERT INTO messages (session_id, data) VALUES (?, ?)",
+                                  (session_id, json.dumps(message)))
+            conn.execute("UPDATE sessions SET last_active = ? WHERE session_id = ?", (self.clock(), session_id))
+            return cursor.lastrowid
+
+    def messages(self, session_id, after=0):
+        rows = self._read("SELECT seq, data FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                          (session_id, after))
+        return [{**json.loads(data), "seq": seq} for seq, data in rows]
+
+    def recent_messages(self, session_id, count):
+        rows = self._read("SELECT seq, data FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                          (session_id, count))
+        return [{**json.loads(data), "seq": seq} for seq, data in reversed(rows)]
+
+    def trim_messages(self, session_id, keep):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ? AND seq NOT IN "
+                         "(SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?)",
+                         (session_id, session_id, keep))
+
+    # Agents
+    def put_agent(self, agent_id, record):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM agents WHERE agent_id = ?", (agent_id,)).fetchone()
+            if row is not None:
+                self._count(conn, "agents", row[0], -1)
+            conn.execute("INSERT OR REPLACE INTO agents (agent_id, data, status) VALUES (?, ?, ?)",
+                         (agent_id, json.dumps(record), record.get("status")))
+            self._count(conn, "agents", record.get("status"), 1)
+
+    def get_agent(self, agent_id):
+        rows = self._read("SELECT data FROM agents WHERE agent_id = ?", (agent_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def modify_agent(self, agent_id, fn):
+        return self._modify("agents", "agent_id", agent_id, fn)
+
+    def agents(self):
+        return {agent_id: json.loads(data) for agent_id, data in self._read("SELECT agent_id, data FROM agents")}
+
+    def agent_status_counts(self):
+        return self._status_counts("agents")
+
+    # Agent queue
+    # Higher priorities of the lane, plus the live ranks of its own lane + priority up to the session's
+    _POSITION_SQL = (
+        "SELECT (SELECT COALESCE(SUM(live), 0) FROM queue_lanes WHERE lane = me.lane AND priority > me.priority)"
+        " + me.rank - (SELECT MIN(rank) FROM queue WHERE lane = me.lane AND priority = me.priority) + 1"
+        " - (SELECT COUNT(*) FROM queue_cancelled c WHERE c.lane = me.lane AND c.priority = me.priority"
+        " AND c.rank < me.rank) FROM queue me WHERE me.session_id = ?")
+
+    @staticmethod
+    def _enqueue(conn: sqlite3.Connection, session_id: str, lane: str, priority: int):
+        if conn.execute("SELECT 1 FROM queue WHERE session_id = ?", (session_id,)).fetchone():
+            return
+        conn.execute("INSERT OR IGNORE INTO queue_lanes (lane, priority, next_rank, live) VALUES (?, ?, 0, 0)",
+                     (lane, priority))
+        rank = conn.execute("SELECT next_rank FROM queue_lanes WHERE lane = ? AND priority = ?",
+                            (lane, priority)).fetchone()[0]
+        conn.execute("INSERT INTO queue (session_id, lane, priority, rank) VALUES (?, ?, ?, ?)",
+                     (session_id, lane, priority, rank))
+        conn.execute("UPDATE queue_lanes SET next_rank = next_rank + 1, live = live + 1 "
+                     "WHERE lane = ? AND priority = ?", (lane, priority))
+
+    @staticmethod
+    def _remove(conn: sqlite3.Connection, session_id: str) -> bool:
+        row = conn.execute("SELECT lane, priority, rank FROM queue WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return False
+        lane, priority, rank = row
+        conn.execute("DELETE FROM queue WHERE session_id = ?", (session_id,))
+        conn.execute("UPDATE queue_lanes SET live = live - 1 WHERE lane = ? AND priority = ?", (lane, priority))
+        head = conn.execute("SELECT MIN(rank) FROM queue WHERE lane = ? AND priority = ?",
+                            (lane, priority)).fetchone()[0]
+        # Ranks the head has passed no longer affect any position
+        conn.execute("DELETE FROM queue_cancelled WHERE lane = ? AND priority = ? AND rank < ?",
+                     (lane, priority, rank + 1 if head is None else head))
+        if head is not None and rank > head:
+            conn.execute("INSERT INTO queue_cancelled (lane, priority, rank) VALUES (?, ?, ?)", (lane, priority, rank))
+        return True
+
+    def enqueue(self, session_id, lane=DEFAULT_LANE, priority=NORMAL_PRIORITY):
+        with self._transaction() as conn:
+            self._enqueue(conn, session_id, lane, priority)
+            return conn.execute(self._POSITION_SQL, (session_id,)).fetchone()[0]
+
+    def dequeue(self, lanes=None):
+        with self._transaction() as conn:
+            if lanes is None:
+                row = conn.execute("SELECT session_id FROM queue ORDER BY priority DESC, seq LIMIT 1").fetchone()
+            else:
+                lanes = list(lanes)
+                row = conn.execute(f"SELECT session_id FROM queue WHERE lane IN ({', '.join('?' * len(lanes))}) "
+                                   "ORDER BY priority DESC, seq LIMIT 1", lanes).fetchone() if lanes else None
+            if row is None:
+                return None
+            self._remove(conn, row[0])
+            return row[0]
+
+    def remove_from_queue(self, session_id):
+        with self._transaction() as conn:
+            return self._remove(conn, session_id)
+
+    def queue_position(self, session_id):
+        rows = self._read(self._POSITION_SQL, (session_id,))
+        return rows[0][0] if rows else 0
+
+    def queue_length(self):
+        return self._read("SELECT COALESCE(SUM(live), 0) FROM queue_lanes")[0][0]
+
+    def queue_lengths(self):
+        return dict(self._read("SELECT lane, SUM(live) FROM queue_lanes GROUP BY lane HAVING SUM(live) > 0"))
+
+    def queued(self, limit=None):
+        return [row[0] for row in self._read("SELECT session_id FROM queue ORDER BY priority DESC, seq LIMIT ?",
+                                             (-1 if limit is None else limit,))]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error) under the backend's thread lock"""
+
+    def __init__(self, backend: SQLiteBackend):
+        self.backend = backend
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.backend._lock.acquire()
+        try:
+            self.conn = self.backend._connection()
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.backend._lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        finally:
+            self.backend._lock.release()
+
+
+def open_backend(url: Optional[str] = None) -> SessionBackend:
+    """"memory" (or empty) for MemoryBackend, "sqlite:///path/to/sessions.db" for SQLiteBackend"""
+    if not url or url == "memory":
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"unsupported session store {url!r} (use 'memory' or 'sqlite:///path')")
+
+
+class BackendHistoryStore(HistoryStore):
+    """HistoryStore on a SessionBackend, so conversation history is shared between processes
+
+    Keeps the last max_turns turns of each session and deletes sessions with no new turn for
+    idle_ttl seconds: append() sweeps them (backend.delete_idle) at most once every sweep_interval
+    seconds per process. There is no memory budget; the turn cap and the idle TTL bound the store.
+    """
+
+    def __init__(self, backend: SessionBackend, max_turns: int = 50, idle_ttl: float = 3600.0,
+                 sweep_interval: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.backend = backend
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._next_sweep = clock()
+        self._lock = threading.Lock()
+        self.expired = 0
+
+    def append(self, session_id: str, turn: Turn):
+        now = self.clock()
+        with self._lock:
+            due = now >= self._next_sweep
+            if due:
+                self._next_sweep = now + self.sweep_interval
+        if due:
+            self.sweep()
+        self.backend.create_session(session_id, {"session_id": session_id})
+        self.backend.append_message(session_id, {"user": turn.user, "assistant": turn.assistant,
+                                                 "timestamp": turn.timestamp, "mode": turn.mode})
+        self.backend.trim_messages(session_id, self.max_turns)
+
+    def get(self, session_id: str) -> List[Turn]:
+        return [Turn(m["user"], m["assistant"], m["timestamp"], m["mode"])
+                for m in self.backend.messages(session_id)]
+
+    def clear(self, session_id: str):
+        self.backend.delete_session(session_id)
+
+    def sweep(self) -> int:
+        """Delete idle sessions now; returns how many"""
+        expired = self.backend.delete_idle(self.idle_ttl)
+        with self._lock:
+            self.expired += expired
+        return expired
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.backend.get_session(session_id) is not None
+
+    def __len__(self) -> int:
+        return self.backend.session_count()
+
+    def stats(self) -> Dict:
+        return {"sessions": len(self), "max_turns": self.max_turns, "idle_ttl": self.idle_ttl,
+                "expired_sessions": self.expired}
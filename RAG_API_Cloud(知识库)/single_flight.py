@@ -0,0 +1,110 @@
+"""
+In-process request coalescing (single-flight)
+While a call for a key is in flight, identical calls wait for it and share its result (or its
+exception) instead of going upstream themselves. Waiters give up after a timeout, set per kind
+of call (the first item of the key tuple); the call in flight carries on for the others.
+Cuts upstream QPS when a popular question arrives in many Flask threads at once.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlightTimeout(TimeoutError):
+    """A waiter gave up on a coalesced call that was still in flight"""
+
+    def __init__(self, key: Hashable, timeout: float):
+        super().__init__(f"coalesced call still in flight after {timeout}s")
+        self.key = key
+        self.timeout = timeout
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters", "started")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self.started = time.perf_counter()
+
+
+class SingleFlight:
+    """Thread-safe single-flight group
+
+    Keys are tuples whose first item names the kind of call (e.g. the API path); timeouts maps
+    a kind to the seconds its waiters wait, timeout is the default. Results are shared between
+    callers and must be treated as read-only.
+    """
+
+    def __init__(self, timeout: float = 30.0, timeouts: Optional[Dict[str, float]] = None):
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self._calls: Dict[Tuple, _Call] = {}
+        self._lock = threading.Lock()
+        # kind -> counters
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _counters(self, kind: str) -> Dict[str, float]:
+        """Caller holds the lock"""
+        counters = self._stats.get(kind)
+        if counters is None:
+            counters = self._stats[kind] = {"requests": 0, "upstream": 0, "coalesced": 0, "timeouts": 0,
+                                            "shared_errors": 0, "max_waiters": 0, "upstream_seconds": 0.0}
+        return counters
+
+    def do(self, key: Tuple, fn: Callable[[], object], timeout: Optional[float] = None):
+        """fn() for the first caller of key; later callers wait for and return the same result"""
+        kind = key[0]
+        with self._lock:
+            counters = self._counters(kind)
+            counters["requests"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                counters["upstream"] += 1
+            else:
+                call.waiters += 1
+                counters["coalesced"] += 1
+                counters["max_waiters"] = max(counters["max_waiters"], call.waiters)
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    counters["upstream_seconds"] += time.perf_counter() - call.started
+                    if call.error is not None:
+                        counters["shared_errors"] += call.waiters
+                call.event.set()
+            return call.result
+        if timeout is None:
+            timeout = self.timeouts.get(kind, self.timeout)
+        if not call.event.wait(timeout):
+            with self._lock:
+                counters["timeouts"] += 1
+            raise SingleFlightTimeout(key, timeout)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {}
+            for kind, counters in self._stats.items():
+                requests, upstream = counters["requests"], counters["upstream"]
+                stats[kind] = {
+                    **{name: value for name, value in counters.items() if name != "upstream_seconds"},
+                    "coalesced_rate": round(counters["coalesced"] / requests, 4) if requests else 0.0,
+                    "avg_upstream_ms": round(counters["upstream_seconds"] / upstream * 1000, 3) if upstream else 0.0,
+                }
+            return {"in_flight": len(self._calls), "calls": stats}
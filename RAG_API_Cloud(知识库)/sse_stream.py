@@ -0,0 +1,125 @@
+"""
+Incremental SSE decoding for streamed chat/completions
+SSEDecoder splits raw response chunks into event payloads without decoding lines to str
+(iter_payloads() runs one over a whole response, flushing a last event with no blank line);
+extract_delta() pulls generated_answer and the end flag straight out of the payload bytes (full
+json.loads only for unusual events), coalesce() merges tiny deltas over a time window, and
+openai_frame() re-frames a delta as the OpenAI-style chunk the Conversational AI client expects.
+"""
+
+import json
+import re
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+_ANSWER_KEY = b'"generated_answer":'
+_END_TRUE = (b'"end": true', b'"end":true')
+_CODE_ZERO = (b'{"code": 0,', b'{"code":0,')
+# Closing quote of a JSON string: a quote preceded by an even number of backslashes
+_STRING_END = re.compile(rb'(?<!\\)(?:\\\\)*"')
+
+_FRAME_PREFIX = b'data: {"choices": [{"delta": {"content": '
+_FRAME_SUFFIX = b'}}]}\n\n'
+DONE_FRAME = b"data: [DONE]\n\n"
+
+
+class SSEDecoder:
+    """Feed raw bytes, get complete event payloads (the joined `data:` fields) as bytes"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        self._buffer += chunk
+        cut = self._buffer.rfind(b"\n")
+        if cut < 0:
+            return []
+        lines = bytes(self._buffer[:cut]).split(b"\n")
+        del self._buffer[:cut + 1]
+        events = []
+        data = self._data
+        for line in lines:
+            if line[-1:] == b"\r":
+                line = line[:-1]
+            if not line:
+                # Blank line: dispatch the event
+                if data:
+                    events.append(data[0] if len(data) == 1 else b"\n".join(data))
+                    data = []
+            elif line[:5] == b"data:":
+                data.append(line[6:] if line[5:6] == b" " else line[5:])
+            # Other fields (event:, id:, retry:) and comments are not used by the KB stream
+        self._data = data
+        return events
+
+    def close(self) -> List[bytes]:
+        """Flush an event that was not followed by a blank line"""
+        events = self.feed(b"\n\n") if self._buffer else []
+        if self._data:
+            events.append(b"\n".join(self._data))
+            self._data = []
+        return events
+
+
+def iter_payloads(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Every event payload of a stream of raw chunks, including an unterminated last event"""
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+def extract_delta(payload: bytes) -> Tuple[Optional[str], bool, Optional[dict]]:
+    """(generated_answer, end, event) of one stream event
+
+    Fast path for {"code":0,...,"data":{"generated_answer":"...","end":...}}: event is None and
+    only the answer string is decoded. Anything else (errors, a null or non-string answer,
+    unexpected layout) is fully parsed; a payload that is not JSON raises ValueError.
+    """
+    key = payload.find(_ANSWER_KEY)
+    if key >= 0 and payload.startswith(_CODE_ZERO):
+        quote = key + len(_ANSWER_KEY)
+        while payload[quote:quote + 1] in (b" ", b"\t"):
+            quote += 1
+        closing = payload.find(b'"', quote + 1) if payload[quote:quote + 1] == b'"' else -1
+        if closing > 0 and payload[closing - 1] == 0x5C:
+            # Escaped quote inside the answer; find the real end of the string
+            match = _STRING_END.search(payload, quote + 1)
+            closing = match.end() - 1 if match else -1
+        if closing > 0:
+            raw = payload[quote + 1:closing]
+            answer = json.loads(payload[quote:closing + 1]) if b"\\" in raw else raw.decode("utf-8")
+            end = _END_TRUE[0] in payload or _END_TRUE[1] in payload
+            return answer, end, None
+    event = json.loads(payload)
+    data = event.get("data") or {}
+    answer = data.get("generated_answer")
+    return answer if isinstance(answer, str) else None, bool(data.get("end")), event
+
+
+def coalesce(deltas: Iterable[str], window: float, clock: Callable[[], float] = time.monotonic) -> Iterator[str]:
+    """Merge deltas so at most one is emitted per `window` seconds
+
+    The first delta after a quiet period goes out at once (time to first token is unchanged);
+    later ones are held until the window has passed, and the rest is flushed at the end.
+    """
+    if window <= 0:
+        yield from deltas
+        return
+    pending: List[str] = []
+    last_emit = None
+    for delta in deltas:
+        pending.append(delta)
+        now = clock()
+        if last_emit is None or now - last_emit >= window:
+            yield "".join(pending)
+            pending = []
+            last_emit = now
+    if pending:
+        yield "".join(pending)
+
+
+def openai_frame(delta: str) -> bytes:
+    """The bytes of f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]})}\\n\\n" """
+    return _FRAME_PREFIX + json.dumps(delta).encode("utf-8") + _FRAME_SUFFIX
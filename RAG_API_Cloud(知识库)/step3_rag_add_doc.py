@@ -6,6 +6,8 @@ from volcengine.auth.SignerV4 import SignerV4
 from volcengine.base.Request import Request
 from volcengine.Credentials import Credentials
 
+from retrieval_cache import notify_invalidation
+
 AK = "youak"
 SK = "yoursk"
 
@@ -62,6 +64,13 @@ def create():
     data=info_req.body
     )
     print(rsp.text)
+    try:
+        code = rsp.json().get("code")
+    except ValueError:  # not JSON, e.g. a gateway error page
+        code = None
+    # Running chatbots drop their cached search results for this collection
+    if rsp.ok and code == 0:
+        notify_invalidation(request_params["collection_name"])
 
 if __name__ == "__main__":
     ak = "yourak"
@@ -1,9 +1,15 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, Response, request, render_template, jsonify
 import json
-import requests
-from volcengine.auth.SignerV4 import SignerV4
-from volcengine.base.Request import Request
-from volcengine.Credentials import Credentials
+import os
+from chat_metrics import PROMETHEUS_CONTENT_TYPE, ChatMetrics, store_gauges
+from context_assembler import ContextAssembler
+from event_hub import SSE_HEADERS, EventHub, last_event_id, stream
+from kb_client import KnowledgeBaseClient, KnowledgeBaseError
+from rag_pipeline import RAGPipeline
+from retrieval_cache import RetrievalCache, ngram_embedding
+from session_backend import open_backend
+from agent_queue import DEFAULT_LANE
+from single_flight import SingleFlight
 import time
 import hashlib
 import hmac
@@ -11,7 +17,6 @@ import base64
 from urllib.parse import urlencode
 from datetime import datetime
 import uuid
-import threading
 from collections import defaultdict
 
 app = Flask(__name__)
@@ -27,16 +32,69 @@ account_id = "youraccountid"
 
 base_prompt = """# Task\nYou are a helpful assistant. Answer accurately based on the context.\n<context>\n{}\n</context>\n"""
 
+# Sessions, agents (agent_id -> {name, status, current_sessions}) and the queue of session_ids
+# waiting for an agent live in a session store (see session_backend.py). The default keeps them
+# in this process; CHAT_SESSION_STORE=sqlite:///path/sessions.db shares them between gunicorn workers
+store = open_backend(os.environ.get("CHAT_SESSION_STORE"))
+# New messages and status changes are pushed to the pages over SSE (/session/events/<id>,
+# /agent/events) instead of the pages polling for the whole message list. A store shared between
+# workers is also checked every 2 s for changes another worker made
+hub = EventHub()
+STREAM_POLL = 2.0 if store.shared else None
+AGENTS_CHANNEL = 'agents'  # queue and agent changes, for the agent dashboards
+# Messages/sec, handoff wait times and agent utilization over the last 5 minutes, updated as
+# things happen; the session counts come from counters the store keeps (see /metrics)
+metrics = ChatMetrics(window=300)
+ACTIVE_STATUSES = ('bot', 'waiting_agent', 'with_agent')
+QUEUE_PREVIEW = 50  # customers listed on the dashboard, in pickup order
+PREFETCH_HISTORY = 10  # recent messages the follow-up prediction looks at
+
+def sample_agents():
+    counts = store.agent_status_counts()
+    metrics.agents(counts.get('busy', 0), sum(counts.values()))
+    return counts
+
+def notify_agents():
+    """A queue or agent change: refresh the agent dashboards"""
+    sample_agents()
+    hub.publish(AGENTS_CHANNEL, 'changed')
+
+def record_handoff(requested_at):
+    if requested_at:
+        metrics.handoff((datetime.now() - datetime.fromisoformat(requested_at)).total_seconds())
+
 # Agent handoff system
 class ChatSession:
-    def __init__(self, session_id):
-        self.session_id = session_id
-        self.status = 'bot'  # bot, waiting_agent, with_agent, ended
-        self.messages = []
-        self.agent_id = None
-        self.created_at = datetime.now()
-        self.agent_requested_at = None
-        self.agent_connected_at = None
+    """A session record in the store; status changes and messages are written through to it"""
+
+    def __init__(self, record):
+        self.session_id = record['session_id']
+        self.status = record['status']  # bot, waiting_agent, with_agent, ended
+        self.agent_id = record['agent_id']
+        self.created_at = record['created_at']
+        self.agent_requested_at = record.get('agent_requested_at')
+        self.agent_connected_at = record.get('agent_connected_at')
+
+    @classmethod
+    def load(cls, session_id):
+        record = store.get_session(session_id) if session_id else None
+        return cls(record) if record is not None else None
+
+    @property
+    def messages(self):
+        return store.messages(self.session_id)
+
+    @property
+    def channel(self):
+        return f'session:{self.session_id}'
+
+    def status_event(self):
+        agent = store.get_agent(self.agent_id) if self.agent_id else None
+        return {'status': self.status, 'agent_id': self.agent_id, 'agent_name': agent['name'] if agent else None}
+
+    def _publish_status(self):
+        if hub.subscribers(self.channel):
+            hub.publish(self.channel, 'status', self.status_event())
         
     def add_message(self, sender, content, sender_type='user'):
         message = {
@@ -45,36 +103,79 @@ class ChatSession:
             'sender_type': sender_type,
             'timestamp': datetime.now().isoformat()
         }
-        self.messages.append(message)
+        message['seq'] = store.append_message(self.session_id, message)
+        metrics.message(sender_type)
+        hub.publish(self.channel, 'message', message, event_id=message['seq'])
         return message
+
+    def _update(self, **fields):
+        store.update_session(self.session_id, **fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._publish_status()
         
+    def _transition(self, expected, **fields):
+        """expected -> fields['status'], atomically (False if the session was not in `expected`)"""
+        def transition(record):
+            if record['status'] != expected:
+                return False
+            record.update(fields)
+            return True
+        if not store.modify_session(self.session_id, transition):
+            return False
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._publish_status()
+        return True
+
     def request_agent(self):
-        self.status = 'waiting_agent'
-        self.agent_requested_at = datetime.now()
+        """bot -> waiting_agent (False if the session was not with the bot)"""
+        return self._transition('bot', status='waiting_agent', agent_requested_at=datetime.now().isoformat())
         
     def assign_agent(self, agent_id):
-        self.agent_id = agent_id
-        self.status = 'with_agent'
-        self.agent_connected_at = datetime.now()
+        """waiting_agent -> with_agent (False if another agent got there first or the customer left)"""
+        return self._transition('waiting_agent', status='with_agent', agent_id=agent_id,
+                                agent_connected_at=datetime.now().isoformat())
         
     def end_session(self):
-        self.status = 'ended'
-        self.agent_id = None
+        self._update(status='ended', agent_id=None)
+
+    def recent_queries(self):
+        """The customer's latest questions, which follow-up prediction skips"""
+        return [m['content'] for m in store.recent_messages(self.session_id, PREFETCH_HISTORY)
+                if m['sender_type'] == 'user']
 
-# Global storage (in production, use Redis or database)
-sessions = {}
-agent_queue = []  # List of session_ids waiting for agents
-active_agents = {}  # agent_id -> {name, status, current_sessions}
-session_lock = threading.Lock()
+    def leave_queue(self):
+        """waiting_agent -> ended and out of the queue, for a customer who gives up waiting"""
+        def transition(record):
+            if record['status'] != 'waiting_agent':
+                return False
+            record['status'] = 'ended'
+            return True
+        if not store.modify_session(self.session_id, transition):
+            return False
+        self.status = 'ended'
+        store.remove_from_queue(self.session_id)
+        self._publish_status()
+        notify_agents()
+        return True
 
 def get_or_create_session(session_id=None):
     if not session_id:
         session_id = str(uuid.uuid4())
     
-    with session_lock:
-        if session_id not in sessions:
-            sessions[session_id] = ChatSession(session_id)
-        return sessions[session_id]
+    return ChatSession(store.create_session(session_id, {
+        'session_id': session_id,
+        'status': 'bot',
+        'agent_id': None,
+        'created_at': datetime.now().isoformat(),
+        'agent_requested_at': None,
+        'agent_connected_at': None
+    }))
+
+def goes_to_bot(status, wants_agent):
+    """Whether the bot answers a message sent in this status (not while queued or with an agent)"""
+    return status not in ('waiting_agent', 'with_agent') and not (wants_agent and status == 'bot')
 
 def detect_agent_request(query):
     """Detect if user wants to talk to an agent"""
@@ -86,90 +187,35 @@ def detect_agent_request(query):
     query_lower = query.lower()
     return any(keyword in query_lower for keyword in agent_keywords)
 
-def prepare_request(method, path, params=None, data=None, doseq=0):
-    r = Request()
-    r.set_shema("https")
-    r.set_method(method)
-    r.set_connection_timeout(10)
-    r.set_socket_timeout(10)
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json; charset=utf-8",
-        "Host": g_knowledge_base_domain,
-        "V-Account-Id": account_id,
-    }
-    r.set_headers(headers)
-    if params:
-        r.set_query(params)
-    r.set_host(g_knowledge_base_domain)
-    r.set_path(path)
-    if data is not None:
-        r.set_body(json.dumps(data))
-    credentials = Credentials(AK, SK, "air", "cn-north-1")
-    SignerV4.sign(r, credentials)
-    return r
-
-def search_knowledge(query):
-    method = "POST"
-    path = "/api/knowledge/collection/search_knowledge"
-    request_params = {
-        "project": "",
-        "name": "test",
-        "query": query,
-        "limit": 5,
-        "pre_processing": {
-            "need_instruction": False,
-            "rewrite": False,
-            "return_token_usage": False
-        },
-        "dense_weight": 0.5,
-        "post_processing": {
-            "chunk_group": True,
-            "rerank_switch": False
-        }
-    }
-    info_req = prepare_request(method, path, data=request_params)
-    rsp = requests.request(
-        method=info_req.method,
-        url=f"https://{g_knowledge_base_domain}{info_req.path}",
-        headers=info_req.headers,
-        data=info_req.body
-    )
-    print("🔍 KB Search Response:", rsp.text)
-    data = rsp.json()
-    chunks = data.get("data", {}).get("result_list", [])
-    return "\n".join([c.get("content", "") for c in chunks])
+# One signed, keep-alive client shared by every call: the credential, connection pool and
+# derived signing keys are reused instead of being rebuilt per request (see kb_client.py)
+# Repeated and near-identical questions reuse cached search results for up to 5 minutes;
+# adding or deleting documents (kb_client or the step3 scripts) drops the collection's entries
+# Identical searches arriving while one is in flight (a popular question in many threads) wait
+# for it instead of each calling the API; waiters give up after 10 s
+kb = KnowledgeBaseClient(AK, SK, account_id, domain=g_knowledge_base_domain,
+                         project=project_name, collection=collection_name,
+                         cache=RetrievalCache(max_entries=2048, ttl=300, embed=ngram_embedding,
+                                              similarity_threshold=0.9),
+                         single_flight=SingleFlight(timeout=10, timeouts={"chat_completions": 60}))
+# Starts retrieval as soon as a query arrives and prefetches likely follow-ups into the cache
+# Retrieved chunks are deduplicated and trimmed to a token budget, best score first
+context_assembler = ContextAssembler(token_budget=3000)
+pipeline = RAGPipeline(kb, base_prompt, search_options={"limit": 5, "dense_weight": 0.5},
+                       build_context=context_assembler.build)
 
 def chat_completion(prompt, user_query):
-    method = "POST"
-    path = "/api/knowledge/chat/completions"
     messages = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": user_query}
     ]
-    request_params = {
-        "messages": messages,
-        "stream": False,
-        "return_token_usage": True,
-        "model": "Skylark-pro",
-        "max_tokens": 1024,
-        "temperature": 0.7
-    }
-    info_req = prepare_request(method, path, data=request_params)
-    rsp = requests.request(
-        method=info_req.method,
-        url=f"https://{g_knowledge_base_domain}{info_req.path}",
-        headers=info_req.headers,
-        data=info_req.body
-    )
-    #print("🤖 Chat Completion Response:", rsp.text)
-    resp_json = rsp.json()
-    print(json.dumps(resp_json, indent=2))
     try:
-        result = rsp.json()
-        return result.get("data", {}).get("generated_answer", "⚠️ No answer generated.")
-    except Exception as e:
-        return f"⚠️ Failed to parse response. Raw: {rsp.text}"
+        result = kb.chat_completions(messages, model="Skylark-pro", max_tokens=1024, temperature=0.7,
+                                     return_token_usage=True)
+    except KnowledgeBaseError as e:
+        return f"⚠️ Failed to parse response. Raw: {e}"
+    print(json.dumps(result, indent=2))
+    return result.get("generated_answer", "⚠️ No answer generated.")
 
 @app.route("/")
 def index():
@@ -188,25 +234,27 @@ def chat():
         # Get or create session
         session = get_or_create_session(session_id)
         
-        # Add user message to session
-        session.add_message('customer', user_query, 'user')
+        # Only a message the bot will answer needs a search; it runs while the message is stored
+        wants_agent = detect_agent_request(user_query)
+        retrieval = pipeline.retrieve(user_query) if goes_to_bot(session.status, wants_agent) else None
+        
+        # Add user message to session; last_seq tells the page where its message stream should resume
+        last_seq = session.add_message('customer', user_query, 'user')['seq']
         
         # Check if user wants to talk to an agent
-        if detect_agent_request(user_query) and session.status == 'bot':
-            session.request_agent()
-            with session_lock:
-                if session.session_id not in agent_queue:
-                    agent_queue.append(session.session_id)
-            
-            queue_position = agent_queue.index(session.session_id) + 1
+        if wants_agent and session.request_agent():
+            # "lane" routes the customer to agents with that language or skill (e.g. "es", "billing")
+            queue_position = store.enqueue(session.session_id, data.get('lane') or DEFAULT_LANE)
+            notify_agents()
             response_message = f"I understand you'd like to speak with a human agent. You've been added to the queue at position {queue_position}. An agent will be with you shortly."
-            session.add_message('system', response_message, 'system')
+            last_seq = session.add_message('system', response_message, 'system')['seq']
             
             return jsonify({
                 'answer': response_message,
                 'session_id': session.session_id,
                 'status': session.status,
-                'queue_position': queue_position
+                'queue_position': queue_position,
+                'last_seq': last_seq
             })
         
         # If session is with agent, don't process with AI
@@ -216,33 +264,38 @@ def chat():
                 'answer': response_message,
                 'session_id': session.session_id,
                 'status': session.status,
-                'agent_name': active_agents.get(session.agent_id, {}).get('name', 'Agent')
+                'agent_name': (store.get_agent(session.agent_id) or {}).get('name', 'Agent'),
+                'last_seq': last_seq
             })
         
         # If waiting for agent
         if session.status == 'waiting_agent':
-            queue_position = agent_queue.index(session.session_id) + 1 if session.session_id in agent_queue else 0
+            queue_position = store.queue_position(session.session_id)
             response_message = f"You are still in the queue at position {queue_position}. An agent will be with you shortly."
             return jsonify({
                 'answer': response_message,
                 'session_id': session.session_id,
                 'status': session.status,
-                'queue_position': queue_position
+                'queue_position': queue_position,
+                'last_seq': last_seq
             })
         
-        # Normal AI processing
-        kb_context = search_knowledge(user_query)
+        # Normal AI processing (the search is usually finished by now)
+        retrieval = retrieval or pipeline.retrieve(user_query)
+        kb_context = pipeline.context(retrieval)
         prompt = base_prompt.format(kb_context)
         answer = chat_completion(prompt, user_query)
         
         # Add AI response to session
-        session.add_message('assistant', answer, 'bot')
+        last_seq = session.add_message('assistant', answer, 'bot')['seq']
+        pipeline.prefetch(session.recent_queries(), retrieval)
         
         return jsonify({
             'answer': answer,
             'session_id': session.session_id,
             'status': session.status,
-            'knowledge_used': kb_context
+            'knowledge_used': kb_context,
+            'last_seq': last_seq
         })
     
     except Exception as e:
@@ -258,12 +311,15 @@ def agent_login():
         return jsonify({'error': 'Agent name required'}), 400
     
     agent_id = str(uuid.uuid4())
-    active_agents[agent_id] = {
+    store.put_agent(agent_id, {
         'name': agent_name,
         'status': 'available',
         'current_sessions': [],
+        # Queue lanes (languages / skills) this agent serves; None serves every lane
+        'lanes': data.get('lanes') or None,
         'login_time': datetime.now().isoformat()
-    }
+    })
+    notify_agents()
     
     return jsonify({
         'agent_id': agent_id,
@@ -276,29 +332,38 @@ def agent_pickup():
     agent_id = data.get('agent_id')
     session_id = data.get('session_id')
     
-    if not agent_id or not session_id:
-        return jsonify({'error': 'Agent ID and Session ID required'}), 400
+    if not agent_id:
+        return jsonify({'error': 'Agent ID required'}), 400
     
-    if agent_id not in active_agents:
+    agent = store.get_agent(agent_id)
+    if agent is None:
         return jsonify({'error': 'Agent not found'}), 404
     
-    if session_id not in sessions:
+    if not session_id:
+        # The next customer in the agent's lanes (an atomic pop)
+        session_id = store.dequeue(agent.get('lanes'))
+        if session_id is None:
+            return jsonify({'error': 'No customers in queue'}), 400
+    
+    session = ChatSession.load(session_id)
+    if session is None:
         return jsonify({'error': 'Session not found'}), 404
     
-    session = sessions[session_id]
+    # Assign agent; only one agent's waiting_agent -> with_agent transition succeeds
+    if not session.assign_agent(agent_id):
+        return jsonify({'error': 'Session is not waiting for an agent'}), 409
+    # A specific customer is still queued: take them out now that they are ours
+    store.remove_from_queue(session_id)
+    record_handoff(session.agent_requested_at)
     
-    with session_lock:
-        # Remove from queue
-        if session_id in agent_queue:
-            agent_queue.remove(session_id)
-        
-        # Assign agent
-        session.assign_agent(agent_id)
-        active_agents[agent_id]['current_sessions'].append(session_id)
-        active_agents[agent_id]['status'] = 'busy'
+    def take(agent_record):
+        agent_record['current_sessions'].append(session_id)
+        agent_record['status'] = 'busy'
+    store.modify_agent(agent_id, take)
+    notify_agents()
     
     # Add system message
-    agent_name = active_agents[agent_id]['name']
+    agent_name = agent['name']
     session.add_message('system', f'Agent {agent_name} has joined the chat.', 'system')
     
     return jsonify({
@@ -317,20 +382,19 @@ def agent_send_message():
     if not all([agent_id, session_id, message]):
         return jsonify({'error': 'Agent ID, Session ID, and message required'}), 400
     
-    if agent_id not in active_agents:
+    agent = store.get_agent(agent_id)
+    if agent is None:
         return jsonify({'error': 'Agent not found'}), 404
     
-    if session_id not in sessions:
+    session = ChatSession.load(session_id)
+    if session is None:
         return jsonify({'error': 'Session not found'}), 404
     
-    session = sessions[session_id]
-    
     if session.agent_id != agent_id:
         return jsonify({'error': 'Agent not assigned to this session'}), 403
     
     # Add agent message
-    agent_name = active_agents[agent_id]['name']
-    session.add_message(agent_name, message, 'agent')
+    session.add_message(agent['name'], message, 'agent')
     
     return jsonify({'message': 'Message sent successfully'})
 
@@ -343,25 +407,26 @@ def agent_end_session():
     if not agent_id or not session_id:
         return jsonify({'error': 'Agent ID and Session ID required'}), 400
     
-    if agent_id not in active_agents:
+    if store.get_agent(agent_id) is None:
         return jsonify({'error': 'Agent not found'}), 404
     
-    if session_id not in sessions:
+    session = ChatSession.load(session_id)
+    if session is None:
         return jsonify({'error': 'Session not found'}), 404
     
-    session = sessions[session_id]
+    # End session
+    session.end_session()
     
-    with session_lock:
-        # End session
-        session.end_session()
-        
+    def release(agent_record):
         # Remove from agent's current sessions
-        if session_id in active_agents[agent_id]['current_sessions']:
-            active_agents[agent_id]['current_sessions'].remove(session_id)
+        if session_id in agent_record['current_sessions']:
+            agent_record['current_sessions'].remove(session_id)
         
         # Update agent status
-        if not active_agents[agent_id]['current_sessions']:
-            active_agents[agent_id]['status'] = 'available'
+        if not agent_record['current_sessions']:
+            agent_record['status'] = 'available'
+    store.modify_agent(agent_id, release)
+    notify_agents()
     
     # Add system message
     session.add_message('system', 'Chat session ended by agent.', 'system')
@@ -375,10 +440,10 @@ def agent_status():
     if not agent_id:
         return jsonify({'error': 'Agent ID required'}), 400
     
-    if agent_id not in active_agents:
+    agent = store.get_agent(agent_id)
+    if agent is None:
         return jsonify({'error': 'Agent not found'}), 404
     
-    agent = active_agents[agent_id]
     return jsonify({
         'agent_id': agent_id,
         'name': agent['name'],
@@ -389,45 +454,105 @@ def agent_status():
 
 @app.route('/session/messages/<session_id>')
 def get_session_messages(session_id):
-    if session_id not in sessions:
+    session = ChatSession.load(session_id)
+    if session is None:
         return jsonify({'error': 'Session not found'}), 404
     
-    session = sessions[session_id]
+    # ?after=<seq> returns only newer messages
     return jsonify({
         'session_id': session_id,
         'status': session.status,
-        'messages': session.messages,
+        'messages': store.messages(session_id, after=request.args.get('after', 0, type=int)),
         'agent_id': session.agent_id
     })
 
+@app.route('/session/events/<session_id>')
+def session_events(session_id):
+    """SSE stream of the session's status and messages, resuming after Last-Event-ID (a message seq)"""
+    if ChatSession.load(session_id) is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    def load(after):
+        session = ChatSession.load(session_id)
+        events = [('status', session.status_event(), None)] if session else []
+        return events + [('message', m, m['seq']) for m in store.messages(session_id, after=after)]
+    
+    return Response(stream(hub, f'session:{session_id}', load, last_event_id(request), poll=STREAM_POLL),
+                    mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/agent/events')
+def agent_events():
+    """SSE stream of the agent's status and the dashboard stats, sent again when they change"""
+    agent_id = request.args.get('agent_id')
+    if not agent_id:
+        return jsonify({'error': 'Agent ID required'}), 400
+    if store.get_agent(agent_id) is None:
+        return jsonify({'error': 'Agent not found'}), 404
+    
+    def load(after):
+        agent = store.get_agent(agent_id) or {}
+        # One stats computation per change, shared by every connected dashboard
+        stats = hub.memo(AGENTS_CHANNEL, 'stats', dashboard_stats, max_age=STREAM_POLL)
+        return [('agent', {'agent_id': agent_id, 'name': agent.get('name'), 'status': agent.get('status'),
+                           'current_sessions': len(agent.get('current_sessions', []))}, None),
+                ('stats', stats, None)]
+    
+    return Response(stream(hub, AGENTS_CHANNEL, load, poll=STREAM_POLL, reload_on_event=True),
+                    mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/session/leave/<session_id>', methods=['POST'])
+def leave_session(session_id):
+    session = ChatSession.load(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    left = session.leave_queue()
+    return jsonify({'status': session.status, 'left_queue': left})
+
+def dashboard_stats():
+    """From the store's status counters and the rolling metrics; only the head of the queue is listed"""
+    statuses = store.status_counts()
+    
+    queue_data = []
+    for session_id in store.queued(limit=QUEUE_PREVIEW):
+        session = ChatSession.load(session_id)
+        if session:
+            requested_at = session.agent_requested_at
+            wait_time = (datetime.now() - datetime.fromisoformat(requested_at)).total_seconds() if requested_at else 0
+            last_message = store.recent_messages(session_id, 1)
+            queue_data.append({
+                'session_id': session_id,
+                'wait_time': int(wait_time),
+                'last_message': last_message[0]['content'] if last_message else None
+            })
+    
+    return {
+        'active_sessions': sum(statuses.get(status, 0) for status in ACTIVE_STATUSES),
+        'queue_length': store.queue_length(),
+        'queue_lanes': store.queue_lengths(),
+        'waiting_sessions': statuses.get('waiting_agent', 0),
+        'agent_sessions': statuses.get('with_agent', 0),
+        'active_agents': sum(sample_agents().values()),
+        'queue': queue_data,
+        'metrics': metrics.snapshot()
+    }
+
 @app.route('/admin/stats')
 def admin_stats():
-    with session_lock:
-        active_sessions = len([s for s in sessions.values() if s.status in ['bot', 'waiting_agent', 'with_agent']])
-        waiting_sessions = len([s for s in sessions.values() if s.status == 'waiting_agent'])
-        agent_sessions = len([s for s in sessions.values() if s.status == 'with_agent'])
-        
-        queue_data = []
-        for session_id in agent_queue:
-            if session_id in sessions:
-                session = sessions[session_id]
-                wait_time = (datetime.now() - session.agent_requested_at).total_seconds() if session.agent_requested_at else 0
-                last_message = session.messages[-1]['content'] if session.messages else None
-                queue_data.append({
-                    'session_id': session_id,
-                    'wait_time': int(wait_time),
-                    'last_message': last_message
-                })
-    
     return jsonify({
-        'active_sessions': active_sessions,
-        'queue_length': len(agent_queue),
-        'waiting_sessions': waiting_sessions,
-        'agent_sessions': agent_sessions,
-        'active_agents': len(active_agents),
-        'queue': queue_data
+        **dashboard_stats(),
+        'push': hub.stats(),
+        'retrieval_cache': kb.cache.stats(),
+        'single_flight': kb.single_flight.stats(),
+        'prompt_context': context_assembler.stats()
     })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text format: message and handoff counters, session / queue / agent gauges"""
+    sample_agents()
+    return Response(metrics.prometheus() + store_gauges(store), content_type=PROMETHEUS_CONTENT_TYPE)
+
 # Enhanced route for customer interface
 @app.route('/enhanced')
 def enhanced_chatbot():
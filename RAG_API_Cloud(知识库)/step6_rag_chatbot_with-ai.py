@@ -4,10 +4,12 @@
 # 4. This script will be inline with template/index-ai.html so make sure when you run it, also replace the index accordingly.
 
 import json
-import requests
-from volcengine.auth.SignerV4 import SignerV4
-from volcengine.base.Request import Request
-from volcengine.Credentials import Credentials
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+from answer_cache import AnswerCache, chunk_ids
+from context_assembler import ContextAssembler
+from kb_client import KnowledgeBaseClient, KnowledgeBaseError
+from rag_pipeline import RAGPipeline
+from sse_stream import DONE_FRAME, openai_frame
 
 app = Flask(__name__)
 
@@ -19,139 +21,65 @@ sk = "yoursk=="
 g_knowledge_base_domain = "api-knowledgebase.mlp.cn-hongkong.bytepluses.com"
 account_id = "yourid"
 
+chat_model = "Skylark-pro"
+chat_temperature = 0.7
+
+# Full-answer cache for non-stream /chat: only answers generated at temperature 0 are reused unless
+# cache_sampled_answers is True. None keeps entries in memory; a path (e.g.
+# "/var/lib/chatbot/answer_cache.sqlite3") keeps them across restarts
+answer_cache_path = None
+cache_sampled_answers = False
+
 base_prompt = """# Task\nYou are a helpful assistant. Answer accurately based on the context.\n<context>\n{}\n</context>\n"""
 
-def prepare_request(method, path, params=None, data=None, doseq=0):
-    r = Request()
-    r.set_shema("https")
-    r.set_method(method)
-    r.set_connection_timeout(10)
-    r.set_socket_timeout(10)
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json; charset=utf-8",
-        "Host": g_knowledge_base_domain,
-        "V-Account-Id": account_id,
-    }
-    r.set_headers(headers)
-    if params:
-        r.set_query(params)
-    r.set_host(g_knowledge_base_domain)
-    r.set_path(path)
-    if data is not None:
-        r.set_body(json.dumps(data))
-    credentials = Credentials(ak, sk, "air", "cn-north-1")
-    SignerV4.sign(r, credentials)
-    return r
+# One signed, keep-alive client shared by every call: the credential, connection pool and
+# derived signing keys are reused instead of being rebuilt per request (see kb_client.py)
+kb = KnowledgeBaseClient(ak, sk, account_id, domain=g_knowledge_base_domain,
+                         project=project_name, collection=collection_name)
+# Starts retrieval as soon as the query is extracted, before the SSE response is opened
+# Retrieved chunks are deduplicated and trimmed to a token budget, best score first
+context_assembler = ContextAssembler(token_budget=3000)
+pipeline = RAGPipeline(kb, base_prompt, search_options={"limit": 20, "dense_weight": 0.5},
+                       build_context=context_assembler.build)
+# Non-stream /chat reuses the full answer when the same question retrieves the same chunks, for up
+# to an hour; inspect or purge entries at /admin/answer_cache
+answer_cache = AnswerCache(answer_cache_path, ttl=3600, max_entries=5000, allow_sampled=cache_sampled_answers)
 
 def search_knowledge(query):
-    method = "POST"
-    path = "/api/knowledge/collection/search_knowledge"
-    request_params = {
-        "project": "",
-        "name": collection_name,
-        "query": query,
-        "limit": 20,
-        "pre_processing": {
-            "need_instruction": False,
-            "rewrite": False,
-            "return_token_usage": False
-        },
-        "dense_weight": 0.5,
-        "post_processing": {
-            "chunk_group": True,
-            "rerank_switch": False
-        }
-    }
-    info_req = prepare_request(method, path, data=request_params)
-    rsp = requests.request(
-        method=info_req.method,
-        url=f"https://{g_knowledge_base_domain}{info_req.path}",
-        headers=info_req.headers,
-        data=info_req.body
-    )
-    print("🔍 KB Search Response:", rsp.text)
-    data = rsp.json()
-    chunks = data.get("data", {}).get("result_list", [])
-    return "\n".join([c.get("content", "") for c in chunks])
+    """search_knowledge data, or None if the search failed"""
+    try:
+        data = kb.search_knowledge(query, limit=20, dense_weight=0.5)
+    except KnowledgeBaseError as e:
+        print("🔍 KB Search failed:", e)
+        return None
+    print("🔍 KB Search Response:", json.dumps(data, ensure_ascii=False))
+    return data
 
 
 def chat_completion_stream(prompt, user_query):
-    method = "POST"
-    path = "/api/knowledge/chat/completions"
     messages = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": user_query}
     ]
-    request_params = {
-        "messages": messages,
-        "stream": True,
-        "return_token_usage": False,
-        "model": "Skylark-pro",
-        "temperature": 0.7
-    }
-    info_req = prepare_request(method, path, data=request_params)
-
-    with requests.request(
-        method=info_req.method,
-        url=f"https://{g_knowledge_base_domain}{info_req.path}",
-        headers=info_req.headers,
-        data=info_req.body,
-        stream=True
-    ) as rsp:
-        for line in rsp.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-            print("📡 Streaming line:", line)
-            if line.startswith("data:"):
-                try:
-                    raw_json = line[len("data:"):].strip()
-                    obj = json.loads(raw_json)
-                    answer = obj.get("data", {}).get("generated_answer", "")
-                    if answer:
-                        formatted = {
-                            "choices": [
-                                {
-                                    "delta": {
-                                        "content": answer
-                                    }
-                                }
-                            ]
-                        }
-                        yield f"data: {json.dumps(formatted)}\n\n"
-                    if obj.get("data", {}).get("end"):
-                        break
-                except Exception as e:
-                    print("❌ Parse error:", e, "| Raw line:", line)
-        yield "data: [DONE]\n\n"
+    # Raw SSE bytes are decoded incrementally and only generated_answer / end are extracted;
+    # deltas arriving within 20 ms are merged into one OpenAI-style chunk (see sse_stream.py)
+    try:
+        for answer in kb.chat_completions_deltas(messages, model=chat_model, temperature=chat_temperature,
+                                                 coalesce_window=0.02):
+            yield openai_frame(answer)
+    except KnowledgeBaseError as e:
+        yield f"data: {json.dumps({'error': str(e)})}\n\n".encode("utf-8")
+    yield DONE_FRAME
 
 def chat_completion(prompt, user_query):
-    method = "POST"
-    path = "/api/knowledge/chat/completions"
+    """generated_answer, or None if there was none; raises KnowledgeBaseError"""
     messages = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": user_query}
     ]
-    request_params = {
-        "messages": messages,
-        "stream": False,
-        "return_token_usage": True,
-        "model": "Skylark-pro",
-        "max_tokens": 1024,
-        "temperature": 0.7
-    }
-    info_req = prepare_request(method, path, data=request_params)
-    rsp = requests.request(
-        method=info_req.method,
-        url=f"https://{g_knowledge_base_domain}{info_req.path}",
-        headers=info_req.headers,
-        data=info_req.body
-    )
-    try:
-        result = rsp.json()
-        return result.get("data", {}).get("generated_answer", "⚠️ No answer generated.")
-    except Exception as e:
-        return f"⚠️ Failed to parse response. Raw: {rsp.text}"
+    result = kb.chat_completions(messages, model=chat_model, max_tokens=1024, temperature=chat_temperature,
+                                 return_token_usage=True)
+    return result.get("generated_answer")
 
 @app.route("/")
 def index():
@@ -160,10 +88,40 @@ def index():
 @app.route("/chat", methods=["POST"])
 def chat_non_stream():
     user_query = request.json.get("query", "")
-    kb_context = search_knowledge(user_query)
-    prompt = base_prompt.format(kb_context)
-    answer = chat_completion(prompt, user_query)
-    return jsonify({"answer": answer})
+    data = search_knowledge(user_query)
+    # Answers generated without context (failed search) are never cached
+    ids = chunk_ids(data) if data is not None else None
+    if ids is not None:
+        answer = answer_cache.get(user_query, ids, chat_model, chat_temperature)
+        if answer is not None:
+            return jsonify({"answer": answer, "cached": True})
+    prompt = base_prompt.format(context_assembler.build(data) if data is not None else "")
+    try:
+        answer = chat_completion(prompt, user_query)
+    except KnowledgeBaseError as e:
+        return jsonify({"answer": f"⚠️ Failed to parse response. Raw: {e}"})
+    if answer is None:
+        return jsonify({"answer": "⚠️ No answer generated."})
+    if ids is not None:
+        answer_cache.put(user_query, ids, chat_model, chat_temperature, answer)
+    return jsonify({"answer": answer, "cached": False})
+
+
+@app.route("/admin/answer_cache", methods=["GET"])
+def answer_cache_entries():
+    limit = request.args.get("limit", 50, type=int)
+    offset = request.args.get("offset", 0, type=int)
+    return jsonify({"stats": answer_cache.stats(), "entries": answer_cache.entries(limit, offset)})
+
+
+@app.route("/admin/answer_cache", methods=["DELETE"])
+def answer_cache_purge():
+    # ?key=<entry key> or ?query=<question> drops those entries; everything only with ?all=1
+    key, query = request.args.get("key"), request.args.get("query")
+    if not key and not query and request.args.get("all") != "1":
+        return jsonify({"error": "pass ?key=, ?query= or ?all=1"}), 400
+    purged = answer_cache.purge(key=key or None, query=query or None)
+    return jsonify({"purged": purged, "stats": answer_cache.stats()})
 
 
 
@@ -191,11 +149,15 @@ def chat_stream():
     if not user_query.strip():
         return Response("data: {\"error\": \"Empty query\"}\n\ndata: [DONE]\n\n", content_type="text/event-stream")
 
-    kb_context = search_knowledge(user_query)
-    prompt = base_prompt.format(kb_context)
+    retrieval = pipeline.retrieve(user_query)
+
+    def generate():
+        # Response headers go out immediately; generation starts as soon as the chunks arrive
+        prompt = base_prompt.format(pipeline.context(retrieval))
+        yield from chat_completion_stream(prompt, user_query)
 
     return Response(
-        stream_with_context(chat_completion_stream(prompt, user_query)),
+        stream_with_context(generate()),
         content_type="text/event-stream"
     )
 
@@ -1,6 +1,9 @@
 import json 
 import requests 
 
+from context_assembler import ContextAssembler 
+from conversation_memory import ConversationStore 
+
 from volcengine.auth.SignerV4 import SignerV4 
 from volcengine.base.Request import Request 
 from volcengine.Credentials import Credentials 
@@ -15,6 +18,14 @@ SK = "yoursk"
 g_knowledge_base_domain = "api-knowledgebase.mlp.cn-hongkong.bytepluses.com"
 account_id = "youraccountid"
 
+# Token budget for the retrieved chunks in <context>; add table_chunk_fields field names to table_fields 
+# to include them in the prompt 
+context_assembler = ContextAssembler(token_budget=3000, table_fields=[]) 
+
+# Dialogue cached locally per conversation: the last 4 turns are resent verbatim, older turns are 
+# folded into a short summary, and each chat_completion request is capped at 6000 tokens 
+conversations = ConversationStore(max_conversations=1000, max_turns=4, summary_tokens=200, max_request_tokens=6000) 
+
 base_prompt = """# Task 
 You are an online customer service agent. Your primary task is to skillfully respond to user's questions using tactful language. You need to answer the following questions based on the reference materials provided within the <context></context> XML tags. Your answers should be accurate and concise. 
 
@@ -65,33 +76,25 @@ def prepare_request(method, path, params=None, data=None, doseq=0):
         r.set_body(json.dumps(data)) 
 
     # Signature generation 
-    credentials = Credentials(ak, sk, "air", "cn-north-1") 
+    credentials = Credentials(AK, SK, "air", "cn-north-1") 
     SignerV4.sign(r, credentials) 
     return r 
 
 
-def search_knowledge(): 
+def search_knowledge(query, memory): 
     method = "POST" 
     path = "/api/knowledge/collection/search_knowledge" #Knowledge base retrieval 
     request_params = { 
     "project": "", 
     "name": "test", 
-    "query": "What is the development friendly in this document", 
+    "query": query, 
     "limit": 10, 
     "pre_processing": { 
         "need_instruction": True, #Specifies whether to concatenate instructions, recommended for asymmetric questions 
-        "rewrite": False, #Multi-turn rewriting switch, only rewrites the current question based on messages 
         "return_token_usage": True, 
-        "messages": [ 
-            { 
-                "role": "system", 
-                "content": "" 
-            }, 
-            { 
-                "role": "user", 
-                "content": query 
-            } 
-        ] 
+        # Multi-turn rewriting switch, only rewrites the current question based on messages; 
+        # switched on (with the recent turns as messages) once the conversation has history 
+        **memory.search_options(query), 
     }, 
     "dense_weight": 0.5, #Adjust the weight of semantic retrieval. 1 represents pure semantic retrieval, and this only takes effect when the vectorization model selects the semantic + keyword model 
     "post_processing": { 
@@ -118,11 +121,11 @@ def chat_completion(message, stream=False, return_token_usage=True, temperature=
     path = "/api/knowledge/chat/completions" #LLM generation 
     request_params = { 
         "messages": message, #Pass the prompt, retrieved chunks, and historical multi-turn dialogue through the messages field 
-        "stream": True, #Specifies whether it is streaming response 
-        "return_token_usage": True, 
+        "stream": stream, #Specifies whether it is streaming response 
+        "return_token_usage": return_token_usage, 
         "model": "Skylark-pro", #By default, this model uses the public endpoint of the system. To use a private endpoint created on ModelArk, pass ep_id here and specify the api_key parameter. For more information, refer to chat_completions. 
-        "max_tokens": 4096, 
-        "temperature": 0.7
+        "max_tokens": max_tokens, 
+        "temperature": temperature
     } 
 
     info_req = prepare_request(method=method, path=path, data=request_params) 
@@ -133,61 +136,51 @@ def chat_completion(message, stream=False, return_token_usage=True, temperature=
         data=info_req.body 
     ) 
     print("chat completion res = {}".format(rsp.text)) 
+    try: 
+        rsp_json = json.loads(rsp.text) 
+    except ValueError:  # not JSON, e.g. a gateway error page; the conversation goes on 
+        return "" 
+    if rsp_json.get("code") != 0: 
+        return "" 
+    return rsp_json["data"]["generated_answer"] 
 
 def generate_prompt(rsp_txt): # System prompt concatenation 
-    rsp = json.loads(rsp_txt) 
-    if rsp["code"] != 0: 
+    try: 
+        rsp = json.loads(rsp_txt) 
+    except ValueError:  # not JSON: answer without reference materials 
         return 
-    prompt = "" 
-    rsp_data = rsp["data"] 
-    points = rsp_data["result_list"] 
-
-    for point in points: 
-        # System field concatenated first 
-        doc_info = point["doc_info"] 
-        for system_field in ["doc_name","title","chunk_title","content"] : 
-            if system_field == 'doc_name' or system_field == 'title': 
-                if system_field in doc_info: 
-                    prompt += f"{system_field}: {doc_info[system_field]}\n" 
-            else: 
-                if system_field in point: 
-                    if system_field == "content" and doc_info["doc_type"] == "faq.xlsx": 
-                        question_field = "original_question" 
-                        prompt += f"content: When a similar question is asked, refer to the corresponding answer: Question: {point[question_field]}; Answer: {point[system_field]}\n" #FAQ best practices 
-                    else: 
-                        prompt += f"{system_field}: {point[system_field]}\n" 
-        if "table_chunk_fields" in point: 
-            table_chunk_fields = point["table_chunk_fields"] 
-            for self_field in [] : 
-                # Use next() to find the first project that matches the condition from table_chunk_fields 
-                find_one = next((item for item in table_chunk_fields if item["field_name"] == self_field), None) 
-                if find_one: 
-                    prompt += f"{self_field}: {find_one['field_value']}\n" 
-
-        prompt += "---\n" 
-
-    return base_prompt.format(prompt) 
-
-def search_knowledge_and_chat_completion(): 
+    if rsp.get("code") != 0: 
+        return 
+    points = rsp["data"]["result_list"] 
+
+    # Best-scored chunks first, near-duplicates dropped, trimmed to context_assembler.token_budget 
+    assembled = context_assembler.assemble(points) 
+    report = assembled["report"] 
+    print("context: kept {kept}/{chunks} chunks, {tokens_used} tokens, saved {tokens_saved} " 
+          "({duplicates_dropped} duplicates, {over_budget_dropped} over budget)".format(**report)) 
+
+    return base_prompt.format(assembled["context"]) 
+
+def search_knowledge_and_chat_completion(query, conversation_id="default"): 
+    memory = conversations.get(conversation_id) 
     # 1. search_knowledge execution 
-   rsp_txt = search_knowledge() 
+    rsp_txt = search_knowledge(query, memory) 
     # 2. Prompt generation 
-   prompt = generate_prompt(rsp_txt) 
-    # todo: Users need to cache dialogue information locally and sequentially add it to messages 
-    # 3. Dialogue concatenation, where the question corresponds to the role user, the system corresponds to the role system, the answer corresponds to the role assistant, and the content corresponds to content 
-   messages =[ 
-       { 
-           "role": "system", 
-           "content": prompt  #LLM instruction + retrieval result test
-       }, 
-       { 
-           "role": "user", 
-           "content": query 
-       } 
-   ] 
+    prompt = generate_prompt(rsp_txt) or base_prompt.format("") 
+    # 3. Dialogue concatenation: system (LLM instruction + retrieval result + summary of older turns), 
+    # the recent question / answer turns as user / assistant, then the current question 
+    messages = memory.messages(prompt, query) 
+    print("request: {} messages, ~{} tokens, {} older turns summarized".format( 
+        len(messages), memory.request_tokens(prompt, query), memory.summarized_turns)) 
 
     # 4. chat_completion calling 
-   chat_completion(messages) 
+    answer = chat_completion(messages) 
+    if answer: 
+        memory.add_turn(query, answer) 
+    return answer 
 
 if __name__ == "__main__": 
-    search_knowledge_and_chat_completion()
+    # Ask follow-up questions in the same conversation; an empty line exits 
+    while query: 
+        search_knowledge_and_chat_completion(query) 
+        query = input("> ").strip() 
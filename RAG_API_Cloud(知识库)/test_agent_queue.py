@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for the lane / priority agent queue against a plain list model
+"""
+
+import random
+
+from agent_queue import VIP_PRIORITY, AgentQueue
+
+
+def test_priority_lanes_and_cancel():
+    queue = AgentQueue()
+    assert [queue.enqueue(s) for s in ("a", "b", "c", "a")] == [1, 2, 3, 1]
+    assert queue.enqueue("vip", priority=VIP_PRIORITY) == 1
+    assert queue.position("a") == 2 and queue.enqueue("es", lane="es") == 1
+    assert queue.cancel("b") and not queue.cancel("b") and queue.position("b") == 0
+    assert queue.position("c") == 3 and queue.lengths() == {"default": 3, "es": 1}
+    assert queue.items() == ["vip", "a", "c", "es"] and queue.items(limit=2) == ["vip", "a"]
+    assert queue.dequeue(["es"]) == "es" and queue.dequeue(["es", "fr"]) is None
+    assert [queue.dequeue(), queue.dequeue(), queue.dequeue(), queue.dequeue()] == ["vip", "a", "c", None]
+    assert len(queue) == 0
+
+
+def test_matches_list_model_through_compaction():
+    rng = random.Random(7)
+    queue, model, next_id = AgentQueue(), [], 0
+    for _ in range(20000):
+        op = rng.random()
+        if op < 0.5 or not model:
+            sid = f"s{next_id}"
+            next_id += 1
+            model.append(sid)
+            assert queue.enqueue(sid) == len(model)
+        elif op < 0.7:
+            assert queue.dequeue() == model.pop(0)
+        elif op < 0.85:
+            sid = rng.choice(model)
+            model.remove(sid)
+            assert queue.cancel(sid)
+        else:
+            sid = rng.choice(model)
+            assert queue.position(sid) == model.index(sid) + 1
+    assert queue.items() == model
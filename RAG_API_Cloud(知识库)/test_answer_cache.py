@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the full-answer cache
+"""
+
+from answer_cache import AnswerCache, answer_key, chunk_ids
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_ttl_lru_and_sampled_skip():
+    clock = Clock()
+    cache = AnswerCache(ttl=60, max_entries=2, clock=clock)
+    ids = chunk_ids({"result_list": [{"point_id": "faq-0"}, {"point_id": "faq-1"}]})
+    assert ids == ["faq-0", "faq-1"]
+    assert answer_key("How long do refunds take?", ids, "m", 0) == answer_key("how long do refunds take", ids, "m", 0)
+
+    cache.put("How long do refunds take?", ids, "m", 0, "5 days")
+    assert cache.get("how long do refunds take", ids, "m", 0) == "5 days"
+    # Different chunks, model or temperature are different answers
+    assert cache.get("how long do refunds take", ["faq-1"], "m", 0) is None
+    assert cache.get("how long do refunds take", ids, "other", 0) is None
+    # Sampled answers are skipped unless allowed
+    assert not cache.put("q", ids, "m", 0.7, "a") and cache.get("q", ids, "m", 0.7) is None
+    assert cache.stats()["skipped_sampled"] == 1
+
+    cache.put("q2", ids, "m", 0, "a2")
+    cache.get("how long do refunds take", ids, "m", 0)
+    cache.put("q3", ids, "m", 0, "a3")
+    assert cache.get("q2", ids, "m", 0) is None and cache.evictions == 1
+
+    clock.now += 61
+    assert cache.get("q3", ids, "m", 0) is None and cache.expirations == 1
+
+
+def test_sqlite_survives_restart_and_purges(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    cache = AnswerCache(path, allow_sampled=True)
+    calls = []
+    generate = lambda: calls.append(1) or {"text": "5 days"}  # noqa: E731
+    assert cache.get_or_generate("refunds?", ["faq-0"], "m", 0.7, generate) == ({"text": "5 days"}, False)
+    cache.put("other question", ["faq-1"], "m", 0.7, "x")
+    cache.close()
+
+    cache = AnswerCache(path, allow_sampled=True)
+    assert cache.get_or_generate("Refunds", ["faq-0"], "m", 0.7, generate) == ({"text": "5 days"}, True)
+    assert len(calls) == 1
+    entries = cache.entries()
+    assert [e["query"] for e in entries] == ["refunds", "other question"] and entries[0]["hits"] == 1
+    assert cache.purge(query="REFUNDS!") == 1
+    assert cache.purge(key=entries[1]["key"]) == 1
+    assert len(cache) == 0
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the retrieval parameter sweep and its record / replay
+"""
+
+from kb_client import KnowledgeBaseClient
+from credentials import StaticCredentialProvider
+from bench_retrieval import (LiveSearch, RecordingSearch, ReplaySearch, load_queries, param_grid,
+                             rank_of_first_relevant, recall_at, sweep)
+from kb_stub_server import KnowledgeBaseStub
+
+
+def test_metrics():
+    results = [{"point_id": "a-0", "doc_info": {"doc_id": "a"}}, {"point_id": "b-1", "doc_info": {"doc_id": "b"}}]
+    assert rank_of_first_relevant(results, {"b-1"}) == 2
+    assert rank_of_first_relevant(results, {"c"}) is None
+    assert recall_at(results, {"a", "b-1"}, 1) == 0.5
+    assert recall_at(results, {"a", "b-1"}, 2) == 1.0
+
+
+def test_record_then_replay(tmp_path):
+    queries = load_queries("retrieval_queries_sample.jsonl")[:5]
+    grid = param_grid([5], [0.0, 1.0], [False, True], [0], [False])
+    stub = KnowledgeBaseStub({"AKTEST": "SKTEST"}).start_in_thread()
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                             collection="test", scheme="http", invalidation_dir=None)
+    recorder = RecordingSearch(LiveSearch(kb), str(tmp_path / "responses.jsonl"))
+    try:
+        live = sweep(recorder, queries, grid, (1, 3))
+    finally:
+        recorder.close()
+        kb.close()
+        stub.stop_thread()
+    assert len(live) == 4 and all(row["errors"] == 0 for row in live)
+    assert all(row["rerank_tokens"] > 0 for row in live if row["rerank_switch"])
+    assert sweep(ReplaySearch(str(tmp_path / "responses.jsonl")), queries, grid, (1, 3)) == live
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Offline tests for bulk, resumable ingestion against the knowledge-base stub
+"""
+
+import json
+
+import pytest
+
+from bulk_ingest import BulkIngestor, IngestJournal, RateLimiter, list_directory, read_manifest, retry_call
+from kb_client import DOC_ADD_PATH, DOC_DELETE_PATH, KnowledgeBaseClient, KnowledgeBaseError
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+
+
+@pytest.fixture
+def stub():
+    server = KnowledgeBaseStub({"AKTEST": "SKTEST"}, documents={}, processing_time=0.02,
+                               throttle_rps=50).start_in_thread()
+    yield server
+    server.stop_thread()
+
+
+def make_ingestor(stub, journal):
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                             collection="test", scheme="http", invalidation_dir=None)
+    return BulkIngestor(kb, journal, workers=8, rps=400, poll_rps=400, poll_interval=0.02, backoff=0.01,
+                        max_backoff=0.2, max_attempts=20, timeout=30)
+
+
+def test_manifest_and_directory(tmp_path):
+    (tmp_path / "docs.csv").write_text("url,doc_name\nhttps://x/a/report.pdf,Report\nhttps://x/b/report.pdf,\n")
+    docs = list(read_manifest(str(tmp_path / "docs.csv")))
+    assert [d["doc_name"] for d in docs] == ["Report", "report.pdf"] and docs[0]["doc_type"] == "pdf"
+    (tmp_path / "docs.jsonl").write_text(json.dumps({"url": "https://x/q.faq.xlsx", "doc_id": "faq"}) + "\n")
+    assert list(read_manifest(str(tmp_path / "docs.jsonl")))[0]["doc_type"] == "faq.xlsx"
+
+    (tmp_path / "pdfs" / "2024").mkdir(parents=True)
+    (tmp_path / "pdfs" / "2024" / "a b.pdf").write_bytes(b"%PDF")
+    (tmp_path / "pdfs" / "notes.bin").write_bytes(b"")
+    listed = list(list_directory(str(tmp_path / "pdfs"), "https://bucket/pdfs/"))
+    assert len(listed) == 1 and listed[0]["url"] == "https://bucket/pdfs/2024/a%20b.pdf"
+    assert listed[0]["doc_id"].startswith("2024_a_b_pdf_")
+
+
+def test_rate_limiter_spaces_calls():
+    now, waits = [0.0], []
+    limiter = RateLimiter(10, burst=2, clock=lambda: now[0], sleep=waits.append)
+    for _ in range(4):
+        limiter.acquire()
+    assert waits == pytest.approx([0.1, 0.2])
+
+
+def test_retry_call_backs_off_on_retryable_errors_only():
+    sleeps, retried = [], []
+    outcomes = [KnowledgeBaseError("p", 1, "busy", status=429), KnowledgeBaseError("p", 1, "down", status=503), "ok"]
+
+    def fn(attempt):
+        outcome = outcomes[attempt - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert retry_call(fn, 5, 0.1, 0.15, sleeps.append, on_retry=lambda a, e: retried.append(a)) == "ok"
+    assert sleeps == [0.1, 0.15] and retried == [1, 2]
+    with pytest.raises(KnowledgeBaseError):
+        retry_call(fn, 2, 0.1, 1, sleeps.append)  # the second attempt's error is the last one
+
+    def rejected(attempt):
+        raise KnowledgeBaseError("p", 1001001, "exists", status=200)
+
+    sleeps.clear()
+    with pytest.raises(KnowledgeBaseError):
+        retry_call(rejected, 5, 0.1, 1, sleeps.append)  # not retryable: raised at once
+    assert sleeps == []
+
+
+def test_ingest_resume_and_report(stub, tmp_path):
+    journal = IngestJournal(str(tmp_path / "journal.db"))
+    docs = [{"doc_id": f"doc{i}", "doc_name": f"Doc {i}", "doc_type": "txt", "url": f"https://x/doc{i}.txt",
+             "content": f"document number {i}"} for i in range(60)]
+    docs.append({"doc_id": "broken", "doc_name": "Broken", "doc_type": "pdf", "url": "https://x/fail.pdf"})
+    assert journal.load(docs) == 61 and journal.load(docs) == 0
+
+    report = make_ingestor(stub, journal).run()
+    assert report["done"] == 60 and report["failed"] == 1 and report["submitted"] == 0
+    assert report["throttled"] > 0 and report["retries"] >= report["throttled"]
+    assert report["failures"] == [{"doc_id": "broken", "stage": "process", "error": "10001 document could not be parsed"}]
+    assert report["collection_doc_num"] == 61
+    assert stub.signature_failures == 0
+
+    # A rerun submits nothing; --retry-failed deletes the failed document and submits it again
+    adds = stub.paths[DOC_ADD_PATH]
+    journal = IngestJournal(str(tmp_path / "journal.db"))
+    ingestor = make_ingestor(stub, journal)
+    assert ingestor.run()["submitted_this_run"] == 0 and stub.paths[DOC_ADD_PATH] == adds
+    ingestor.retry_failed()
+    assert ingestor.run()["submitted_this_run"] == 1
+    assert stub.paths[DOC_DELETE_PATH] == 1 and stub.paths[DOC_ADD_PATH] > adds
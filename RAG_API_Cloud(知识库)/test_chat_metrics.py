@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for the rolling-window chat metrics and their Prometheus text
+"""
+
+from chat_metrics import ChatMetrics, format_metric
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_window_rates_histogram_and_utilization():
+    clock = Clock()
+    metrics = ChatMetrics(window=60, slots=6, wait_buckets=(10, 60), clock=clock)
+    metrics.agents(busy=1, staffed=2)
+    for sender in ("user", "bot", "user"):
+        metrics.message(sender)
+    for wait in (4, 8, 30, 90):
+        metrics.handoff(wait)
+    clock.now += 30
+    snapshot = metrics.snapshot()
+    assert snapshot["messages"] == 3 and snapshot["messages_by_sender"] == {"user": 2, "bot": 1}
+    assert snapshot["messages_per_second"] == 0.1
+    assert snapshot["handoffs"] == 4 and snapshot["wait_seconds"]["histogram"] == {"10": 2, "60": 1, "+Inf": 1}
+    assert snapshot["wait_seconds"]["mean"] == 33.0 and snapshot["wait_seconds"]["p50"] == 10.0
+    assert snapshot["agent_utilization"] == 0.5
+
+    # The first 10 s slot has left the window (the counters since start keep it): of the 50 s
+    # left, 20 were half busy
+    metrics.agents(busy=2, staffed=2)
+    clock.now += 30
+    snapshot = metrics.snapshot()
+    assert snapshot["messages"] == 0 and snapshot["handoffs"] == 0 and snapshot["wait_seconds"]["p50"] is None
+    assert snapshot["window_seconds"] == 50 and snapshot["agent_utilization"] == 0.8
+    clock.now += 3600  # idle for longer than the window
+    assert metrics.snapshot()["agent_utilization"] == 1.0
+    text = metrics.prometheus()
+    assert 'chatbot_messages_total{sender_type="user"} 2\n' in text
+    assert 'chatbot_handoff_wait_seconds_bucket{le="60"} 3\n' in text
+    assert 'chatbot_handoff_wait_seconds_bucket{le="+Inf"} 4\n' in text
+    assert "chatbot_handoff_wait_seconds_sum 132.0\nchatbot_handoff_wait_seconds_count 4\n" in text
+    assert "# TYPE chatbot_agent_utilization gauge\nchatbot_agent_utilization 1.0\n" in text
+
+
+def test_format_metric_escapes_labels():
+    text = format_metric("x_total", "counter", "Things", [({"name": 'a "b"\n'}, 3), ({}, 1.5)])
+    assert text == '# HELP x_total Things\n# TYPE x_total counter\nx_total{name="a \\"b\\"\\n"} 3\nx_total 1.5\n'
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted, deduplicated prompt context
+"""
+
+from context_assembler import ContextAssembler, estimate_tokens, format_point
+
+FIREWALL = "The LLM firewall inspects prompts and responses to block prompt injection and data leakage."
+
+
+def point(content, score, doc_type="pdf", **extra):
+    return {"content": content, "score": score, "chunk_title": "Guide",
+            "doc_info": {"doc_name": "LLM Firewall Guide", "doc_type": doc_type}, **extra}
+
+
+def test_format_matches_generate_prompt():
+    faq = point("Within five business days.", 0.9, doc_type="faq.xlsx", original_question="How long do refunds take?",
+                table_chunk_fields=[{"field_name": "region", "field_value": "HK"}])
+    assert format_point(faq, ["region"]) == (
+        "doc_name: LLM Firewall Guide\nchunk_title: Guide\n"
+        "content: When a similar question is asked, refer to the corresponding answer: "
+        "Question: How long do refunds take?; Answer: Within five business days.\nregion: HK\n---\n")
+    assert estimate_tokens("firewall 防火墙") == 5
+
+
+def test_dedup_score_order_and_budget():
+    points = [
+        point("Firewall policies are configured per application with allow lists.", 0.5),
+        point(FIREWALL, 0.9),
+        point(FIREWALL + " It also logs every blocked request.", 0.8),  # near-duplicate, lower score
+        point("The firewall adds less than 10 ms of latency to each model call. " * 40, 0.7),  # too large
+    ]
+    assembler = ContextAssembler(token_budget=100)
+    result = assembler.assemble(points)
+    assert [p["score"] for p in result["points"]] == [0.9, 0.5]
+    assert result["context"].index(FIREWALL) < result["context"].index("allow lists")
+    report = result["report"]
+    assert report["duplicates_dropped"] == 1 and report["over_budget_dropped"] == 1
+    assert report["tokens_used"] <= 100
+    assert report["tokens_saved"] == report["tokens_total"] - report["tokens_used"] > 400
+    assert assembler.stats()["tokens_saved"] == report["tokens_saved"]
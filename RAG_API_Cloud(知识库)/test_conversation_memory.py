@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the multi-turn conversation memory
+"""
+
+from context_assembler import estimate_tokens
+from conversation_memory import ConversationMemory, ConversationStore
+
+
+def test_rewrite_only_with_history():
+    memory = ConversationMemory()
+    assert memory.search_options("what is the firewall") == {"rewrite": False}
+    assert memory.messages("system", "what is the firewall") == [
+        {"role": "system", "content": "system"}, {"role": "user", "content": "what is the firewall"}]
+    memory.add_turn("what is the firewall", "It blocks prompt injection.")
+    options = memory.search_options("how fast is it")
+    assert options["rewrite"] and options["messages"][-1] == {"role": "user", "content": "how fast is it"}
+
+
+def test_older_turns_are_summarized_and_size_stays_flat():
+    memory = ConversationMemory(max_turns=2, summary_tokens=60, max_request_tokens=400)
+    sizes = []
+    for i in range(30):
+        memory.add_turn(f"question number {i} about the firewall?", f"Answer {i}. " + "More detail here. " * 20)
+        sizes.append(memory.request_tokens("system prompt", "next question"))
+    assert len(memory.turns) == 2 and memory.summarized_turns == 28
+    assert "Q: question number 27" in memory.summary and "question number 0 " not in memory.summary
+    assert estimate_tokens(memory.summary) <= 60
+    assert max(sizes[5:]) - min(sizes[5:]) < 20 and max(sizes) <= 400
+
+    messages = memory.messages("system prompt", "next question")
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user", "assistant", "user"]
+    assert "Earlier in this conversation" in messages[0]["content"]
+    # A tighter cap drops the oldest verbatim turns first
+    memory.max_request_tokens = 200
+    assert len(memory.messages("system prompt", "next question")) == 4
+
+
+def test_store_evicts_least_recently_used():
+    store = ConversationStore(max_conversations=2, max_turns=3)
+    a = store.get("a")
+    store.get("b")
+    assert store.get("a") is a
+    store.get("c")
+    assert len(store) == 2 and store.drop("b") is None and store.get("a") is a
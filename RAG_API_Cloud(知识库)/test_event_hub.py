@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the SSE push channels: delivery, replay-buffer overflow, resume and fan-out
+"""
+
+import threading
+import time
+
+from event_hub import EventHub, format_sse, stream
+
+
+def test_publish_subscribe_overflow_and_memo():
+    hub = EventHub(buffer_size=3)
+    assert hub.publish("s", "message", {"n": 0}) == 0  # no subscribers: dropped
+    with hub.subscribe("s") as sub:
+        assert sub.next(0) == []
+        for n in range(2):
+            hub.publish("s", "message", {"n": n}, event_id=n + 1)
+        assert [(e.event_id, e.data["n"]) for e in sub.next(0)] == [(1, 0), (2, 1)]
+        for n in range(5):
+            hub.publish("s", "message", {"n": n})
+        assert sub.next(0) is None  # fell behind the buffer: reload from the store
+        hub.publish("s", "status", "ok")
+        assert [e.data for e in sub.next(1)] == ["ok"]
+
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        assert hub.memo("s", "stats", compute) == hub.memo("s", "stats", compute) == 1
+        hub.publish("s", "changed")
+        assert hub.memo("s", "stats", compute) == 2
+    assert hub.stats()["channels"] == 0 and hub.subscribers("s") == 0
+
+
+def test_stream_resumes_after_last_id_and_skips_repeats():
+    hub = EventHub()
+    messages = [{"seq": n, "text": f"m{n}"} for n in (1, 2, 3)]
+    status = {"status": "waiting_agent"}
+
+    def load(after):
+        return [("status", dict(status), None)] + [("message", m, m["seq"]) for m in messages if m["seq"] > after]
+
+    events = stream(hub, "session:a", load, last_id=1, heartbeat=0.05)
+    assert next(events).startswith("retry:")
+    assert next(events) == format_sse("status", status)
+    assert [next(events), next(events)] == [format_sse("message", m, m["seq"]) for m in messages[1:]]
+    assert hub.subscribers("session:a") == 1
+
+    # Already loaded: skipped; same status: skipped; new ones pushed as they come
+    hub.publish("session:a", "message", messages[2], event_id=3)
+    hub.publish("session:a", "status", {"status": "waiting_agent"})
+    hub.publish("session:a", "message", {"seq": 4, "text": "m4"}, event_id=4)
+    assert next(events) == format_sse("message", {"seq": 4, "text": "m4"}, 4)
+    assert next(events) == ": keep-alive\n\n"
+    events.close()
+    assert hub.subscribers("session:a") == 0
+
+
+def test_stream_polls_a_store_other_processes_write():
+    hub, messages = EventHub(), []
+    events = stream(hub, "session:b", lambda after: [("message", m, m["seq"]) for m in messages if m["seq"] > after],
+                    heartbeat=5, poll=0.05)
+    next(events)
+    messages.append({"seq": 1})  # written by another worker: nothing published here
+    assert next(events) == format_sse("message", {"seq": 1}, 1)
+    events.close()
+
+
+def test_fan_out_to_many_subscribers():
+    hub, count = EventHub(), 500
+    received, ready = [], threading.Barrier(count + 1)
+
+    def listen():
+        with hub.subscribe("agents") as sub:
+            ready.wait()
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                events = sub.next(1)
+                if events:
+                    received.append(events[0].data)
+                    return
+
+    threads = [threading.Thread(target=listen) for _ in range(count)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    assert hub.publish("agents", "changed", 7) == count
+    for t in threads:
+        t.join()
+    assert received == [7] * count
+    assert hub.stats()["delivered"] == count
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded conversation history store
+"""
+
+from history_store import BoundedHistoryStore, Turn
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_turn_cap_idle_ttl_and_clear():
+    clock = Clock()
+    store = BoundedHistoryStore(max_turns=2, idle_ttl=60, clock=clock)
+    for i in range(3):
+        store.append("a", Turn(f"q{i}", f"a{i}", timestamp=0.0))
+    assert [t.user for t in store.get("a")] == ["q1", "q2"]
+    assert store.get("a")[0].to_dict()["mode"] == "simple" and store.trimmed_turns == 1
+
+    clock.now = 30
+    store.append("b", Turn("q", "a"))
+    clock.now = 61
+    # "a" was last used at 0, "b" at 30
+    assert [t.user for t in store.get("b")] == ["q"]
+    assert "a" not in store and store.expired == 1
+
+    store.clear("b")
+    assert len(store) == 0 and store.bytes == 0
+
+
+def test_memory_budget_evicts_least_recently_used():
+    store = BoundedHistoryStore(max_turns=10, idle_ttl=1e9, memory_budget=20000)
+    for i in range(200):
+        store.append(f"s{i}", Turn("question " * 5, "answer " * 20))
+        store.get("s0")  # keep s0 recently used
+    assert store.bytes <= 20000 and store.evicted > 0
+    assert "s0" in store and "s199" in store and "s1" not in store
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Offline tests for KnowledgeBaseClient against the signature-verifying knowledge-base stub
+"""
+
+import pytest
+
+from kb_client import KnowledgeBaseClient, KnowledgeBaseError
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+
+
+@pytest.fixture
+def stub():
+    server = KnowledgeBaseStub({"AKTEST": "SKTEST"}).start_in_thread()
+    yield server
+    server.stop_thread()
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault("credentials", StaticCredentialProvider("AKTEST", "SKTEST"))
+    return KnowledgeBaseClient(account_id="acc", domain=stub.address, collection="test", scheme="http", **kwargs)
+
+
+def test_search_and_chat_share_one_connection(stub):
+    """Calls are signed correctly and reuse one keep-alive connection and one signing key"""
+    kb = make_client(stub)
+    for _ in range(3):
+        hits = kb.search_knowledge("what does the LLM firewall block", limit=2)["result_list"]
+        assert len(hits) == 2 and hits[0]["doc_info"]["doc_id"] == "llm_firewall"
+    answer = kb.chat_completions([{"role": "system", "content": hits[0]["content"]},
+                                  {"role": "user", "content": "what does the LLM firewall block"}])
+    assert answer["generated_answer"].startswith("According to the documents")
+
+    events = list(kb.chat_completions_stream([{"role": "user", "content": "refunds"}]))
+    assert events[-1]["end"] and "".join(e["generated_answer"] for e in events)
+
+    assert stub.signature_failures == 0
+    assert kb.connection_stats()[stub.address] == {"requests": 5, "connections": 1, "reused": 4}
+    assert kb.signer.key_cache.misses == 1
+
+
+def test_documents_and_collections(stub):
+    kb = make_client(stub)
+    kb.add_doc("notes", "Notes", "txt", url="https://example.com/notes.txt", content="alpha bravo charlie")
+    assert kb.collection_info()["doc_num"] == 4
+    assert "notes" in [d["doc_id"] for d in kb.list_files()["doc_list"]]
+    assert kb.list_collections()["collection_list"][0]["collection_name"] == "test"
+    assert kb.search_knowledge("bravo")["result_list"][0]["doc_info"]["doc_id"] == "notes"
+    kb.delete_doc("notes")
+    with pytest.raises(KnowledgeBaseError) as e:
+        kb.delete_doc("notes")
+    assert e.value.code == 1001002
+
+
+def test_bad_secret_and_session_token(stub):
+    """A wrong secret is rejected; STS credentials sign x-security-token"""
+    with pytest.raises(KnowledgeBaseError) as e:
+        make_client(stub, credentials=StaticCredentialProvider("AKTEST", "WRONG")).collection_info()
+    assert e.value.message == "SignatureDoesNotMatch"
+
+    kb = make_client(stub, credentials=StaticCredentialProvider("AKTEST", "SKTEST", "STS-TOKEN"))
+    assert kb.collection_info()["collection_name"] == "test"
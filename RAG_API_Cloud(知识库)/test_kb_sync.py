@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the incremental corpus -> collection sync
+"""
+
+import pytest
+
+from bulk_ingest import DOC_EXISTS
+from kb_client import DOC_ADD_PATH, DOC_DELETE_PATH, KnowledgeBaseClient, KnowledgeBaseError
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+from kb_sync import KnowledgeBaseSync, SyncState, directory_corpus, plan
+
+PREFIX = "https://bucket/docs/"
+
+
+@pytest.fixture
+def stub():
+    server = KnowledgeBaseStub({"AKTEST": "SKTEST"}, documents={
+        "manual_upload": {"doc_name": "Manual", "doc_type": "pdf", "chunks": ["uploaded by hand"]}}).start_in_thread()
+    yield server
+    server.stop_thread()
+
+
+def sync(stub, tmp_path, **kwargs):
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                             collection="test", scheme="http", invalidation_dir=None)
+    state = SyncState(str(tmp_path / "state.json"), "test")
+    return KnowledgeBaseSync(kb, state, rps=1000).run(directory_corpus(str(tmp_path / "docs"), PREFIX), **kwargs)
+
+
+def test_plan():
+    local = {"a": {"hash": "1"}, "b": {"hash": "2"}, "c": {"hash": "3"}}
+    synced = {"a": {"hash": "1"}, "b": {"hash": "old"}, "gone": {"hash": "4"}}
+    actions = plan(local, synced, ["a", "b", "gone", "foreign"])
+    assert actions == {"add": ["c"], "update": ["b"], "delete": ["gone"], "unchanged": ["a"]}
+    assert plan(local, synced, ["foreign"], delete_unmanaged=True)["delete"] == ["foreign"]
+    assert plan({"x": {"hash": "1"}}, {}, ["x"])["update"] == ["x"]
+    assert plan({"x": {"hash": "1"}}, {}, ["x"], adopt=True)["unchanged"] == ["x"]
+
+
+def test_only_changes_are_sent(stub, tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(50):
+        (docs / f"guide{i}.txt").write_text(f"guide number {i}")
+
+    first = sync(stub, tmp_path)
+    assert first["add"] == 50 and first["calls"] == 50 and first["failed"] == 0
+    assert sync(stub, tmp_path)["calls"] == 0
+
+    (docs / "guide1.txt").write_text("guide number 1, revised")
+    (docs / "guide2.txt").unlink()
+    (docs / "guide50.txt").write_text("a new guide")
+    adds, deletes = stub.paths[DOC_ADD_PATH], stub.paths.get(DOC_DELETE_PATH, 0)
+    report = sync(stub, tmp_path)
+    assert (report["add"], report["update"], report["delete"], report["unchanged"]) == (1, 1, 1, 48)
+    assert report["calls"] == report["delta_calls"] == 4 and report["full_reindex_calls"] == 101
+    assert stub.paths[DOC_ADD_PATH] - adds == 2 and stub.paths[DOC_DELETE_PATH] - deletes == 2
+
+    # The hand-uploaded document was never managed by the sync and is kept
+    assert "manual_upload" in stub.documents and len(stub.documents) == 51
+    assert sync(stub, tmp_path, dry_run=True, delete_unmanaged=True)["plan"]["delete"] == ["manual_upload"]
+    assert "manual_upload" in stub.documents
+
+
+class LaggingDeletes:
+    """doc/delete takes effect only after `lag` more doc/add calls"""
+
+    collection = "test"
+
+    def __init__(self, lag):
+        self.lag = lag
+        self.docs = {"d": "old"}
+        self.pending = None
+
+    def delete_doc(self, doc_id, collection=None):
+        self.pending = [doc_id, self.lag]
+
+    def add_doc(self, doc_id, doc_name, doc_type, url=None, collection=None, **extra):
+        if self.pending and self.pending[1] == 0:
+            self.docs.pop(self.pending[0], None)
+            self.pending = None
+        elif self.pending:
+            self.pending[1] -= 1
+        if doc_id in self.docs:
+            raise KnowledgeBaseError(DOC_ADD_PATH, DOC_EXISTS, "doc exists", status=200)
+        self.docs[doc_id] = url
+
+
+def test_update_is_not_recorded_while_the_old_document_remains(tmp_path):
+    doc = {"doc_id": "d", "doc_name": "d", "doc_type": "txt", "url": "new", "hash": "2"}
+    for lag, recorded in ((2, True), (10, False)):
+        state = SyncState(str(tmp_path / f"state{lag}.json"), "test")
+        state.record("d", {**doc, "hash": "1"})
+        kb = LaggingDeletes(lag)
+        syncer = KnowledgeBaseSync(kb, state, rps=1000, max_attempts=5, sleep=lambda s: None)
+        syncer._apply("update", "d", doc)
+        assert (state.docs["d"]["hash"] == "2") is recorded
+        assert (kb.docs["d"] == "new") is recorded and len(syncer.failures) == (not recorded)
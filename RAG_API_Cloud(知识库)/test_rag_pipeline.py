@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Offline tests for RAGPipeline against the knowledge-base stub
+"""
+
+import time
+
+import pytest
+
+from kb_client import KnowledgeBaseClient
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+from rag_pipeline import RAGPipeline, follow_up_queries
+from retrieval_cache import RetrievalCache
+
+PROMPT = "<context>\n{}\n</context>"
+
+
+@pytest.fixture
+def stub():
+    server = KnowledgeBaseStub({"AKTEST": "SKTEST"}).start_in_thread()
+    yield server
+    server.stop_thread()
+
+
+def make_pipeline(stub, cache=None):
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                             collection="test", scheme="http", cache=cache, invalidation_dir=None)
+    return RAGPipeline(kb, PROMPT, search_options={"limit": 3})
+
+
+def test_follow_up_queries():
+    result = {"result_list": [{"original_question": "How long do refunds take?"},
+                              {"original_question": "How do I request a refund?"}, {"content": "no question"},
+                              {"original_question": "how long do refunds take"}]}
+    history = ["where is the firewall guide", "How do I request a refund"]
+    # Only new questions: the asked ones (and repeats of a hit) would be searches already cached
+    assert follow_up_queries(history, result) == ["How long do refunds take?"]
+
+
+def test_answer_and_stream_use_the_retrieved_context(stub):
+    pipeline = make_pipeline(stub)
+    retrieval = pipeline.retrieve("How long do refunds take?")
+    assert pipeline.answer("How long do refunds take?", retrieval)["generated_answer"].startswith(
+        "According to the documents")
+    streamed = "".join(pipeline.stream("How long do refunds take?"))
+    assert "five business days" in streamed
+    assert stub.paths["/api/knowledge/collection/search_knowledge"] == 2
+    pipeline.close()
+
+
+def test_prefetch_warms_the_cache(stub):
+    pipeline = make_pipeline(stub, RetrievalCache(invalidation_dir=None))
+    retrieval = pipeline.retrieve("How do I request a refund?")
+    "".join(pipeline.stream("How do I request a refund?", retrieval))
+    pipeline.prefetch(["How do I request a refund?"], retrieval)
+    assert pipeline.prefetches >= 1
+    deadline = time.monotonic() + 5
+    while pipeline._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    searches = stub.paths["/api/knowledge/collection/search_knowledge"]
+    pipeline.retrieve("How do I reset my password?").result()
+    assert stub.paths["/api/knowledge/collection/search_knowledge"] == searches
+    assert pipeline.kb.cache.hits >= 1
+    pipeline.close()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for the search_knowledge result cache
+"""
+
+from kb_client import KnowledgeBaseClient
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+from retrieval_cache import RetrievalCache, ngram_embedding, normalize_query, notify_invalidation
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalized_key_ttl_and_lru():
+    clock = Clock()
+    cache = RetrievalCache(max_entries=2, ttl=10, invalidation_dir=None, clock=clock)
+    assert normalize_query("  How do I reset my PASSWORD?? ") == "how do i reset my password"
+
+    cache.put("How do I reset my password?", "test", 5, 0.5, {"result_list": ["a"]})
+    assert cache.get("how do i reset my password", "test", 5, 0.5) == {"result_list": ["a"]}
+    # limit, dense_weight, collection and other options are part of the key
+    assert cache.get("how do i reset my password", "test", 10, 0.5) is None
+    assert cache.get("how do i reset my password", "test", 5, 0.7) is None
+    assert cache.get("how do i reset my password", "other", 5, 0.5) is None
+    assert cache.get("how do i reset my password", "test", 5, 0.5, rerank_switch=True) is None
+
+    cache.put("q2", "test", 5, 0.5, {"n": 2})
+    cache.get("How do I reset my password?", "test", 5, 0.5)
+    cache.put("q3", "test", 5, 0.5, {"n": 3})
+    assert cache.get("q2", "test", 5, 0.5) is None
+    assert cache.evictions == 1
+
+    clock.now = 11
+    assert cache.get("q3", "test", 5, 0.5) is None
+    assert cache.expirations == 1
+
+
+def test_similarity_hit_path():
+    cache = RetrievalCache(embed=ngram_embedding, similarity_threshold=0.9, invalidation_dir=None)
+    cache.put("What does the LLM firewall block?", "test", 5, 0.5, {"result_list": ["firewall"]})
+    assert cache.get("what does the llm firewall block exactly", "test", 5, 0.5) == {"result_list": ["firewall"]}
+    assert cache.get("How do I reset my username?", "test", 5, 0.5) is None
+    assert cache.semantic_hits == 1
+
+
+def test_marker_file_invalidates_other_processes(tmp_path):
+    cache = RetrievalCache(invalidation_dir=str(tmp_path), check_interval=0)
+    cache.put("q", "test", 5, 0.5, {"n": 1})
+    cache.put("q", "other", 5, 0.5, {"n": 1})
+    assert cache.get("q", "test", 5, 0.5) is not None
+    notify_invalidation("test", str(tmp_path))
+    assert cache.get("q", "test", 5, 0.5) is None
+    assert cache.get("q", "other", 5, 0.5) is not None
+
+
+def test_client_serves_hits_and_invalidates_on_doc_changes(tmp_path):
+    stub = KnowledgeBaseStub({"AKTEST": "SKTEST"}).start_in_thread()
+    try:
+        kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                                 collection="test", scheme="http", invalidation_dir=str(tmp_path),
+                                 cache=RetrievalCache(invalidation_dir=str(tmp_path)))
+        first = kb.search_knowledge("How long do refunds take?")
+        assert kb.search_knowledge("how long do refunds take") is first
+        assert stub.paths["/api/knowledge/collection/search_knowledge"] == 1
+
+        kb.add_doc("refund_policy", "Refund policy", "txt", content="Refunds take five business days")
+        assert len(kb.cache) == 0
+        second = kb.search_knowledge("how long do refunds take")
+        assert "refund_policy" in [p["doc_info"]["doc_id"] for p in second["result_list"]]
+        stats = kb.cache.stats()
+        assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 2, 1)
+        assert stats["avg_miss_ms"] > stats["avg_hit_ms"]
+    finally:
+        stub.stop_thread()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Tests for the session / agent / queue backends, including several processes sharing SQLite
+"""
+
+import multiprocessing
+import random
+import sqlite3
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from history_store import Turn
+from session_backend import BackendHistoryStore, MemoryBackend, SQLiteBackend, open_backend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    store = MemoryBackend() if request.param == "memory" else SQLiteBackend(str(tmp_path / "sessions.db"))
+    yield store
+    store.close()
+
+
+def test_sessions_messages_agents_and_queue(backend):
+    record = backend.create_session("s1", {"session_id": "s1", "status": "bot"})
+    assert backend.create_session("s1", {"session_id": "s1", "status": "other"}) == record
+    record["status"] = "changed"  # copies, not the stored record
+    assert backend.get_session("s1")["status"] == "bot"
+    assert backend.modify_session("s1", lambda r: r.update(status="waiting_agent") or "done") == "done"
+    assert backend.modify_session("missing", lambda r: 1) is None
+    assert backend.update_session("s1", agent_id="a1") and backend.get_session("s1")["agent_id"] == "a1"
+
+    first = backend.append_message("s1", {"content": "hi"})
+    second = backend.append_message("s1", {"content": "there"})
+    assert second > first
+    assert [m["content"] for m in backend.messages("s1", after=first)] == ["there"]
+    backend.trim_messages("s1", 1)
+    assert [m["seq"] for m in backend.messages("s1")] == [second]
+
+    backend.put_agent("a1", {"name": "Ann", "current_sessions": []})
+    backend.modify_agent("a1", lambda a: a["current_sessions"].append("s1"))
+    assert backend.agents() == {"a1": {"name": "Ann", "current_sessions": ["s1"]}}
+
+    assert [backend.enqueue(s) for s in ("s1", "s2", "s3", "s1")] == [1, 2, 3, 1]
+    assert backend.remove_from_queue("s2") and not backend.remove_from_queue("s2")
+    assert backend.queue_position("s3") == 2 and backend.queue_position("s2") == 0
+    assert [backend.dequeue(), backend.dequeue(), backend.dequeue()] == ["s1", "s3", None]
+
+    # VIP first within a lane; an agent only takes from the lanes it serves
+    backend.enqueue("fr1", lane="fr")
+    backend.enqueue("vip", lane="fr", priority=10)
+    backend.enqueue("en1", lane="en")
+    assert backend.queue_position("fr1") == 2 and backend.queue_position("en1") == 1
+    assert backend.queue_lengths() == {"fr": 2, "en": 1} and backend.queued()[0] == "vip"
+    assert backend.dequeue(["en"]) == "en1" and backend.dequeue(["en"]) is None
+    assert [backend.dequeue(), backend.dequeue()] == ["vip", "fr1"]
+
+    backend.delete_session("s1")
+    assert backend.get_session("s1") is None and backend.messages("s1") == []
+
+
+def test_queue_lanes_match_a_list_model(backend):
+    rng = random.Random(3)
+    model = []  # (ticket, session_id, lane, priority) in arrival order
+    for ticket in range(1500):
+        op = rng.random()
+        if op < 0.45 or not model:
+            entry = (ticket, f"s{ticket}", rng.choice(["default", "default", "es"]), rng.choice([0, 0, 0, 10]))
+            model.append(entry)
+            backend.enqueue(*entry[1:])
+        elif op < 0.65:
+            lanes = rng.choice([None, ["es"], ["default", "es"]])
+            candidates = [e for e in model if lanes is None or e[2] in lanes]
+            expected = min(candidates, key=lambda e: (-e[3], e[0]))[1] if candidates else None
+            assert backend.dequeue(lanes) == expected
+            model = [e for e in model if e[1] != expected]
+        elif op < 0.8:
+            entry = rng.choice(model)
+            model.remove(entry)
+            assert backend.remove_from_queue(entry[1])
+        else:
+            _, sid, lane, priority = entry = rng.choice(model)
+            assert backend.queue_position(sid) == len([e for e in model if e[2] == lane and (
+                e[3] > priority or (e[3] == priority and e[0] <= entry[0]))])
+    assert backend.queue_length() == len(model)
+
+
+def test_status_counters_follow_every_write(backend):
+    for i in range(6):
+        backend.create_session(f"s{i}", {"session_id": f"s{i}", "status": "bot"})
+    backend.create_session("s0", {"session_id": "s0", "status": "ended"})  # exists: no change
+    backend.create_session("plain", {"session_id": "plain"})  # no status: counted as a session only
+    backend.update_session("s1", status="waiting_agent")
+    backend.update_session("s2", status="waiting_agent")
+    backend.modify_session("s2", lambda r: r.update(status="with_agent"))
+    backend.update_session("s3", status="ended")
+    with pytest.raises(ZeroDivisionError):
+        # SQLite rolls the change back, the memory backend keeps it; the counts follow the record
+        backend.modify_session("s3", lambda r: r.update(status="bot") or 1 / 0)
+    backend.delete_session("s4")
+    records = list(backend.sessions())
+    assert backend.status_counts() == Counter(r["status"] for r in records if "status" in r)
+    assert backend.status_counts()["waiting_agent"] == backend.status_counts()["with_agent"] == 1
+    assert backend.session_count() == len(records) == 6
+    assert sorted(backend.sessions_with_status("bot")) == sorted(r["session_id"] for r in records
+                                                                 if r.get("status") == "bot")
+    assert backend.sessions_with_status("waiting_agent") == ["s1"] and backend.sessions_with_status("x") == []
+    assert len(backend.sessions_with_status("bot", limit=2)) == 2
+
+    backend.put_agent("a1", {"status": "available"})
+    backend.put_agent("a2", {"status": "available"})
+    backend.update_agent("a1", status="busy")
+    backend.put_agent("a2", {"status": "busy"})  # replaced
+    assert backend.agent_status_counts() == {"busy": 2}
+
+    for content in ("hi", "there", "again"):
+        backend.append_message("s1", {"content": content})
+    assert [m["content"] for m in backend.recent_messages("s1", 2)] == ["there", "again"]
+    assert backend.recent_messages("s5", 1) == [] and backend.recent_messages("s1", 0) == []
+    for sid in ("q1", "q2", "q3"):
+        backend.enqueue(sid)
+    assert backend.queued(limit=2) == ["q1", "q2"]
+
+
+def test_sqlite_counts_a_file_from_before_the_counters(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    conn.execute("CREATE TABLE agents (agent_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    conn.executemany("INSERT INTO sessions VALUES (?, ?)",
+                     [("a", '{"status": "bot"}'), ("b", '{"status": "bot"}'), ("c", "{}")])
+    conn.execute("INSERT INTO agents VALUES ('x', '{\"status\": \"busy\"}')")
+    conn.commit()
+    conn.close()
+    backend = SQLiteBackend(path)
+    assert backend.status_counts() == {"bot": 2} and backend.session_count() == 3
+    assert backend.agent_status_counts() == {"busy": 1}
+    backend.update_session("a", status="ended")
+    assert SQLiteBackend(path).status_counts() == {"bot": 1, "ended": 1}  # counted once, then kept
+
+
+def _worker(path, worker, count):
+    store = open_backend(f"sqlite:///{path}")
+    for i in range(count):
+        store.enqueue(f"w{worker}-{i}")
+    popped = []
+    while True:
+        session_id = store.dequeue()
+        if session_id is None:
+            return popped
+        popped.append(session_id)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses fork")
+def test_queue_shared_between_processes(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteBackend(path).close()
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("fork")) as pool:
+        results = list(pool.map(_worker, [path] * 4, range(4), [50] * 4))
+    popped = [session_id for result in results for session_id in result]
+    # Every queued session is handed out exactly once
+    assert sorted(popped) == sorted(f"w{w}-{i}" for w in range(4) for i in range(50))
+
+
+def test_backend_history_store(tmp_path):
+    history = BackendHistoryStore(SQLiteBackend(str(tmp_path / "sessions.db")), max_turns=2)
+    for i in range(3):
+        history.append("s", Turn(f"q{i}", f"a{i}", mode="rag"))
+    assert [(t.user, t.mode) for t in history.get("s")] == [("q1", "rag"), ("q2", "rag")]
+    history.clear("s")
+    assert history.get("s") == [] and len(history) == 0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_idle_sessions_are_deleted(kind, tmp_path):
+    clock = Clock()
+    backend = MemoryBackend(clock) if kind == "memory" else SQLiteBackend(str(tmp_path / "sessions.db"), clock=clock)
+    history = BackendHistoryStore(backend, idle_ttl=60, sweep_interval=10, clock=clock)
+    history.append("a", Turn("q", "a"))
+    clock.now += 30
+    history.append("b", Turn("q", "a"))
+    backend.enqueue("a")
+    clock.now += 20
+    history.append("a", Turn("q2", "a2"))  # "a" active again, and a sweep is due: nothing idle yet
+    clock.now += 45
+    history.append("c", Turn("q", "a"))  # "b" idle for 65 s
+    assert "b" not in history and backend.messages("b") == [] and history.expired == 1
+    clock.now += 5
+    history.append("c", Turn("q", "a"))  # "a" idle for 50 s, and no sweep is due
+    clock.now += 30  # "a" idle for 80 s, "c" for 30 s
+    assert backend.delete_idle(60, limit=5) == 1 and backend.queue_length() == 0
+    assert list(history.backend.sessions()) == [{"session_id": "c"}] and backend.status_counts() == {}
+    assert history.stats()["sessions"] == 1
+
+
+def test_sqlite_dates_a_file_from_before_last_active(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, status TEXT)")
+    conn.execute("INSERT INTO sessions VALUES ('old', '{}', NULL)")
+    conn.commit()
+    conn.close()
+    clock = Clock()
+    backend = SQLiteBackend(path, clock=clock)
+    assert backend.delete_idle(60) == 0  # active as of the upgrade
+    clock.now += 60
+    assert backend.delete_idle(60) == 1 and backend.session_count() == 0
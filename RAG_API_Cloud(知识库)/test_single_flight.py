@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing of identical concurrent calls
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from kb_client import CHAT_PATH, SEARCH_PATH, KnowledgeBaseClient, KnowledgeBaseError
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+from single_flight import SingleFlight, SingleFlightTimeout
+
+
+def test_waiters_share_result_error_and_time_out():
+    flight = SingleFlight(timeout=5, timeouts={"slow": 0.05})
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return {"n": len(calls)}
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(flight.do, ("search", "q"), fetch) for _ in range(8)]
+        while flight.stats()["calls"]["search"]["requests"] < 8:
+            time.sleep(0.001)
+        release.set()
+        assert [f.result() for f in futures] == [{"n": 1}] * 8
+    assert len(calls) == 1
+    stats = flight.stats()["calls"]["search"]
+    assert (stats["upstream"], stats["coalesced"], stats["max_waiters"]) == (1, 7, 7)
+
+    def fail():
+        time.sleep(0.05)
+        raise ValueError("upstream down")
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flight.do, ("search", "bad"), fail) for _ in range(3)]
+        for f in futures:
+            with pytest.raises(ValueError):
+                f.result()
+    # The key is released after a failure, so the next call goes upstream again
+    assert flight.do(("search", "bad"), lambda: "ok") == "ok"
+
+    release.clear()
+    leader = threading.Thread(target=flight.do, args=(("slow", "q"), lambda: release.wait(2)))
+    leader.start()
+    while not flight.in_flight():
+        time.sleep(0.001)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do(("slow", "q"), fetch)
+    release.set()
+    leader.join()
+    assert flight.stats()["calls"]["slow"]["timeouts"] == 1
+
+
+def test_client_coalesces_searches_and_deterministic_completions():
+    stub = KnowledgeBaseStub({"AKTEST": "SKTEST"}, latency=0.1).start_in_thread()
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                             collection="test", scheme="http", invalidation_dir=None,
+                             single_flight=SingleFlight(timeout=5))
+    messages = [{"role": "user", "content": "How long do refunds take?"}]
+    try:
+        with ThreadPoolExecutor(10) as pool:
+            results = list(pool.map(lambda _: kb.search_knowledge("how long do refunds take", limit=3), range(10)))
+            answers = list(pool.map(lambda _: kb.chat_completions(messages, temperature=0), range(10)))
+            list(pool.map(lambda _: kb.chat_completions(messages, temperature=0.7), range(4)))
+    finally:
+        kb.close()
+        stub.stop_thread()
+    assert all(r == results[0] for r in results) and len(set(a["generated_answer"] for a in answers)) == 1
+    # Bursts may straddle two flights; sampled completions always go upstream
+    assert stub.paths[SEARCH_PATH] <= 2
+    assert 4 < stub.paths[CHAT_PATH] <= 6
+    assert kb.single_flight.stats()["calls"]["search_knowledge"]["coalesced"] >= 8
+
+
+def test_timeout_surfaces_as_knowledge_base_error():
+    stub = KnowledgeBaseStub({"AKTEST": "SKTEST"}, latency=0.3).start_in_thread()
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                             collection="test", scheme="http", invalidation_dir=None,
+                             single_flight=SingleFlight(timeout=0.05))
+    try:
+        with ThreadPoolExecutor(2) as pool:
+            first = pool.submit(kb.search_knowledge, "refunds")
+            time.sleep(0.05)
+            with pytest.raises(KnowledgeBaseError) as error:
+                kb.search_knowledge("refunds")
+            assert error.value.retryable
+            first.result()
+    finally:
+        kb.close()
+        stub.stop_thread()
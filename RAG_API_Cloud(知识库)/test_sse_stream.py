@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental SSE decoder and the streamed chat/completions deltas
+"""
+
+import json
+
+import pytest
+
+from kb_client import KnowledgeBaseClient, KnowledgeBaseError
+from credentials import StaticCredentialProvider
+from kb_stub_server import KnowledgeBaseStub
+from sse_stream import SSEDecoder, coalesce, extract_delta, openai_frame
+
+
+def event(answer, end=False, code=0):
+    return {"code": code, "message": "success", "data": {"generated_answer": answer, "end": end}}
+
+
+def test_decoder_handles_any_chunking():
+    answers = ["Hello ", 'say "hi"\\ ', "防火墙 ", "done"]
+    stream = b"".join(b"data:" + json.dumps(event(a, i == 3), ensure_ascii=i % 2 == 0).encode("utf-8") + b"\n\n"
+                      for i, a in enumerate(answers))
+    stream = stream.replace(b"\n\n", b"\r\n\r\n", 1) + b": keep-alive comment\n\n"
+    for size in (1, 3, 7, 64, len(stream)):
+        decoder = SSEDecoder()
+        payloads = []
+        for i in range(0, len(stream), size):
+            payloads.extend(decoder.feed(stream[i:i + size]))
+        payloads.extend(decoder.close())
+        extracted = [extract_delta(p) for p in payloads]
+        assert [a for a, _, _ in extracted] == answers
+        assert [e for _, e, _ in extracted] == [False, False, False, True]
+        assert all(full is None for _, _, full in extracted)
+
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: line one\ndata: line two\n\ndata: tail") == [b"line one\nline two"]
+    assert decoder.close() == [b"tail"]
+
+
+def test_unusual_events_are_fully_parsed():
+    answer, end, full = extract_delta(json.dumps({"code": 1000010, "message": "boom"}).encode())
+    assert (answer, end, full["code"]) == (None, False, 1000010)
+    answer, end, full = extract_delta(json.dumps({"data": {"end": True, "generated_answer": "x"}, "code": 0}).encode())
+    assert (answer, end) == ("x", True) and full is not None
+    # A final event without an answer must not pick up the next string in the payload
+    for payload in (b'{"code":0,"data":{"generated_answer":null,"end":true}}',
+                    b'{"code": 0, "data": {"generated_answer": 7, "end": "true"}}'):
+        answer, end, full = extract_delta(payload)
+        assert (answer, end) == (None, True) and full is not None
+    assert extract_delta(b'{"code":0,"data":{"generated_answer": "ok","end":false}}')[:2] == ("ok", False)
+    with pytest.raises(ValueError):
+        extract_delta(b"<html>502 Bad Gateway</html>")
+
+
+def test_coalesce_and_frame():
+    now = [0.0]
+    deltas = []
+
+    def produce():
+        for t, delta in [(0.0, "a"), (0.005, "b"), (0.01, "c"), (0.03, "d"), (0.031, "e")]:
+            now[0] = t
+            yield delta
+
+    deltas = list(coalesce(produce(), 0.02, clock=lambda: now[0]))
+    assert deltas == ["a", "bcd", "e"]
+    assert list(coalesce(iter(["a", "b"]), 0)) == ["a", "b"]
+    formatted = {"choices": [{"delta": {"content": 'q "é"'}}]}
+    assert openai_frame('q "é"') == f"data: {json.dumps(formatted)}\n\n".encode("utf-8")
+
+
+class FakeStream:
+    status_code = 200
+    headers = {"Content-Type": "text/event-stream"}
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size=None):
+        return iter([self.body[:10], self.body[10:]])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def stub():
+    server = KnowledgeBaseStub({"AKTEST": "SKTEST"}).start_in_thread()
+    yield server
+    server.stop_thread()
+
+
+def test_chat_completions_deltas(stub):
+    kb = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "SKTEST"), domain=stub.address,
+                             collection="test", scheme="http", invalidation_dir=None)
+    context = "Refunds are processed within five business days after approval."
+    messages = [{"role": "system", "content": context}, {"role": "user", "content": "How long do refunds take?"}]
+    assert "".join(kb.chat_completions_deltas(messages)) == f"According to the documents: {context}"
+
+    # A line that is not JSON is logged and skipped; the stream goes on to its end event
+    raw = (b"data: " + json.dumps(event("a")).encode() + b"\n\ndata: not json\n\n"
+           + b"data: " + json.dumps(event("b")).encode() + b"\n\n"
+           + b'data: {"code":0,"data":{"generated_answer":null,"end":true}}\n\n'
+           + b"data: " + json.dumps(event("after end")).encode() + b"\n\n")
+    kb.request = lambda *args, **kwargs: FakeStream(raw)
+    assert list(kb.chat_completions_deltas(messages)) == ["a", "b"]
+
+    # A last event without the trailing blank line still delivers its answer
+    raw = b"data: " + json.dumps(event("a")).encode() + b"\n\ndata: " + json.dumps(event("b", end=True)).encode()
+    kb.request = lambda *args, **kwargs: FakeStream(raw)
+    assert list(kb.chat_completions_deltas(messages)) == ["a", "b"]
+
+    bad = KnowledgeBaseClient(credentials=StaticCredentialProvider("AKTEST", "wrong"), domain=stub.address,
+                              scheme="http", invalidation_dir=None)
+    with pytest.raises(KnowledgeBaseError) as e:
+        list(bad.chat_completions_deltas(messages))
+    assert e.value.code == 1000001
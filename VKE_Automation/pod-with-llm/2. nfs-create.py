@@ -16,16 +16,22 @@ ContentType = "application/json; charset=utf-8"
 AK = "yourak"
 SK = "yoursk"
 
+# Reuse one Session so TCP+TLS connections are kept alive across calls
+session = requests.Session()
+# (connect timeout, read timeout) in seconds
+Timeout = (3.05, 30)
+
 # === UTILITIES ===
 def norm_query(params):
-    query = ""
+    pairs = []
     for key in sorted(params.keys()):
         if isinstance(params[key], list):
             for k in params[key]:
-                query += quote(key, safe="-_.~") + "=" + quote(k, safe="-_.~") + "&"
+                pairs.append(quote(key, safe="-_.~") + "=" + quote(k, safe="-_.~"))
         else:
-            query += quote(key, safe="-_.~") + "=" + quote(str(params[key]), safe="-_.~") + "&"
-    return query[:-1].replace("+", "%20")
+            pairs.append(quote(key, safe="-_.~") + "=" + quote(str(params[key]), safe="-_.~"))
+    # Single join instead of repeated concatenation; quote() never emits "+"
+    return "&".join(pairs)
 
 def hmac_sha256(key: bytes, content: str):
     return hmac.new(key, content.encode("utf-8"), hashlib.sha256).digest()
@@ -96,12 +102,13 @@ def request(method, date, query, header, ak, sk, action, body):
     full_header = {**header, **auth_header}
 
     url = f"https://{request_param['host']}{request_param['path']}"
-    response = requests.request(
+    response = session.request(
         method=method,
         url=url,
         headers=full_header,
         params=request_param["query"],
-        data=request_param["body"]
+        data=request_param["body"],
+        timeout=Timeout
     )
     return response.json()
 
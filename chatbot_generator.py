@@ -5,6 +5,7 @@ Creates a modern, feature-rich chatbot with multiple AI provider support
 """
 
 import os
+import sys
 import json
 from flask import Flask, request, render_template, jsonify, session
 import requests
@@ -13,15 +14,35 @@ import uuid
 import logging
 from typing import Dict, List, Optional
 
+# Shared with the RAG scripts (history_store.py, session_backend.py)
+_RAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RAG_API_Cloud(知识库)")
+if _RAG_DIR not in sys.path:
+    sys.path.insert(0, _RAG_DIR)
+
+from history_store import BoundedHistoryStore, HistoryStore, Turn
+from session_backend import BackendHistoryStore, open_backend
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ChatbotGenerator:
-    def __init__(self):
+    def __init__(self, history_store: Optional[HistoryStore] = None):
         self.app = Flask(__name__)
-        self.app.secret_key = str(uuid.uuid4())
-        self.conversation_history = {}
+        # Every worker must sign the session cookie with the same key, or a customer whose next
+        # request lands on another worker gets a new session
+        self.app.secret_key = os.environ.get('CHATBOT_SECRET_KEY') or str(uuid.uuid4())
+        if history_store is None:
+            if os.environ.get('CHAT_SESSION_STORE'):
+                # Shared between workers, e.g. CHAT_SESSION_STORE=sqlite:///var/lib/chatbot/sessions.db;
+                # last 50 turns per session, sessions idle for 2 hours deleted
+                history_store = BackendHistoryStore(open_backend(os.environ['CHAT_SESSION_STORE']), max_turns=50,
+                                                    idle_ttl=2 * 3600)
+            else:
+                # Last 50 turns per session, sessions idle for 2 hours dropped, least recently used
+                # sessions evicted beyond 256 MB of history (see history_store.py)
+                history_store = BoundedHistoryStore(max_turns=50, idle_ttl=2 * 3600, memory_budget=256 << 20)
+        self.conversation_history = history_store
         self.setup_routes()
         
     def setup_routes(self):
@@ -45,25 +66,11 @@ class ChatbotGenerator:
                 session_id = session.get('session_id', str(uuid.uuid4()))
                 session['session_id'] = session_id
                 
-                # Initialize conversation history for new sessions
-                if session_id not in self.conversation_history:
-                    self.conversation_history[session_id] = []
-                    
                 # Process message based on mode
-                if chat_mode == 'rag':
-                    response = self.handle_rag_chat(user_message, session_id)
-                elif chat_mode == 'voice':
-                    response = self.handle_voice_chat(user_message, session_id)
-                else:
-                    response = self.handle_simple_chat(user_message, session_id)
+                response = self.generate_response(user_message, chat_mode, session_id)
                     
                 # Store conversation
-                self.conversation_history[session_id].append({
-                    'user': user_message,
-                    'assistant': response,
-                    'timestamp': datetime.now().isoformat(),
-                    'mode': chat_mode
-                })
+                self.conversation_history.append(session_id, Turn(user_message, response, mode=chat_mode))
                 
                 return jsonify({
                     'response': response,
@@ -78,16 +85,24 @@ class ChatbotGenerator:
         @self.app.route('/api/history/<session_id>')
         def get_history(session_id):
             """Get conversation history for a session"""
-            history = self.conversation_history.get(session_id, [])
-            return jsonify({'history': history})
+            history = self.conversation_history.get(session_id)
+            return jsonify({'history': [turn.to_dict() for turn in history]})
             
         @self.app.route('/api/clear', methods=['POST'])
         def clear_history():
             """Clear conversation history"""
             session_id = session.get('session_id')
-            if session_id and session_id in self.conversation_history:
-                self.conversation_history[session_id] = []
+            if session_id:
+                self.conversation_history.clear(session_id)
             return jsonify({'status': 'cleared'})
+
+    def generate_response(self, message: str, mode: str, session_id: str) -> str:
+        """Response from the mode's handler"""
+        if mode == 'rag':
+            return self.handle_rag_chat(message, session_id)
+        elif mode == 'voice':
+            return self.handle_voice_chat(message, session_id)
+        return self.handle_simple_chat(message, session_id)
             
     def handle_simple_chat(self, message: str, session_id: str) -> str:
         """Handle simple chat without external APIs"""